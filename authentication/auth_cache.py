@@ -0,0 +1,36 @@
+import time
+
+from django.core.cache import cache
+
+# Пользователь вместе с его правами кэшируется по id. Запись кэша помечена
+# версиями, прочитанными до выборки из базы: общей (группы и права) и версией
+# пользователя. Изменение увеличивает версию, и старая запись перестает
+# подходить, даже если ее успели положить в кэш уже после изменения
+USER_TIMEOUT = 15 * 60
+AUTH_VERSION = "auth:version"
+
+
+def user_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def user_version_key(user_id):
+    return f"auth:user:{user_id}:version"
+
+
+def bump(key):
+    # Версия, вытесненная из кэша, начинается заново с текущего времени,
+    # а не с нуля, чтобы не совпасть со старой записью
+    if not cache.add(key, time.time_ns(), timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def forget_user(user_id):
+    bump(user_version_key(user_id))
+
+
+def forget_all_users():
+    bump(AUTH_VERSION)
@@ -0,0 +1,82 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from authentication.storage import avatar_storage
+
+# Размеры миниатюр (px) и форматы, в которых они хранятся
+AVATAR_SIZES = (40, 96, 256)
+AVATAR_FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+
+
+def thumbnail_name(photo_name, size, ext):
+    # Миниатюры лежат рядом с оригиналом: users/ab/cd/<hash>_40.webp
+    stem, _ = os.path.splitext(photo_name)
+    return f"{stem}_{size}.{ext}"
+
+
+def pick_size(css_size):
+    # Наименьшая миниатюра, которая не меньше нужного размера
+    for size in AVATAR_SIZES:
+        if size >= css_size:
+            return size
+    return AVATAR_SIZES[-1]
+
+
+def encode(image, fmt, **options):
+    buffer = BytesIO()
+    image.save(buffer, fmt, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def clean_photo(file):
+    # Декодируем загруженный файл один раз: применяем ориентацию из EXIF
+    # и перекодируем в JPEG без метаданных. Возвращает (файл, изображение)
+    file.seek(0)
+    image = ImageOps.exif_transpose(Image.open(file)).convert("RGB")
+    content = encode(image, "JPEG", quality=90)
+    content.name = "avatar.jpg"
+    return content, image
+
+
+def write_thumbnails(photo_name, image, storage=None):
+    storage = storage or avatar_storage()
+    for size in AVATAR_SIZES:
+        thumb = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        for ext, fmt in AVATAR_FORMATS.items():
+            storage.save_derived(thumbnail_name(photo_name, size, ext), encode(thumb, fmt, quality=85))
+
+
+def process_avatar(photo_name, storage=None):
+    # Для уже загруженных файлов: очищает фото, сохраняет его по хэшу содержимого
+    # и строит миниатюры. Возвращает новое имя файла
+    storage = storage or avatar_storage()
+    with storage.open(photo_name, "rb") as f:
+        content, image = clean_photo(f)
+    name = storage.save(photo_name, content)
+    write_thumbnails(name, image, storage)
+    return name
+
+
+def avatar_files(photo_name):
+    # Все файлы, относящиеся к фото: оригинал и миниатюры
+    return [photo_name] + [
+        thumbnail_name(photo_name, size, ext) for size in AVATAR_SIZES for ext in AVATAR_FORMATS
+    ]
+
+
+def delete_avatar(photo_name, storage=None):
+    storage = storage or avatar_storage()
+    for name in avatar_files(photo_name):
+        if storage.exists(name):
+            storage.delete(name)
+
+
+def photo_flags(photo_name, storage=None):
+    # Фактическое состояние файлов в хранилище: (есть фото, есть все миниатюры)
+    storage = storage or avatar_storage()
+    if not photo_name or not storage.exists(photo_name):
+        return False, False
+    return True, all(storage.exists(name) for name in avatar_files(photo_name)[1:])
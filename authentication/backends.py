@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from authentication.auth_cache import AUTH_VERSION, USER_TIMEOUT, user_key, user_version_key
+
+
+class CachedModelBackend(ModelBackend):
+    # ModelBackend, который на каждый запрос достает пользователя из кэша одним
+    # get_many. Права загружаются при первой проверке и кладутся в кэш вместе с
+    # пользователем, поэтому дальше has_perm тоже обходится без запросов.
+    # Кэширует только при общем для процессов кэше (settings.AUTH_CACHE)
+    def get_user(self, user_id):
+        if not settings.AUTH_CACHE:
+            return super().get_user(user_id)
+        keys = [AUTH_VERSION, user_version_key(user_id), user_key(user_id)]
+        values = cache.get_many(keys)
+        versions = (values.get(keys[0]), values.get(keys[1]))
+        entry = values.get(keys[2])
+        if entry is not None and None not in versions and entry[0] == versions:
+            return entry[1]
+
+        # Промах: версии фиксируются до выборки из базы
+        for key, version in zip(keys, versions):
+            if version is None:
+                cache.add(key, time.time_ns(), timeout=None)
+        versions = tuple(cache.get_many(keys[:2]).get(key) for key in keys[:2])
+        user = super().get_user(user_id)
+        if user is not None:
+            user._auth_versions = versions
+            cache.set(keys[2], (versions, user), USER_TIMEOUT)
+        return user
+
+    def get_all_permissions(self, user_obj, obj=None):
+        loaded = hasattr(user_obj, "_perm_cache")
+        perms = super().get_all_permissions(user_obj, obj)
+        # ModelBackend запоминает права в атрибутах пользователя - обновляем запись
+        # кэша с ними. Версии остаются от загрузки: если пользователя успели
+        # изменить, запись все равно не подойдет
+        versions = getattr(user_obj, "_auth_versions", None)
+        if settings.AUTH_CACHE and not loaded and hasattr(user_obj, "_perm_cache") and versions is not None:
+            cache.set(user_key(user_obj.pk), (versions, user_obj), USER_TIMEOUT)
+        return perms
@@ -1,11 +1,37 @@
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.contrib.auth.views import redirect_to_login
 from django.core.exceptions import PermissionDenied
 
 
 def role_required(allowed_roles=[]):
     def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            async def _wrapped_view(request, *args, **kwargs):
+                user = await request.auser()
+                if user.role not in allowed_roles:
+                    raise PermissionDenied("У вас нет прав для этого действия.")
+                return await view_func(request, *args, **kwargs)
+            return markcoroutinefunction(wraps(view_func)(_wrapped_view))
+
         def _wrapped_view(request, *args, **kwargs):
             if request.user.role not in allowed_roles:
                 raise PermissionDenied("У вас нет прав для этого действия.")
             return view_func(request, *args, **kwargs)
         return _wrapped_view
     return decorator
+
+
+def alogin_required(view_func):
+    # login_required для async-представлений (в Django 5.0 он только синхронный).
+    # Пользователь загружается через request.auser() и подменяет ленивый
+    # request.user, чтобы шаблоны и контекст-процессоры не лезли в базу синхронно
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        user = await request.auser()
+        request.user = user
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+    return markcoroutinefunction(_wrapped_view)
@@ -0,0 +1,55 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from authentication.avatars import avatar_files
+from authentication.storage import avatar_storage
+
+
+def walk(storage, path):
+    dirs, files = storage.listdir(path)
+    for name in files:
+        yield f"{path}/{name}"
+    for d in dirs:
+        yield from walk(storage, f"{path}/{d}")
+
+
+class Command(BaseCommand):
+    help = "Удаляет файлы фото и миниатюр, на которые не ссылается ни один пользователь"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=60,
+            help="Не трогать файлы моложе N минут (загрузка могла еще не сохраниться в базе)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать, что будет удалено",
+        )
+
+    def handle(self, *args, **options):
+        storage = avatar_storage()
+        if not storage.exists(storage.prefix):
+            return
+
+        referenced = set()
+        for name in get_user_model().objects.exclude(photo="").values_list("photo", flat=True).iterator():
+            if name:
+                referenced.update(avatar_files(name))
+
+        threshold = timezone.now() - datetime.timedelta(minutes=options["min_age"])
+        removed = 0
+        for name in walk(storage, storage.prefix):
+            if name in referenced or storage.get_modified_time(name) > threshold:
+                continue
+            self.stdout.write(name)
+            if not options["dry_run"]:
+                storage.delete(name)
+            removed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Неиспользуемых файлов: {removed}"))
@@ -0,0 +1,62 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from authentication.auth_cache import forget_all_users
+from authentication.avatars import process_avatar
+
+
+def process(name):
+    # Выполняется в дочернем процессе
+    try:
+        return name, process_avatar(name), None
+    except OSError as e:
+        return name, None, str(e)
+
+
+class Command(BaseCommand):
+    help = (
+        "Строит миниатюры для уже загруженных фото пользователей (media/users) и переносит "
+        "их в хранилище с именами по хэшу содержимого; старые файлы удалит collect_avatars"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Количество процессов",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Перестроить миниатюры и для пользователей, у которых они уже есть",
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        users = User.objects.exclude(photo="").exclude(photo__isnull=True)
+        if not options["all"]:
+            users = users.filter(has_thumbnails=False)
+        photos = set(users.values_list("photo", flat=True))
+        if not photos:
+            self.stdout.write("Нет фото для обработки")
+            return
+
+        done = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            futures = [pool.submit(process, name) for name in photos]
+            for future in as_completed(futures):
+                old_name, new_name, error = future.result()
+                if error:
+                    self.stderr.write(f"{old_name}: {error}")
+                    continue
+                User.objects.filter(photo=old_name).update(photo=new_name, has_photo=True, has_thumbnails=True)
+                done += 1
+
+        if done:
+            # update() идет мимо сигналов: фото в кэше пользователей устарели
+            forget_all_users()
+        self.stdout.write(self.style.SUCCESS(f"Обработано фото: {done} из {len(photos)}"))
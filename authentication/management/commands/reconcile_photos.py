@@ -0,0 +1,41 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from authentication.auth_cache import forget_all_users
+from authentication.avatars import photo_flags
+
+
+class Command(BaseCommand):
+    help = "Сверяет флаги has_photo/has_thumbnails пользователей с файлами в хранилище и исправляет расхождения"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Повторять сверку каждые N секунд, не завершая процесс",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            self.reconcile()
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
+
+    def reconcile(self):
+        User = get_user_model()
+        fixed = 0
+        users = User.objects.only("pk", "photo", "has_photo", "has_thumbnails")
+        for user in users.iterator(chunk_size=500):
+            flags = photo_flags(user.photo.name if user.photo else None)
+            if flags != (user.has_photo, user.has_thumbnails):
+                self.stdout.write(f"{user.pk} {user.photo.name or '-'}: {(user.has_photo, user.has_thumbnails)} -> {flags}")
+                User.objects.filter(pk=user.pk).update(has_photo=flags[0], has_thumbnails=flags[1])
+                fixed += 1
+        if fixed:
+            # update() идет мимо сигналов: флаги в кэше пользователей устарели
+            forget_all_users()
+        self.stdout.write(self.style.SUCCESS(f"Исправлено расхождений: {fixed}"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0006_alter_user_first_name_alter_user_last_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='has_thumbnails',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Есть миниатюры'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:14
+
+from django.db import migrations, models
+
+
+def fill_has_photo(apps, schema_editor):
+    from authentication.avatars import photo_flags
+
+    User = apps.get_model("authentication", "User")
+    for user in User.objects.exclude(photo="").exclude(photo__isnull=True):
+        user.has_photo, user.has_thumbnails = photo_flags(user.photo.name)
+        user.save(update_fields=["has_photo", "has_thumbnails"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0007_user_has_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='has_photo',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Фото загружено'),
+        ),
+        migrations.RunPython(fill_has_photo, migrations.RunPython.noop),
+    ]
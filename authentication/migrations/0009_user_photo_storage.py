@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:15
+
+import authentication.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0008_user_has_photo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, storage=authentication.storage.avatar_storage, upload_to='', verbose_name='Фото'),
+        ),
+    ]
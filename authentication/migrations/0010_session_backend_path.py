@@ -0,0 +1,35 @@
+from django.db import migrations
+
+MODEL_BACKEND = "django.contrib.auth.backends.ModelBackend"
+CACHED_BACKEND = "authentication.backends.CachedModelBackend"
+
+
+def switch_backend(old, new):
+    # В сессии записан путь backend, через который пользователь вошел. Django
+    # пускает по сессии, только если этот backend есть в AUTHENTICATION_BACKENDS,
+    # поэтому путь меняется в уже существующих сессиях - иначе все выйдут из системы
+    def run(apps, schema_editor):
+        from django.contrib.auth import BACKEND_SESSION_KEY
+        from django.contrib.sessions.backends.db import SessionStore
+
+        Session = apps.get_model("sessions", "Session")
+        sessions = Session.objects.using(schema_editor.connection.alias)
+        store = SessionStore()
+        for key, session_data in sessions.values_list("session_key", "session_data").iterator():
+            data = store.decode(session_data)
+            if data.get(BACKEND_SESSION_KEY) == old:
+                data[BACKEND_SESSION_KEY] = new
+                sessions.filter(session_key=key).update(session_data=store.encode(data))
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0009_user_photo_storage'),
+        ('sessions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(switch_backend(MODEL_BACKEND, CACHED_BACKEND), switch_backend(CACHED_BACKEND, MODEL_BACKEND)),
+    ]
@@ -1,8 +1,9 @@
-import os
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 
-from core import settings
+from authentication.avatars import clean_photo, delete_avatar, photo_flags, write_thumbnails
+from authentication.auth_cache import forget_user
+from authentication.storage import avatar_storage
 
 # Модель пользователя
 class User(AbstractUser):
@@ -21,38 +22,53 @@ class User(AbstractUser):
     last_name = models.CharField("Фамилия", max_length=150, blank=True)
     
     email = models.EmailField(unique=True)
-    photo = models.ImageField("Фото", null=True, blank=True)
+    photo = models.ImageField("Фото", null=True, blank=True, storage=avatar_storage)
+    # Файл фото есть в хранилище; обновляется при записи и удалении файла
+    # и командой reconcile_photos, чтобы страницы не обращались к диску
+    has_photo = models.BooleanField("Фото загружено", default=False, editable=False)
+    # Миниатюры фото построены (см. authentication/avatars.py)
+    has_thumbnails = models.BooleanField("Есть миниатюры", default=False, editable=False)
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
     
     def photo_exists(self):
-        if self.photo:
-            return os.path.isfile(os.path.join(settings.MEDIA_ROOT, self.photo.name))
-        return False
+        return bool(self.photo) and self.has_photo
 
     def delete_old_photo(self):
         if self.photo:
-            old_photo_path = os.path.join(settings.MEDIA_ROOT, self.photo.name)
-            if os.path.isfile(old_photo_path):
-                os.remove(old_photo_path)
+            self.release_photo(self.photo.name)
+            self.has_photo = self.has_thumbnails = False
+            if self.pk:
+                User.objects.filter(pk=self.pk).update(has_photo=False, has_thumbnails=False)
+                # update() идет мимо сигналов, а пользователь лежит в кэше
+                forget_user(self.pk)
+
+    def release_photo(self, name):
+        # Файлы адресуются по содержимому и могут быть общими для нескольких
+        # пользователей - удаляем их, только если на них больше никто не ссылается
+        if not User.objects.filter(photo=name).exclude(pk=self.pk).exists():
+            delete_avatar(name)
 
     def save(self, *args, **kwargs):
         # Проверка, существует ли объект в базе данных (т.е. это обновление)
+        old_photo_name = None
         if self.pk:
-            try:
-                old_user = User.objects.get(pk=self.pk)
-                if old_user.photo and old_user.photo != self.photo:
-                    old_photo_path = os.path.join(
-                        settings.MEDIA_ROOT, old_user.photo.name
-                    )
-                    if os.path.isfile(old_photo_path):
-                        os.remove(old_photo_path)
-            except User.DoesNotExist:
-                pass
-
-        # Устанавливаем новое имя файла
-        if self.photo and not self.photo.name.startswith("users/"):
-            self.photo.name = f"users/{self.username}_avatar.jpg"
+            old_photo_name = User.objects.filter(pk=self.pk).values_list("photo", flat=True).first()
+
+        # Новый файл: очищаем от EXIF, сохраняем по хэшу содержимого и строим миниатюры
+        if self.photo and not self.photo._committed:
+            content, image = clean_photo(self.photo.file)
+            self.photo.save(content.name, content, save=False)
+            write_thumbnails(self.photo.name, image, self.photo.storage)
+            self.has_photo = self.has_thumbnails = True
+        # Наличие файла проверяем только когда он меняется, а не при каждом показе
+        elif not self.photo:
+            self.has_photo = self.has_thumbnails = False
+        elif self.photo.name != old_photo_name:
+            self.has_photo, self.has_thumbnails = photo_flags(self.photo.name, self.photo.storage)
 
         super(User, self).save(*args, **kwargs)
+
+        if old_photo_name and old_photo_name != self.photo.name:
+            self.release_photo(old_photo_name)
@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from authentication.auth_cache import forget_all_users, forget_user
+
+User = get_user_model()
+
+
+# Смена роли (UserUpdateView), профиля или пароля и удаление (UserDeleteView)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, raw=False, **kwargs):
+    if not raw:
+        forget_user(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def forget_cached_permissions(sender, **kwargs):
+    # Права группы касаются всех ее участников, поэтому сбрасываются все пользователи
+    forget_all_users()
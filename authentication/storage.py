@@ -0,0 +1,43 @@
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage, storages
+
+
+def avatar_storage():
+    # Вызывается из User.photo (storage=...), хранилище задается в settings.STORAGES
+    return storages["avatars"]
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    # Файл хранится под SHA-256 своего содержимого, по каталогам из начала хэша:
+    # users/ab/cd/abcd....jpg. Содержимое по имени не меняется, поэтому файлы
+    # кэшируются навсегда, а одинаковые загрузки делят один файл
+    prefix = "users"
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        h = digest.hexdigest()
+        ext = os.path.splitext(name)[1].lower()
+        return f"{self.prefix}/{h[:2]}/{h[2:4]}/{h}{ext}"
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым в _save, суффиксы не нужны
+        return name
+
+    def _save(self, name, content):
+        name = self.content_name(name, content)
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+    def save_derived(self, name, content):
+        # Файлы, производные от адресуемого по содержимому (миниатюры), сохраняются
+        # под заданным именем: оно тоже однозначно определяет содержимое
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
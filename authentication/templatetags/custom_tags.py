@@ -1,4 +1,8 @@
 from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from authentication.avatars import pick_size, thumbnail_name
 
 register = template.Library()
 
@@ -14,3 +18,31 @@ def set_attrs(field, args):
         attrs[key] = value
 
     return field.as_widget(attrs=attrs)
+
+
+@register.simple_tag
+def avatar(user, css_size, css_class=""):
+    # Аватар для рамки css_size пикселей: миниатюры WebP с запасным JPEG, 1x и 2x.
+    # Без миниатюр - исходное фото, без фото - аватар по умолчанию
+    photo = getattr(user, "photo", None)
+    if not photo or not user.has_photo:
+        return format_html('<img class="{}" src="{}" alt="Avatar" />', css_class, static("images/default_avatar.jpg"))
+    if not user.has_thumbnails:
+        return format_html('<img class="{}" src="{}" alt="Avatar" />', css_class, photo.url)
+
+    css_size = int(css_size)
+    sizes = (pick_size(css_size), pick_size(css_size * 2))
+
+    def srcset(ext):
+        return ", ".join(
+            f"{photo.storage.url(thumbnail_name(photo.name, size, ext))} {scale}x"
+            for scale, size in enumerate(sizes, start=1)
+        )
+
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" /><img class="{}" src="{}" srcset="{}" alt="Avatar" /></picture>',
+        srcset("webp"),
+        css_class,
+        photo.storage.url(thumbnail_name(photo.name, sizes[0], "jpg")),
+        srcset("jpg"),
+    )
@@ -1,3 +1,136 @@
-from django.test import TestCase
+import tempfile
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from authentication.avatars import AVATAR_FORMATS, AVATAR_SIZES, avatar_files, pick_size, thumbnail_name
+from authentication.models import User
+
+
+def upload(color=(200, 30, 30), size=(300, 200), name="photo.jpg"):
+    buffer = BytesIO()
+    Image.new("RGB", size, color).save(buffer, "JPEG")
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+
+class MediaTestCase(TestCase):
+    # Каждый тест пишет файлы во временный MEDIA_ROOT
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def create_user(self, username, **kwargs):
+        return User.objects.create_user(username, f"{username}@tms.local", "pass", **kwargs)
+
+
+class ThumbnailTests(MediaTestCase):
+    def test_sizes_and_formats(self):
+        user = self.create_user("worker", photo=upload(size=(300, 200)))
+        storage = user.photo.storage
+        for size in AVATAR_SIZES:
+            for ext, fmt in AVATAR_FORMATS.items():
+                with self.subTest(size=size, ext=ext), storage.open(thumbnail_name(user.photo.name, size, ext)) as f:
+                    image = Image.open(f)
+                    # Квадрат нужного размера, вырезанный из центра фото
+                    self.assertEqual((image.format, image.size), (fmt, (size, size)))
+
+    def test_pick_size(self):
+        self.assertEqual([pick_size(s) for s in (10, 40, 41, 96, 200, 512)], [40, 40, 96, 96, 256, 256])
+
+    def test_avatar_tag(self):
+        user = self.create_user("worker", photo=upload())
+        html = Template("{% load custom_tags %}{% avatar user 40 %}").render(Context({"user": user}))
+        # 1x и 2x для коробки 40px: миниатюры 40 и 96
+        self.assertIn(f'{user.photo.storage.url(thumbnail_name(user.photo.name, 40, "webp"))} 1x', html)
+        self.assertIn(f'{user.photo.storage.url(thumbnail_name(user.photo.name, 96, "jpg"))} 2x', html)
+
+
+class PhotoFlagsTests(MediaTestCase):
+    def flags(self, user):
+        user.refresh_from_db()
+        return user.has_photo, user.has_thumbnails
+
+    def test_upload_and_clear(self):
+        user = self.create_user("worker")
+        self.assertEqual(self.flags(user), (False, False))
+        user.photo = upload()
+        user.save()
+        self.assertEqual(self.flags(user), (True, True))
+        name = user.photo.name
+
+        user.photo = None
+        user.save()
+        self.assertEqual(self.flags(user), (False, False))
+        # Файл больше ни на кого не ссылается и удален
+        self.assertFalse(user.photo.storage.exists(name))
+
+    def test_reconcile(self):
+        user = self.create_user("worker", photo=upload())
+        storage = user.photo.storage
+        call_command("reconcile_photos", stdout=StringIO())
+        self.assertEqual(self.flags(user), (True, True))
+
+        storage.delete(thumbnail_name(user.photo.name, AVATAR_SIZES[0], "webp"))
+        call_command("reconcile_photos", stdout=StringIO())
+        self.assertEqual(self.flags(user), (True, False))
+
+        storage.delete(user.photo.name)
+        call_command("reconcile_photos", stdout=StringIO())
+        self.assertEqual(self.flags(user), (False, False))
+        self.assertFalse(user.photo_exists())
+
+        # Флаги без файлов (например, после переноса базы) тоже сбрасываются
+        User.objects.filter(pk=user.pk).update(has_photo=True, has_thumbnails=True)
+        out = StringIO()
+        call_command("reconcile_photos", stdout=out)
+        self.assertIn("Исправлено расхождений: 1", out.getvalue())
+        self.assertEqual(self.flags(user), (False, False))
+
+
+class AvatarStorageTests(MediaTestCase):
+    def test_name_is_sharded_content_hash(self):
+        user = self.create_user("worker", photo=upload())
+        prefix, a, b, filename = user.photo.name.split("/")
+        digest = filename.removesuffix(".jpg")
+        self.assertEqual((prefix, a, b, len(digest)), ("users", digest[:2], digest[2:4], 64))
+
+    def test_shared_file_released_by_last_user(self):
+        first = self.create_user("first", photo=upload())
+        second = self.create_user("second", photo=upload())
+        # Одинаковое содержимое - один файл
+        self.assertEqual(first.photo.name, second.photo.name)
+        name, storage = first.photo.name, first.photo.storage
+
+        first.photo = upload(color=(30, 200, 30))
+        first.save()
+        self.assertNotEqual(first.photo.name, name)
+        self.assertTrue(all(storage.exists(path) for path in avatar_files(name)))
+
+        second.photo = None
+        second.save()
+        self.assertFalse(any(storage.exists(path) for path in avatar_files(name)))
+        self.assertTrue(storage.exists(first.photo.name))
+
+    def test_serve_avatar(self):
+        user = self.create_user("worker", photo=upload())
+        url = reverse("avatar", kwargs={"path": thumbnail_name(user.photo.name, 40, "webp")})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Image.open(BytesIO(b"".join(response.streaming_content))).size, (40, 40))
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn("max-age=31536000", response["Cache-Control"])
+
+        response = self.client.get(url, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("immutable", response["Cache-Control"])
+
+        missing = f"users/00/00/{'0' * 64}.jpg"
+        self.assertEqual(self.client.get(reverse("avatar", kwargs={"path": missing})).status_code, 404)
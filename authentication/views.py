@@ -3,13 +3,17 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LoginView
 from django.db.models import Case, IntegerField, When
+from django.http import FileResponse, Http404, HttpResponseNotModified
 from django.shortcuts import render
 from django.urls import reverse_lazy
+from django.utils.cache import patch_cache_control
 from django.utils.decorators import method_decorator
+from django.utils.http import parse_etags
 from django.views.generic import CreateView, DeleteView, ListView, UpdateView
 
 from authentication.decorators import role_required
 from authentication.forms import LoginUserForm, ProfileUserForm, RegisterUserForm, UserUpdateForm
+from authentication.storage import avatar_storage
 
 from tasksystem.utils import get_menu
 
@@ -112,3 +116,19 @@ class UserDeleteView(DeleteView):
         context["title"] = "TMS | Удаление пользователя"
         context["menu"] = get_menu(self.request.user)  # Добавляем меню в контекст
         return context
+
+
+# Раздача фото из хранилища с именами по хэшу содержимого. Файл по такому имени
+# никогда не меняется, поэтому браузеру можно кэшировать его навсегда
+def serve_avatar(request, path):
+    etag = f'"{path.rsplit("/", 1)[-1]}"'
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        storage = avatar_storage()
+        if not storage.exists(path):
+            raise Http404()
+        response = FileResponse(storage.open(path, "rb"))
+    response["ETag"] = etag
+    patch_cache_control(response, public=True, max_age=31536000, immutable=True)
+    return response
@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+# Поток событий доски - мимо обработчика Django (см. tasksystem/live.py).
+# Импорт после get_asgi_application: к этому моменту приложения загружены
+from tasksystem.live import events_endpoint  # noqa: E402
+
+application = events_endpoint(application)
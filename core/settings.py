@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,12 +44,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'tasksystem.metrics.metrics_middleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'tasksystem.profiling.profiling_middleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'tasksystem.routers.replica_middleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -76,13 +80,99 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# Профили производительности SQLite, выбираются переменной окружения TMS_DB_PROFILE.
+# PRAGMAS выполняются на каждом новом соединении (tasksystem/signals.py).
+# Сравнить профили под конкурентной нагрузкой: manage.py benchmark_database
+DATABASE_PROFILES = {
+    # Настройки Django по умолчанию: журнал отката, новое соединение на каждый запрос
+    "default": {},
+    "production": {
+        # Соединение живет между запросами; перед повторным использованием проверяется
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+        # busy_timeout в секундах: столько писатель ждет блокировку, прежде чем
+        # получить "database is locked" (у модуля sqlite3 по умолчанию 5)
+        "OPTIONS": {"timeout": 20},
+        "PRAGMAS": {
+            # Читатели не блокируют писателя и не ждут его
+            "journal_mode": "WAL",
+            # В WAL fsync только на контрольных точках: после сбоя питания могут
+            # пропасть последние транзакции, но база остается целой
+            "synchronous": "NORMAL",
+            # 64 МБ страничного кэша на соединение (отрицательное значение - в КБ)
+            "cache_size": -64000,
+            # Чтение файла базы через mmap, без копирования страниц в кэш
+            "mmap_size": 256 * 1024 * 1024,
+            "temp_store": "MEMORY",
+        },
+    },
+}
+DB_PROFILE = os.environ.get("TMS_DB_PROFILE", "default")
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Тестовая база в файле: in-memory база с общим кэшем не выдерживает
+        # параллельных записей из потоков (см. ClaimContentionTests)
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+        **DATABASE_PROFILES[DB_PROFILE],
     }
 }
 
+# Реплика для чтения (tasksystem/routers.py): путь к ее файлу в TMS_REPLICA.
+# Локально реплику заменяет копия основной базы, которую обновляет команда
+# sync_replica. После записи пользователь читает из основной базы еще
+# REPLICA_PIN_SECONDS - это время должно перекрывать отставание реплики
+REPLICA_DATABASE = None
+REPLICA_PIN_SECONDS = 30
+if os.environ.get("TMS_REPLICA"):
+    REPLICA_DATABASE = "replica"
+    DATABASES[REPLICA_DATABASE] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ["TMS_REPLICA"],
+        # В тестах реплика - та же база, что и основная
+        'TEST': {
+            'MIRROR': 'default',
+        },
+        **DATABASE_PROFILES[DB_PROFILE],
+    }
+
+DATABASE_ROUTERS = ["tasksystem.routers.ReplicaRouter"]
+
+
+# Кэш процесса. Отрендеренные карточки задач лежат в отдельном кэше, чтобы
+# при вытеснении не мешать остальным записям; ключи карточек меняются вместе
+# с задачей и ее автором/исполнителем, поэтому устаревшие просто вытесняются.
+# При нескольких процессах оба кэша можно перенести в Redis или Memcached
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "tms",
+        # Здесь же сессии и пользователи (authentication/backends.py), если кэш общий:
+        # по записи на каждого вошедшего
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+    "fragments": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "tms-fragments",
+        "TIMEOUT": 24 * 60 * 60,
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    },
+}
+# Общий для всех процессов сервера кэш: адрес Redis в TMS_REDIS_URL (нужен пакет redis)
+if os.environ.get("TMS_REDIS_URL"):
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.environ["TMS_REDIS_URL"],
+    }
+SHARED_CACHE_BACKENDS = (
+    "django.core.cache.backends.redis.RedisCache",
+    "django.core.cache.backends.memcached.PyMemcacheCache",
+    "django.core.cache.backends.memcached.PyLibMCCache",
+)
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -125,10 +215,44 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 MEDIA_URL = "media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+    # Фото пользователей: имя файла - хэш содержимого (authentication/storage.py)
+    "avatars": {
+        "BACKEND": "authentication.storage.ContentAddressedStorage",
+    },
+}
+
 
 DEFAULT_USER_IMAGE = STATIC_URL + "images/default_user.jpg"
 
 
+# Метрики представлений (tasksystem/metrics.py), выдача - api/metrics/.
+# При нескольких процессах сервера TMS_METRICS_DIR - общий для них каталог:
+# каждый процесс раз в METRICS_FLUSH_SECONDS пишет туда свои значения, выдача
+# их складывает. Каталог очищают при перезапуске сервера. TMS_METRICS_TOKEN -
+# токен для Prometheus (Authorization: Bearer ...), без него выдача только администратору
+METRICS_DIR = os.environ.get("TMS_METRICS_DIR")
+METRICS_FLUSH_SECONDS = 5
+METRICS_TOKEN = os.environ.get("TMS_METRICS_TOKEN")
+
+# Профилирование запросов (tasksystem/profiling.py): доля PROFILE_SAMPLE_RATE
+# (TMS_PROFILE_RATE, например 0.01) и запросы администратора с ?_profile=1.
+# Профили пишутся в PROFILE_DIR/<имя маршрута>/, хранятся последние
+# PROFILE_MAX_FILES; сводка - manage.py profile_summary.
+# sampler снимает стек раз в PROFILE_INTERVAL секунд, cprofile трассирует каждый вызов
+PROFILE_DIR = os.environ.get("TMS_PROFILE_DIR", BASE_DIR / "profiles")
+PROFILE_SAMPLE_RATE = float(os.environ.get("TMS_PROFILE_RATE", 0))
+PROFILE_ENGINE = "sampler"
+PROFILE_INTERVAL = 0.005
+PROFILE_MAX_FILES = 500
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -136,6 +260,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = "authentication.User"
 
+# Сессия и пользователь с правами читаются из кэша, в базу - только при промахе.
+# Только с общим кэшем: в LocMem каждого процесса выход, смена роли или удаление
+# пользователя, сделанные в другом процессе, не видны до истечения записи.
+# Без общего кэша CachedModelBackend работает как ModelBackend
+AUTH_CACHE = CACHES["default"]["BACKEND"] in SHARED_CACHE_BACKENDS
+AUTHENTICATION_BACKENDS = ["authentication.backends.CachedModelBackend"]
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db" if AUTH_CACHE else "django.contrib.sessions.backends.db"
+
 
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
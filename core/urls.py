@@ -17,7 +17,8 @@ Including another URLconf
 from django.conf.urls.static import static
 from django.conf import settings
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
+from authentication.views import serve_avatar
 from tasksystem.views import page_404, page_403
 
 
@@ -25,6 +26,12 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('tasksystem.urls', namespace="tasksystem")),
     path('authentication/', include('authentication.urls', namespace="authentication")),
+    # Фото пользователей: users/ab/cd/<sha256>[_размер].<расширение>
+    re_path(
+        rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>users/[0-9a-f]{{2}}/[0-9a-f]{{2}}/[0-9a-f]{{64}}(?:_\d+)?\.\w+)$',
+        serve_avatar,
+        name="avatar",
+    ),
 ]
 
 if settings.DEBUG:
@@ -1,9 +1,19 @@
 from django.contrib import admin
 
-from tasksystem.models import Task
+from tasksystem.models import Counter, Task, TaskTombstone
 
 # Register your models here.
 
 @admin.register(Task)
 class TaskAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(Counter)
+class CounterAdmin(admin.ModelAdmin):
+    list_display = ("name", "value")
+
+
+@admin.register(TaskTombstone)
+class TaskTombstoneAdmin(admin.ModelAdmin):
+    list_display = ("task_id", "change_seq", "deleted_at")
@@ -0,0 +1,211 @@
+from functools import wraps
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+
+from tasksystem import fragments, metrics
+from tasksystem.changes import CHANGES_MAX_PAGE_SIZE, CHANGES_PAGE_SIZE, changes_since, current_seq
+from tasksystem.models import Task
+from tasksystem.routers import replica_view
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+# Строк на один fetchmany() при выгрузке и строк на один кусок ответа
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_WRITE_ROWS = 500
+EXPORT_FORMATS = ("ndjson", "json")
+
+# Поле в ответе -> поле в values(): только нужные колонки, без экземпляров моделей
+TASK_FIELDS = {
+    "id": "id",
+    "title": "title",
+    "description": "description",
+    "status": "status",
+    "slug": "slug",
+    "author": "author__username",
+    "worker": "worker__username",
+    "time_create": "time_create",
+    "time_update": "time_update",
+}
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def api_view(allowed_roles):
+    # Как login_required + role_required, но с JSON-ответом вместо редиректа на вход
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            try:
+                if request.method != "GET":
+                    raise ApiError("Метод не поддерживается", status=405)
+                if not request.user.is_authenticated:
+                    raise ApiError("Требуется вход в систему", status=401)
+                if request.user.role not in allowed_roles:
+                    raise ApiError("У вас нет прав для этого действия.", status=403)
+                return view_func(request, *args, **kwargs)
+            except ApiError as e:
+                return JsonResponse({"error": str(e)}, status=e.status, json_dumps_params={"ensure_ascii": False})
+        return _wrapped_view
+    return decorator
+
+
+def filter_tasks(tasks, params):
+    status = params.get("status")
+    if status:
+        if status not in Task.Status.values:
+            raise ApiError(f"Неизвестный статус '{status}'")
+        tasks = tasks.filter(status=status)
+    if params.get("author"):
+        tasks = tasks.filter(author__username=params["author"])
+    worker = params.get("worker")
+    if worker == "none":
+        tasks = tasks.filter(worker__isnull=True)
+    elif worker:
+        tasks = tasks.filter(worker__username=worker)
+    return tasks
+
+
+def int_param(params, name, default, maximum=None):
+    try:
+        value = int(params.get(name) or default)
+    except ValueError:
+        raise ApiError(f"Параметр {name} должен быть числом")
+    if value < 0 or (maximum is not None and value > maximum):
+        raise ApiError(f"Недопустимое значение параметра {name}")
+    return value
+
+
+def task_rows(tasks):
+    return tasks.values_list(*TASK_FIELDS.values())
+
+
+def task_dict(row):
+    return dict(zip(TASK_FIELDS, row))
+
+
+# Страница задач по возрастанию id. Курсор - id последней задачи страницы,
+# поэтому любая страница стоит как первая, а вставки не сдвигают выдачу
+@api_view(allowed_roles=["admin", "manager"])
+def task_list(request):
+    after = int_param(request.GET, "cursor", 0)
+    limit = int_param(request.GET, "limit", API_PAGE_SIZE, maximum=API_MAX_PAGE_SIZE) or API_PAGE_SIZE
+    tasks = filter_tasks(Task.objects.visible_to(request.user), request.GET)
+    rows = list(task_rows(tasks.filter(id__gt=after).order_by("id"))[: limit + 1])
+    results = [task_dict(row) for row in rows[:limit]]
+    return JsonResponse(
+        {
+            "results": results,
+            "next_cursor": str(results[-1]["id"]) if len(rows) > limit else None,
+        },
+        json_dumps_params={"ensure_ascii": False},
+    )
+
+
+def export_chunks(rows, fmt):
+    # Ответ собирается по EXPORT_WRITE_ROWS строк: ни выборка, ни тело ответа
+    # целиком в памяти не держатся
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    first = True
+    if fmt == "json":
+        yield "["
+    while chunk := list(islice(rows, EXPORT_WRITE_ROWS)):
+        lines = [encoder.encode(task_dict(row)) for row in chunk]
+        if fmt == "ndjson":
+            yield "\n".join(lines) + "\n"
+        else:
+            yield ("" if first else ",") + ",".join(lines)
+        first = False
+    if fmt == "json":
+        yield "]"
+
+
+async def astream(chunks):
+    # Синхронный итератор ответа ASGI-обработчик Django вычитал бы целиком
+    # (sync_to_async(list)), поэтому под ASGI куски берутся по одному. Поток тот же,
+    # что у представления (thread_sensitive), а значит и соединение с курсором
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+# Выгрузка всех подходящих задач потоком. iterator() читает из курсора порциями
+# по EXPORT_CHUNK_SIZE строк и не кэширует результат в queryset
+@api_view(allowed_roles=["admin", "manager"])
+@replica_view
+def task_export(request):
+    fmt = request.GET.get("format", "ndjson")
+    if fmt not in EXPORT_FORMATS:
+        raise ApiError(f"Неизвестный формат '{fmt}'")
+    # База выбирается сразу: строки читаются уже после выхода из представления.
+    # Отметка для ленты изменений берется до выгрузки и из той же базы: изменения,
+    # попавшие в выгрузку, клиент получит из ленты еще раз, но ничего не пропустит
+    using = router.db_for_read(Task)
+    tasks = filter_tasks(Task.objects.visible_to(request.user), request.GET).using(using)
+    seq = current_seq(using)
+    rows = task_rows(tasks.order_by("id")).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    chunks = export_chunks(rows, fmt)
+    response = StreamingHttpResponse(
+        astream(chunks) if isinstance(request, ASGIRequest) else chunks,
+        content_type="application/x-ndjson; charset=utf-8" if fmt == "ndjson" else "application/json; charset=utf-8",
+    )
+    response["Content-Disposition"] = f'attachment; filename="tasks.{fmt}"'
+    response["X-Change-Seq"] = str(seq)
+    return response
+
+
+# Лента изменений для зеркалирования таблицы задач. Клиент хранит next_since и
+# опрашивает ленту с ним: ответ содержит только задачи, измененные или удаленные
+# после этой отметки, и стоит пропорционально числу изменений, а не задач
+@api_view(allowed_roles=["admin", "manager"])
+def task_changes(request):
+    since = int_param(request.GET, "since", 0)
+    limit = int_param(request.GET, "limit", CHANGES_PAGE_SIZE, maximum=CHANGES_MAX_PAGE_SIZE) or CHANGES_PAGE_SIZE
+    changed, deleted, next_since, has_more = changes_since(since, TASK_FIELDS.values(), limit)
+
+    results, removed = [], [{"id": task_id, "change_seq": seq} for task_id, seq in deleted]
+    is_admin = request.user.role == request.user.Role.ADMIN
+    for row in changed:
+        task = task_dict(row)
+        task["change_seq"] = row[-1]
+        # Чужая задача, ставшая завершенной, для менеджера пропадает из выдачи,
+        # поэтому в зеркале ее нужно удалить
+        if not is_admin and task["status"] == Task.Status.COMPLETED and task["author"] != request.user.username:
+            removed.append({"id": task["id"], "change_seq": task["change_seq"]})
+        else:
+            results.append(task)
+    return JsonResponse(
+        {"changes": results, "deleted": removed, "next_since": next_since, "has_more": has_more},
+        json_dumps_params={"ensure_ascii": False},
+    )
+
+
+# Попадания в кэш карточек задач с момента запуска процессов
+@api_view(allowed_roles=["admin"])
+def card_cache_stats(request):
+    hits, misses = fragments.stats()
+    return JsonResponse({"hits": hits, "misses": misses, "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else None})
+
+
+def metrics_response():
+    return HttpResponse(metrics.render(metrics.registry.collect()), content_type=metrics.CONTENT_TYPE)
+
+
+@api_view(allowed_roles=["admin"])
+def admin_metrics(request):
+    return metrics_response()
+
+
+# Время, запросы к базе и размер ответов по представлениям в формате Prometheus
+def metrics_export(request):
+    if request.method == "GET" and metrics.token_allowed(request):
+        return metrics_response()
+    return admin_metrics(request)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TasksystemConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tasksystem'
+
+    def ready(self):
+        from tasksystem import signals  # noqa: F401
@@ -0,0 +1,111 @@
+import heapq
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+
+from tasksystem import counters
+from tasksystem.models import Counter
+
+User = get_user_model()
+
+# Куча живет в памяти процесса и видит только его собственные изменения
+# счетчиков; изменения из других процессов подтягиваются полной пересборкой
+RESYNC_INTERVAL = 60
+
+
+class WorkerLoads:
+    # Min-куча (число задач в работе, id исполнителя) для автоназначения.
+    # Записи не удаляются из кучи при изменении нагрузки: добавляется новая,
+    # а устаревшие отбрасываются при извлечении (ленивое удаление)
+    def __init__(self, resync_interval=RESYNC_INTERVAL):
+        self.resync_interval = resync_interval
+        self.lock = threading.Lock()
+        self.invalidate()
+
+    def invalidate(self):
+        self.loads = None
+        self.heap = []
+        # Задачи, уже учтенные в нагрузке при выборе исполнителя, но счетчик
+        # по которым еще не обновлен: их дельту observe() пропускает
+        self.reserved = {}
+        self.loaded_at = 0
+
+    def load(self):
+        # Два запроса на всю пересборку: активные исполнители и их счетчики
+        workers = User.objects.filter(role=User.Role.WORKER, is_active=True).values_list("pk", flat=True)
+        self.loads = dict.fromkeys(workers, 0)
+        rows = Counter.objects.filter(name__startswith="worker:", name__endswith=":working").values_list("name", "value")
+        for name, value in rows:
+            worker_id = counters.working_worker(name)
+            if worker_id in self.loads:
+                self.loads[worker_id] = value
+        self.heap = [(load, worker_id) for worker_id, load in self.loads.items()]
+        heapq.heapify(self.heap)
+        self.reserved = {}
+        self.loaded_at = time.monotonic()
+
+    def ensure_loaded(self):
+        if self.loads is None or time.monotonic() - self.loaded_at > self.resync_interval:
+            self.load()
+
+    def set_load(self, worker_id, load):
+        self.loads[worker_id] = load
+        heapq.heappush(self.heap, (load, worker_id))
+        # Без периодического сжатия куча разрастается устаревшими записями
+        if len(self.heap) > 2 * len(self.loads) + 64:
+            self.heap = [(load, worker_id) for worker_id, load in self.loads.items()]
+            heapq.heapify(self.heap)
+
+    def take(self):
+        # Наименее загруженный исполнитель; его нагрузка сразу растет на единицу,
+        # чтобы следующий вызов до обновления счетчиков выбрал другого
+        with self.lock:
+            self.ensure_loaded()
+            while self.heap:
+                load, worker_id = self.heap[0]
+                if self.loads.get(worker_id) != load:
+                    heapq.heappop(self.heap)
+                    continue
+                heapq.heapreplace(self.heap, (load + 1, worker_id))
+                self.loads[worker_id] = load + 1
+                self.reserved[worker_id] = self.reserved.get(worker_id, 0) + 1
+                return worker_id
+            return None
+
+    def observe(self, deltas):
+        # Вызывается из counters.apply_deltas для каждого изменения счетчиков
+        with self.lock:
+            if self.loads is None:
+                return
+            for name, delta in deltas.items():
+                worker_id = counters.working_worker(name)
+                if worker_id not in self.loads:
+                    continue
+                while delta > 0 and self.reserved.get(worker_id):
+                    self.reserved[worker_id] -= 1
+                    delta -= 1
+                if delta:
+                    self.set_load(worker_id, self.loads[worker_id] + delta)
+
+    def worker_saved(self, user):
+        # Новый исполнитель, смена роли или блокировка
+        with self.lock:
+            if self.loads is None:
+                return
+            if user.role == User.Role.WORKER and user.is_active:
+                if user.pk not in self.loads:
+                    key = counters.working_key(user.pk)
+                    self.set_load(user.pk, counters.get_counters(key)[key])
+            else:
+                self.loads.pop(user.pk, None)
+                self.reserved.pop(user.pk, None)
+
+    def forget(self, worker_id):
+        with self.lock:
+            if self.loads is not None:
+                self.loads.pop(worker_id, None)
+                self.reserved.pop(worker_id, None)
+
+
+loads = WorkerLoads()
@@ -0,0 +1,83 @@
+from django.db import connections
+
+from tasksystem.models import Task, TaskTombstone
+
+CHANGES_PAGE_SIZE = 500
+CHANGES_MAX_PAGE_SIZE = 5000
+
+TRIGGERS = ("tasksystem_task_seq_ai", "tasksystem_task_seq_au", "tasksystem_task_seq_bd")
+
+# Следующий номер изменения. Оба max() берутся по индексам (task_change_idx и
+# unique у tombstone), поэтому стоят O(log n). В SQLite пишет одна транзакция
+# за раз, так что номера выдаются в порядке коммитов и клиент, запомнивший
+# максимальный номер, не пропустит изменение, закоммиченное позже с меньшим номером
+NEXT_SEQ = (
+    "(SELECT max(seq) + 1 FROM ("
+    "SELECT coalesce(max(change_seq), 0) AS seq FROM tasksystem_task "
+    "UNION ALL SELECT coalesce(max(change_seq), 0) FROM tasksystem_tasktombstone))"
+)
+
+
+def create_triggers(connection):
+    # Триггеры, а не сигналы: claim/complete/dispatch, импорт и каскадное
+    # удаление задач вместе с пользователем идут мимо save() и delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS tasksystem_task_seq_ai AFTER INSERT ON tasksystem_task BEGIN "
+            f"UPDATE tasksystem_task SET change_seq = {NEXT_SEQ} WHERE id = new.id; "
+            f"END"
+        )
+        # Вложенный UPDATE этот же триггер повторно не вызывает (recursive_triggers выключен).
+        # old.change_seq + 1: если UPDATE записал в строку старый номер, max() по
+        # таблице его уже не видит и мог бы выдать номер повторно
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS tasksystem_task_seq_au AFTER UPDATE ON tasksystem_task BEGIN "
+            f"UPDATE tasksystem_task SET change_seq = max({NEXT_SEQ}, old.change_seq + 1) WHERE id = new.id; "
+            f"END"
+        )
+        # BEFORE: пока строка не удалена, ее номер участвует в max(), иначе удаление
+        # последней измененной задачи получило бы уже выданный номер
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS tasksystem_task_seq_bd BEFORE DELETE ON tasksystem_task BEGIN "
+            f"INSERT OR REPLACE INTO tasksystem_tasktombstone (task_id, change_seq, deleted_at) "
+            f"VALUES (old.id, {NEXT_SEQ}, strftime('%Y-%m-%d %H:%M:%f', 'now')); "
+            f"END"
+        )
+
+
+def drop_triggers(connection):
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def changes_since(since, fields, limit=CHANGES_PAGE_SIZE, using="default"):
+    # Изменения с номером больше since в порядке номеров: (changed, deleted, next_since, has_more).
+    # changed - кортежи values_list(*fields) с change_seq последним полем, deleted - (task_id, change_seq).
+    # Обе выборки идут по индексу номера изменения и читают не больше limit + 1 строк
+    changed = list(
+        Task.objects.using(using).filter(change_seq__gt=since).order_by("change_seq")
+        .values_list(*fields, "change_seq")[: limit + 1]
+    )
+    deleted = list(
+        TaskTombstone.objects.using(using).filter(change_seq__gt=since).order_by("change_seq")
+        .values_list("task_id", "change_seq")[: limit + 1]
+    )
+    merged = sorted(
+        [(row[-1], False, row) for row in changed] + [(row[1], True, row) for row in deleted],
+        key=lambda item: item[0],
+    )
+    page = merged[:limit]
+    next_since = page[-1][0] if page else since
+    return (
+        [row for _, is_deleted, row in page if not is_deleted],
+        [row for _, is_deleted, row in page if is_deleted],
+        next_since,
+        len(merged) > limit,
+    )
+
+
+def current_seq(using="default"):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"SELECT {NEXT_SEQ} - 1")
+        return cursor.fetchone()[0]
@@ -0,0 +1,77 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.contrib.messages import get_messages
+from django.db import connections, router
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from tasksystem.changes import NEXT_SEQ
+from tasksystem.counters import PAGES_VERSION
+from tasksystem.fragments import user_version
+from tasksystem.models import Counter, Task
+
+# Номер последнего изменения задач (включая удаления) и версия остальных данных
+# страниц - пользователей и счетчиков меню. Оба значения читаются по индексам
+PAGES_STATE = (
+    f"SELECT {NEXT_SEQ} - 1, "
+    f"coalesce((SELECT value FROM {Counter._meta.db_table} WHERE name = %s), 0)"
+)
+
+
+def pages_state():
+    # Из той же базы, из которой страница будет читаться (см. tasksystem/routers.py)
+    with connections[router.db_for_read(Task)].cursor() as cursor:
+        cursor.execute(PAGES_STATE, [PAGES_VERSION])
+        return cursor.fetchone()
+
+
+def page_etag(request):
+    # ETag страниц задач. Кроме состояния базы в него входят пользователь (шапка,
+    # меню и кнопки зависят от него и его роли) и секрет CSRF: после входа секрет
+    # меняется, и закэшированная страница со старыми токенами в формах не подойдет.
+    # Слабый, потому что маскированные csrf-токены в теле от раза к разу разные
+    if len(get_messages(request)):
+        # Сообщение показывается один раз, страницу с ним нужно отрендерить
+        return None
+    if "CSRF_COOKIE" not in request.META:
+        # Первый заход: рендер выставит cookie с секретом, ETag будет у следующей загрузки
+        return None
+    seq, version = pages_state()
+    user = request.user
+    raw = "|".join([str(seq), str(version), user.role, user_version(user), request.META["CSRF_COOKIE"]])
+    return 'W/"%s"' % hashlib.md5(raw.encode()).hexdigest()
+
+
+def conditional_page(view_func):
+    # Повторная загрузка неизменившейся страницы стоит одного запроса к базе:
+    # ETag считается до выборок и рендера, и при совпадении с If-None-Match
+    # возвращается 304. Ставится под декораторами входа и ролей
+    def check(request):
+        etag = page_etag(request) if request.method in ("GET", "HEAD") else None
+        if etag is None:
+            return None, None
+        return get_conditional_response(request, etag=etag), etag
+
+    def finish(response, etag):
+        if etag is not None and response.status_code == 200:
+            response.headers.setdefault("ETag", etag)
+            # Браузер хранит страницу у себя, но перед показом всегда сверяет ETag
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    if iscoroutinefunction(view_func):
+        async def _wrapped_view(request, *args, **kwargs):
+            not_modified, etag = await sync_to_async(check)(request)
+            if not_modified is not None:
+                return not_modified
+            return finish(await view_func(request, *args, **kwargs), etag)
+        return markcoroutinefunction(wraps(view_func)(_wrapped_view))
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        not_modified, etag = check(request)
+        if not_modified is not None:
+            return not_modified
+        return finish(view_func(request, *args, **kwargs), etag)
+    return _wrapped_view
@@ -0,0 +1,31 @@
+import threading
+import time
+
+from django.db import connections
+
+
+def hammer(action, workers, attempts):
+    # Каждый исполнитель в своем потоке (и со своим соединением с базой)
+    # attempts раз выполняет action(worker); все потоки стартуют одновременно.
+    # Возвращает (победы - исполнители, чей action вернул истину; ошибки; секунды)
+    start = threading.Barrier(len(workers))
+    wins, errors = [], []
+
+    def run(worker):
+        try:
+            start.wait()
+            for _ in range(attempts):
+                if action(worker):
+                    wins.append(worker)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=run, args=(w,)) for w in workers]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return wins, errors, time.perf_counter() - started
@@ -0,0 +1,99 @@
+from collections import Counter as Deltas
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, Q
+
+from tasksystem.models import Counter, Task
+
+OPEN_TASKS = "tasks:open"
+COMPLETED_TASKS = "tasks:completed"
+TOTAL_USERS = "users:total"
+# Версия данных страниц, не отраженных в номере изменения задач: пользователей
+# и самих счетчиков. Входит в ETag страниц (tasksystem/conditional.py)
+PAGES_VERSION = "pages:version"
+
+
+def working_key(user_id):
+    return f"worker:{user_id}:working"
+
+
+def working_worker(name):
+    # Обратное к working_key: id исполнителя или None
+    prefix, _, rest = name.partition(":")
+    worker_id, _, suffix = rest.partition(":")
+    if prefix == "worker" and suffix == "working" and worker_id.isdigit():
+        return int(worker_id)
+    return None
+
+
+def completed_key(user_id):
+    return f"author:{user_id}:completed"
+
+
+def task_contribution(status, worker_id, author_id):
+    # Какие счетчики учитывают задачу в данном состоянии
+    keys = []
+    if status == Task.Status.COMPLETED:
+        keys += [COMPLETED_TASKS, completed_key(author_id)]
+    else:
+        keys.append(OPEN_TASKS)
+        if status == Task.Status.WORKING and worker_id is not None:
+            keys.append(working_key(worker_id))
+    return keys
+
+
+def task_deltas(old, new):
+    # old и new - кортежи (status, worker_id, author_id) или None
+    deltas = Deltas()
+    if old is not None:
+        deltas.subtract(task_contribution(*old))
+    if new is not None:
+        deltas.update(task_contribution(*new))
+    return {name: delta for name, delta in deltas.items() if delta}
+
+
+def apply_deltas(deltas):
+    from tasksystem.assignment import loads
+
+    for name, delta in deltas.items():
+        if not Counter.objects.filter(name=name).update(value=F("value") + delta):
+            Counter.objects.get_or_create(name=name)
+            Counter.objects.filter(name=name).update(value=F("value") + delta)
+    loads.observe(deltas)
+
+
+def forget_user(user_id):
+    # Счетчики удаленного пользователя больше не нужны
+    Counter.objects.filter(name__in=[working_key(user_id), completed_key(user_id)]).delete()
+
+
+def get_counters(*names):
+    # Одна выборка по первичному ключу, независимо от размера таблиц
+    values = dict(Counter.objects.filter(name__in=names).values_list("name", "value"))
+    return {name: values.get(name, 0) for name in names}
+
+
+async def aget_counters(*names):
+    values = {name: value async for name, value in Counter.objects.filter(name__in=names).values_list("name", "value")}
+    return {name: values.get(name, 0) for name in names}
+
+
+def compute_counters(task_model=Task, user_model=None):
+    # Полный пересчет из исходных таблиц; модели передаются параметрами,
+    # чтобы функцию можно было вызвать и из миграции
+    completed = Task.Status.COMPLETED
+    working = Task.Status.WORKING
+    tasks = task_model.objects
+    counters = tasks.aggregate(
+        **{
+            OPEN_TASKS: Count("id", filter=~Q(status=completed)),
+            COMPLETED_TASKS: Count("id", filter=Q(status=completed)),
+        }
+    )
+    counters[TOTAL_USERS] = (user_model or get_user_model()).objects.count()
+
+    for row in tasks.filter(status=working, worker__isnull=False).values("worker").annotate(n=Count("id")):
+        counters[working_key(row["worker"])] = row["n"]
+    for row in tasks.filter(status=completed).values("author").annotate(n=Count("id")):
+        counters[completed_key(row["author"])] = row["n"]
+    return counters
@@ -0,0 +1,98 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from tasksystem import counters
+from tasksystem.models import DashboardSnapshot, Task, WorkerStat
+
+User = get_user_model()
+
+# Запас на транзакции, которые еще не закоммичены к моменту пересчета:
+# следующий запуск заново просмотрит этот интервал
+REFRESH_LAG = datetime.timedelta(seconds=30)
+
+
+def touched_workers(since):
+    # Исполнители задач, измененных после отметки (индекс task_updated_idx).
+    # Без worker__isnull и DISTINCT: иначе SQLite предпочитает обойти task_worker_idx
+    # целиком. Повторы и NULL отбрасываются на стороне Python.
+    return Task.objects.filter(time_update__gt=since).values_list("worker", flat=True).order_by()
+
+
+def completed_by_worker(worker_ids=None):
+    # Количество выполненных задач по исполнителям (индекс task_worker_idx)
+    tasks = Task.objects.filter(status=Task.Status.COMPLETED, worker__isnull=False)
+    if worker_ids is not None:
+        tasks = tasks.filter(worker__in=worker_ids)
+    return tasks.values_list("worker").annotate(n=Count("id")).order_by()
+
+
+def recount_workers(worker_ids=None):
+    # Пересчитывает выполненные задачи для указанных исполнителей (или для всех)
+    completed = dict(completed_by_worker(worker_ids))
+
+    if worker_ids is None:
+        WorkerStat.objects.all().delete()
+        worker_ids = completed.keys()
+    WorkerStat.objects.bulk_create(
+        [WorkerStat(worker_id=pk, completed_tasks=completed.get(pk, 0)) for pk in worker_ids],
+        update_conflicts=True,
+        unique_fields=["worker"],
+        update_fields=["completed_tasks"],
+    )
+
+
+def release_completed(old, new):
+    # old и new - состояния задачи (status, worker_id, author_id), new - None при
+    # удалении. Выполненная задача ушла от исполнителя (переназначена, снята или
+    # удалена): у прежнего исполнителя она больше не изменится, и touched_workers
+    # его не найдет, поэтому его счет пересчитывается сразу, в транзакции изменения.
+    # Только существующая строка: ее нет - исполнитель еще не попадал в статистику
+    # (или удаляется вместе со своей статистикой)
+    if old is None:
+        return
+    status, worker_id, _ = old
+    if status != Task.Status.COMPLETED or worker_id is None or (new is not None and new[1] == worker_id):
+        return
+    completed = Task.objects.filter(status=Task.Status.COMPLETED, worker=worker_id).count()
+    WorkerStat.objects.filter(worker=worker_id).update(completed_tasks=completed)
+
+
+def refresh_snapshot(full=False):
+    # Обновляет снимок статистики. Без full учитываются только задачи,
+    # измененные после прошлого запуска: пересчет идет лишь по их исполнителям
+    # (прежних исполнителей пересчитывает release_completed).
+    now = timezone.now()
+    with transaction.atomic():
+        snapshot = DashboardSnapshot.objects.select_for_update().first()
+        if full or snapshot is None:
+            recount_workers()
+            snapshot = snapshot or DashboardSnapshot(pk=1)
+        else:
+            touched = set(touched_workers(snapshot.watermark - REFRESH_LAG)) - {None}
+            if touched:
+                recount_workers(touched)
+
+        roles = dict(User.objects.values_list("role").annotate(n=Count("id")).order_by())
+        totals = counters.get_counters(counters.OPEN_TASKS, counters.COMPLETED_TASKS)
+        top = (
+            WorkerStat.objects.filter(worker__role=User.Role.WORKER, completed_tasks__gt=0)
+            .order_by("-completed_tasks")
+            .first()
+        )
+
+        snapshot.total_users = sum(roles.values())
+        snapshot.total_tasks = sum(totals.values())
+        snapshot.admins = roles.get(User.Role.ADMIN, 0)
+        snapshot.managers = roles.get(User.Role.MANAGER, 0)
+        snapshot.workers = roles.get(User.Role.WORKER, 0)
+        snapshot.readers = roles.get(User.Role.READER, 0)
+        snapshot.top_worker_id = top.worker_id if top else None
+        snapshot.top_worker_completed = top.completed_tasks if top else 0
+        snapshot.refreshed_at = now
+        snapshot.watermark = now
+        snapshot.save()
+    return snapshot
@@ -0,0 +1,73 @@
+import random
+import sqlite3
+import time
+
+# Модуль не импортирует Django: run_worker выполняется в отдельных процессах
+# benchmark_database, которые Django не настраивают
+
+# Таймаут ожидания блокировки у sqlite3.connect по умолчанию
+DEFAULT_TIMEOUT = 5
+
+
+def pragma_statements(pragmas):
+    return [f"PRAGMA {name} = {value}" for name, value in pragmas.items()]
+
+
+def apply_pragmas(cursor, pragmas):
+    for statement in pragma_statements(pragmas):
+        cursor.execute(statement)
+
+
+def connect(path, profile):
+    # Как DatabaseWrapper.get_new_connection у Django: автокоммит, внешние ключи
+    conn = sqlite3.connect(path, timeout=profile.get("OPTIONS", {}).get("timeout", DEFAULT_TIMEOUT), isolation_level=None)
+    conn.execute("PRAGMA foreign_keys = ON")
+    apply_pragmas(conn, profile.get("PRAGMAS", {}))
+    return conn
+
+
+def run_worker(path, profile, read_sql, read_params, task_ids, user_id, seconds, write_ratio, seed):
+    # Один процесс нагрузки: чтения доски и записи как у claim/complete
+    # (UPDATE задачи и счетчика в одной транзакции). Без CONN_MAX_AGE каждая
+    # операция открывает свое соединение, как запрос в Django
+    rnd = random.Random(seed)
+    persistent = bool(profile.get("CONN_MAX_AGE"))
+    # locked - операции, не дождавшиеся блокировки; lock_wait - сколько они ждали
+    stats = {"reads": [], "writes": [], "locked": 0, "lock_wait": 0.0}
+    conn = None
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        write = rnd.random() < write_ratio
+        started = time.perf_counter()
+        try:
+            if conn is None:
+                conn = connect(path, profile)
+            if write:
+                conn.execute("BEGIN")
+                try:
+                    conn.execute(
+                        "UPDATE tasksystem_task SET status = CASE status WHEN 'PD' THEN 'WK' ELSE 'PD' END, "
+                        "worker_id = CASE status WHEN 'PD' THEN ? ELSE NULL END, time_update = ? WHERE id = ?",
+                        [user_id, time.strftime("%Y-%m-%d %H:%M:%S"), rnd.choice(task_ids)],
+                    )
+                    conn.execute("UPDATE tasksystem_counter SET value = value + 1 WHERE name = 'benchmark'")
+                    conn.execute("COMMIT")
+                except BaseException:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    raise
+            else:
+                conn.execute(read_sql, read_params).fetchall()
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) and "busy" not in str(e):
+                raise
+            stats["locked"] += 1
+            stats["lock_wait"] += time.perf_counter() - started
+        else:
+            stats["writes" if write else "reads"].append(time.perf_counter() - started)
+        if not persistent and conn is not None:
+            conn.close()
+            conn = None
+    if conn is not None:
+        conn.close()
+    return stats
@@ -0,0 +1,48 @@
+import re
+
+from django.db.models import BigIntegerField, Count, Max, Q
+from django.db.models.functions import Cast, Substr
+from django_extensions.db.fields import AutoSlugField
+
+from tasksystem.slugs import EMPTY_SLUG, next_free_slug, suffix_pattern
+
+
+class TaskSlugField(AutoSlugField):
+    # AutoSlugField, который подбирает свободный суффикс одним запросом по индексу
+    # вместо перебора base-2, base-3, ... с запросом на каждую попытку
+    def create_slug(self, model_instance, add):
+        # Слаг уже выделен заранее (массовый импорт, см. tasksystem/importer.py)
+        if getattr(model_instance, "_slug_allocated", False):
+            return getattr(model_instance, self.attname)
+
+        base = self.slugify_func(getattr(model_instance, self._populate_from), slugify_function=self.slugify_function)
+        base = self._slug_strip(base[: self.max_length]) or EMPTY_SLUG
+
+        # Заголовок не менялся - оставляем прежний слаг, чтобы не ломать ссылки
+        current = getattr(model_instance, self.attname)
+        if current and model_instance.pk and suffix_pattern(base, self.separator).match(current):
+            return current
+
+        queryset = self.get_queryset(model_instance.__class__, self)
+        if model_instance.pk:
+            queryset = queryset.exclude(pk=model_instance.pk)
+        # base и base-<цифры>: точное совпадение и диапазон по уникальному индексу
+        # слага. Регулярное выражение проверяется только на строках диапазона и
+        # отсекает base-1abc; наибольший номер считает база, строки в Python не читаются
+        prefix = f"{base}{self.separator}"
+        is_base = Q(**{self.attname: base})
+        numbered = Q(**{
+            f"{self.attname}__gte": f"{prefix}0",
+            f"{self.attname}__lt": f"{prefix}:",
+            f"{self.attname}__regex": rf"^{re.escape(prefix)}[0-9]{{1,18}}$",
+        })
+        found = queryset.filter(is_base | numbered).order_by().aggregate(
+            base_taken=Count("pk", filter=is_base),
+            last=Max(Cast(Substr(self.attname, len(prefix) + 1), BigIntegerField()), filter=~is_base),
+        )
+
+        slug = next_free_slug(base, found["base_taken"], found["last"], self.separator)
+        if len(slug) > self.max_length:
+            return super().create_slug(model_instance, add)
+        setattr(model_instance, self.attname, slug)
+        return slug
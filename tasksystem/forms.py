@@ -1,5 +1,6 @@
 from django import forms
 from django.contrib.auth import get_user_model
+from tasksystem.importer import IMPORT_FORMATS, encoding_error
 from tasksystem.models import Task
 
 
@@ -24,3 +25,41 @@ class TaskForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields["worker"].queryset = User.objects.filter(role=User.Role.WORKER)
+
+
+class TaskCreateForm(TaskForm):
+    auto_assign = forms.BooleanField(
+        label="Назначить автоматически",
+        required=False,
+        help_text="Задача достанется исполнителю с наименьшим числом задач в работе",
+        widget=forms.CheckboxInput(attrs={'class': 'size-5'}),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get("auto_assign") and cleaned_data.get("worker"):
+            self.add_error("worker", "Выберите исполнителя или автоматическое назначение, но не оба сразу.")
+        return cleaned_data
+
+
+class TaskImportForm(forms.Form):
+    file = forms.FileField(label="Файл", widget=forms.ClearableFileInput(attrs={'class': 'custom-input'}))
+    format = forms.ChoiceField(
+        label="Формат",
+        choices=[(f, f.upper()) for f in IMPORT_FORMATS],
+        widget=forms.Select(attrs={'class': 'custom-input'}),
+    )
+    auto_assign = forms.BooleanField(
+        label="Назначать автоматически",
+        required=False,
+        help_text="Строки без исполнителя и без статуса (или со статусом WK) получат наименее загруженного исполнителя",
+        widget=forms.CheckboxInput(attrs={'class': 'size-5'}),
+    )
+
+    def clean_file(self):
+        file = self.cleaned_data["file"]
+        error = encoding_error(file.chunks())
+        if error:
+            raise forms.ValidationError(error)
+        file.seek(0)
+        return file
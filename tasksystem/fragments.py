@@ -0,0 +1,72 @@
+import hashlib
+
+from django.core.cache import caches
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from tasksystem import metrics
+
+# Шаблоны неизменной для всех пользователей части карточки. Кнопки действий
+# (удаление, завершение) с csrf-токеном и проверкой прав остаются в странице
+CARD_TEMPLATES = {
+    "board": "tasksystem/cards/board.html",
+    "required": "tasksystem/cards/required.html",
+    "completed": "tasksystem/cards/completed.html",
+}
+
+def fragment_cache():
+    return caches["fragments"]
+
+
+def user_version(user):
+    # Все, что карточка показывает о пользователе. Версия вычисляется из самих
+    # полей, поэтому и update() в обход save() не оставит в кэше старую карточку
+    if user is None:
+        return "-"
+    photo = user.photo.name if user.photo else ""
+    return f"{user.pk}.{user.first_name}.{user.last_name}.{user.email}.{photo}.{user.has_photo:d}{user.has_thumbnails:d}"
+
+
+def card_key(kind, task, versions):
+    # change_seq меняется при любом изменении строки задачи, в том числе через
+    # update() в claim/complete; time_update добавлен для задач из старых баз
+    raw = "|".join([
+        str(task.id), str(task.change_seq), task.time_update.isoformat(),
+        versions[task.author_id], versions[task.worker_id],
+    ])
+    return f"card:{kind}:{task.id}:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def attach_cards(tasks, kind):
+    # Проставляет task.card - HTML карточки - каждой задаче из tasks (автор и
+    # исполнитель должны быть загружены select_related). Кэш читается одним
+    # get_many, недостающие карточки рендерятся и пишутся одним set_many
+    cache = fragment_cache()
+    versions = {None: user_version(None)}
+    for task in tasks:
+        for user in (task.author, task.worker):
+            if user is not None and user.pk not in versions:
+                versions[user.pk] = user_version(user)
+    keys = {task.id: card_key(kind, task, versions) for task in tasks}
+    cached = cache.get_many(keys.values()) if keys else {}
+
+    template = get_template(CARD_TEMPLATES[kind])
+    rendered = {}
+    for task in tasks:
+        key = keys[task.id]
+        if key in cached:
+            task.card = mark_safe(cached[key])
+        else:
+            task.card = rendered[key] = template.render({"t": task})
+    if rendered:
+        cache.set_many(rendered)
+    # Счетчики попаданий - в реестре метрик, а не в самом кэше: вытеснение
+    # LocMem-кэша (MAX_ENTRIES) не должно их сбрасывать
+    metrics.registry.record_cards(len(tasks) - len(rendered), len(rendered))
+    return tasks
+
+
+def stats():
+    # Попадания и промахи; с METRICS_DIR - сумма по всем процессам
+    series = {tuple(labels): values[0] for labels, values in metrics.registry.collect()["card_cache"]}
+    return series.get(("hit",), 0), series.get(("miss",), 0)
@@ -0,0 +1,192 @@
+import codecs
+import csv
+import json
+from collections import Counter as Deltas
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, transaction
+
+from tasksystem import counters, live
+from tasksystem.assignment import loads
+from tasksystem.models import Task
+from tasksystem.slugs import EMPTY_SLUG, slugify
+
+User = get_user_model()
+
+IMPORT_BATCH_SIZE = 1000
+IMPORT_FORMATS = ("csv", "ndjson")
+
+
+def encoding_error(chunks):
+    # Проверяет, что файл в UTF-8, до импорта: иначе ошибка всплыла бы посреди
+    # чтения, когда первые пачки уже сохранены. Читает файл кусками, не целиком.
+    # Возвращает текст ошибки или None
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    line_no = 1
+    try:
+        for chunk in chunks:
+            decoder.decode(chunk)
+            line_no += chunk.count(b"\n")
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError as e:
+        # e.object - текущий кусок (с недекодированным хвостом предыдущего, в котором нет \n)
+        line_no += e.object[: e.start].count(b"\n")
+        return f"файл должен быть в кодировке UTF-8 (ошибка в строке {line_no})"
+    return None
+
+
+def read_rows(stream, fmt):
+    # Построчно читает текстовый поток, не загружая файл целиком.
+    # Выдает (номер строки, dict или None, текст ошибки или None).
+    # Если файл дальше не читается, последней идет строка с ошибкой
+    line_no = 0
+    try:
+        if fmt == "csv":
+            reader = csv.DictReader(stream)
+            for row in reader:
+                line_no = reader.line_num
+                yield line_no, row, None
+            return
+
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, None, f"некорректный JSON: {e}"
+                continue
+            if not isinstance(row, dict):
+                yield line_no, None, "ожидался JSON-объект"
+                continue
+            yield line_no, row, None
+    except UnicodeDecodeError:
+        yield line_no + 1, None, "файл не в кодировке UTF-8, дальше он не прочитан"
+    except csv.Error as e:
+        yield line_no + 1, None, f"некорректный CSV ({e}), дальше файл не прочитан"
+
+
+class SlugAllocator:
+    # Выделяет уникальные слаги в памяти по заранее загруженному набору занятых,
+    # по тем же правилам, что и AutoSlugField (base, base-2, base-3, ...)
+    max_length = Task._meta.get_field("slug").max_length
+
+    def __init__(self, taken=None):
+        if taken is None:
+            taken = Task.objects.values_list("slug", flat=True).iterator(chunk_size=10000)
+        self.taken = set(taken)
+        self.next_suffix = {}
+
+    def base(self, title):
+        return slugify(title)[: self.max_length].strip("-_") or EMPTY_SLUG
+
+    def allocate(self, title):
+        base = self.base(title)
+        slug = base
+        suffix = self.next_suffix.get(base, 2)
+        while slug in self.taken:
+            end = f"-{suffix}"
+            slug = base[: self.max_length - len(end)].strip("-_") + end
+            suffix += 1
+        self.next_suffix[base] = suffix
+        self.taken.add(slug)
+        return slug
+
+
+class TaskImporter:
+    # Массовый импорт задач: проверка строк пачками, один запрос пользователей
+    # на пачку, уникальные слаги в памяти и bulk_create вместо save() на каждую задачу.
+    # bulk_create не вызывает сигналы, поэтому счетчики меню обновляются здесь же
+    def __init__(self, default_author=None, force_author=False, auto_assign=False, batch_size=IMPORT_BATCH_SIZE):
+        self.default_author = default_author
+        self.force_author = force_author
+        self.auto_assign = auto_assign
+        self.batch_size = batch_size
+        self.slugs = SlugAllocator()
+        self.created = 0
+        self.errors = []
+
+    def run(self, rows):
+        rows = iter(rows)
+        while batch := list(islice(rows, self.batch_size)):
+            self.import_batch(batch)
+        return self
+
+    def import_batch(self, batch):
+        names = set()
+        for _, row, _ in batch:
+            if row:
+                names.update(str(row.get(key) or "").strip() for key in ("author", "worker"))
+        users = {u.username: u for u in User.objects.filter(username__in=names - {""}).only("id", "username", "role")}
+
+        tasks, lines = [], []
+        for line_no, row, error in batch:
+            if error is None:
+                task, error = self.build_task(row, users)
+            if error:
+                self.errors.append((line_no, error))
+                continue
+            tasks.append(task)
+            lines.append(line_no)
+        if not tasks:
+            return
+
+        deltas = Deltas()
+        for task in tasks:
+            deltas.update(counters.task_deltas(None, (task.status, task.worker_id, task.author_id)))
+        try:
+            with transaction.atomic():
+                Task.objects.bulk_create(tasks, batch_size=self.batch_size)
+                counters.apply_deltas(deltas)
+                # Событие на каждую задачу импорта заняло бы очереди всех клиентов
+                live.publish_reload()
+        except DatabaseError as e:
+            # Выбранные исполнители уже учтены в куче, а задачи так и не созданы
+            loads.invalidate()
+            self.errors.extend((line_no, f"ошибка базы данных: {e}") for line_no in lines)
+            return
+        self.created += len(tasks)
+
+    def build_task(self, row, users):
+        title = str(row.get("title") or "").strip()
+        description = str(row.get("description") or "").strip()
+        if not title:
+            return None, "не указан заголовок"
+        if len(title) > Task._meta.get_field("title").max_length:
+            return None, "слишком длинный заголовок"
+        if not description:
+            return None, "не указано описание"
+
+        author = self.default_author
+        author_name = str(row.get("author") or "").strip()
+        if author_name and not self.force_author:
+            author = users.get(author_name)
+            if author is None:
+                return None, f"автор '{author_name}' не найден"
+        if author is None:
+            return None, "не указан автор"
+
+        worker = None
+        worker_name = str(row.get("worker") or "").strip()
+        if worker_name:
+            worker = users.get(worker_name)
+            if worker is None or worker.role != User.Role.WORKER:
+                return None, f"исполнитель '{worker_name}' не найден"
+
+        # Как в Task.save: задача с исполнителем сразу в работе
+        status = str(row.get("status") or "").strip()
+        if status and status not in Task.Status.values:
+            return None, f"неизвестный статус '{status}'"
+        worker_id = worker.pk if worker else None
+        if worker_id is None and self.auto_assign and status in ("", Task.Status.WORKING):
+            worker_id = loads.take()
+        status = status or (Task.Status.WORKING if worker_id else Task.Status.PENDING)
+        if status != Task.Status.PENDING and worker_id is None:
+            return None, "для этого статуса нужен исполнитель"
+
+        task = Task(title=title, description=description, status=status, author=author, worker_id=worker_id)
+        task.slug = self.slugs.allocate(title)
+        task._slug_allocated = True
+        return task, None
@@ -0,0 +1,191 @@
+import asyncio
+import contextlib
+import json
+import threading
+from importlib import import_module
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.db import close_old_connections, transaction
+from django.http.cookie import parse_cookie
+from django.urls import get_script_prefix, reverse
+
+from tasksystem.models import Task
+
+# Сколько событий может накопиться у медленного клиента, прежде чем
+# его очередь будет сброшена и он получит команду перечитать доску
+QUEUE_SIZE = 100
+# Комментарий-пульс, чтобы прокси не закрывали простаивающее соединение
+HEARTBEAT = 25
+
+EVENT_CREATED = "created"
+EVENT_CLAIMED = "claimed"
+EVENT_UPDATED = "updated"
+EVENT_COMPLETED = "completed"
+EVENT_DELETED = "deleted"
+# Массовое изменение (импорт): клиенту проще перечитать доску целиком
+EVENT_RELOAD = "reload"
+
+
+def sse_frame(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+
+
+RELOAD_FRAME = sse_frame(EVENT_RELOAD, {})
+
+
+class Broadcaster:
+    # Раздача событий доски подписчикам в этом процессе. Подписчик - asyncio.Queue
+    # в цикле событий ASGI-сервера, поэтому простаивающее соединение стоит одну
+    # очередь и одну приостановленную корутину, без потока. Публиковать можно из
+    # любого потока: событие кодируется один раз и передается в каждый цикл
+    # событий одним call_soon_threadsafe
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.loops = {}
+
+    def subscribe(self):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.queue_size)
+        with self.lock:
+            self.loops.setdefault(loop, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        with self.lock:
+            for loop, queues in list(self.loops.items()):
+                queues.discard(queue)
+                if not queues:
+                    del self.loops[loop]
+
+    def publish(self, frame):
+        with self.lock:
+            targets = [(loop, list(queues)) for loop, queues in self.loops.items()]
+        for loop, queues in targets:
+            try:
+                loop.call_soon_threadsafe(self.fan_out, queues, frame)
+            except RuntimeError:
+                # Цикл уже закрыт
+                with self.lock:
+                    self.loops.pop(loop, None)
+
+    def fan_out(self, queues, frame):
+        for queue in queues:
+            if queue.full():
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RELOAD_FRAME)
+            else:
+                queue.put_nowait(frame)
+
+    @property
+    def subscribers(self):
+        with self.lock:
+            return sum(len(queues) for queues in self.loops.values())
+
+
+broadcaster = Broadcaster()
+
+
+def publish_task(event, task_id, status=None, worker_id=None):
+    # Событие уходит только после коммита: откатившееся изменение клиенты не увидят
+    frame = sse_frame(event, {"id": task_id, "status": status, "worker": worker_id})
+    transaction.on_commit(lambda: broadcaster.publish(frame))
+
+
+def publish_reload():
+    transaction.on_commit(lambda: broadcaster.publish(RELOAD_FRAME))
+
+
+def task_event(old, new):
+    # old и new - (status, worker_id) до и после сохранения; old is None для новой задачи
+    if old is None:
+        return EVENT_CREATED
+    if new[0] == Task.Status.COMPLETED and old[0] != Task.Status.COMPLETED:
+        return EVENT_COMPLETED
+    if new[0] == Task.Status.WORKING and old[0] != Task.Status.WORKING:
+        return EVENT_CLAIMED
+    return EVENT_UPDATED
+
+
+async def event_stream(broadcaster=broadcaster, heartbeat=HEARTBEAT):
+    queue = broadcaster.subscribe()
+    try:
+        # Клиент переподключается сам; retry - пауза перед переподключением в мс
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+    finally:
+        broadcaster.unsubscribe(queue)
+
+
+# Заголовки ответа потока событий: без кэширования и без буферизации в nginx
+STREAM_HEADERS = [
+    (b"content-type", b"text/event-stream"),
+    (b"cache-control", b"no-cache"),
+    (b"x-accel-buffering", b"no"),
+]
+
+
+def session_user(session_key):
+    # Пользователь по ключу сессии - как AuthenticationMiddleware, но без запроса
+    # Django. Соединения с базой закрываются, как в конце обычного запроса
+    # (request_finished): открытый поток событий соединение не держит
+    close_old_connections()
+    try:
+        request = SimpleNamespace(session=import_module(settings.SESSION_ENGINE).SessionStore(session_key))
+        return get_user(request)
+    finally:
+        close_old_connections()
+
+
+async def stream_events(receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": STREAM_HEADERS})
+
+    async def pump():
+        async for chunk in event_stream():
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+    sender = asyncio.ensure_future(pump())
+    try:
+        # Клиент отключился - поток событий закрывается и отписывается
+        while (await receive())["type"] != "http.disconnect":
+            pass
+    finally:
+        sender.cancel()
+        with contextlib.suppress(asyncio.CancelledError, OSError):
+            await sender
+
+
+def events_path():
+    # Путь потока событий без префикса приложения (SCRIPT_NAME / root_path)
+    return "/" + reverse("tasksystem:board_events").removeprefix(get_script_prefix())
+
+
+def events_endpoint(application):
+    # ASGI-обертка над приложением Django: поток событий доски обслуживается
+    # здесь, мимо обработчика Django. Тот дает каждому запросу свой поток для
+    # sync_to_async (ThreadSensitiveContext), и открытый поток событий держал бы
+    # этот поток до отключения клиента. Здесь пользователь загружается через
+    # общий поток sync_to_async, после чего соединение стоит очередь и
+    # приостановленную корутину. Middleware Django (метрики, профилирование)
+    # поток событий не проходит
+    async def app(scope, receive, send):
+        if scope["type"] != "http" or scope["path"].removeprefix(scope.get("root_path", "")) != events_path():
+            return await application(scope, receive, send)
+        cookies = parse_cookie(dict(scope["headers"]).get(b"cookie", b"").decode("latin-1"))
+        user = await sync_to_async(session_user)(cookies.get(settings.SESSION_COOKIE_NAME))
+        # Как alogin_required и role_required у board_events; EventSource на
+        # ответ не 200 не переподключается
+        if not user.is_authenticated or user.role not in user.Role.values:
+            await send({"type": "http.response.start", "status": 403, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await stream_events(receive, send)
+    return app
@@ -0,0 +1,68 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from tasksystem.contention import hammer
+from tasksystem.models import Task
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет взятие, завершение и выдачу задач под конкуренцией: много потоков "
+        "одновременно берут одни и те же задачи. Работает на временной тестовой базе"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16, help="Исполнителей (потоков)")
+        parser.add_argument("--attempts", type=int, default=25, help="Попыток на поток за раунд")
+        parser.add_argument("--rounds", type=int, default=5, help="Раундов, в каждом - новая задача")
+
+    def handle(self, *args, **options):
+        # Потокам нужны закоммиченные данные, поэтому не откат транзакции, как в
+        # benchmark_slugs, а отдельная база: она создается и удаляется, как в тестах
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.run(options["threads"], options["attempts"], options["rounds"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run(self, threads, attempts, rounds):
+        User = get_user_model()
+        manager = User.objects.create_user("manager", "manager@tms.local", role=User.Role.MANAGER)
+        workers = [
+            User.objects.create_user(f"worker{i}", f"worker{i}@tms.local", role=User.Role.WORKER)
+            for i in range(threads)
+        ]
+
+        def new_task(worker=None):
+            return Task.objects.create(title="Задача", description="Замер", author=manager, worker=worker)
+
+        def claim():
+            task = new_task()
+            return hammer(lambda worker: Task.objects.claim(task.pk, worker), workers, attempts)
+
+        def complete():
+            task = new_task(workers[0])
+            # Одну задачу одновременно завершает ее исполнитель из нескольких вкладок
+            return hammer(
+                lambda worker: Task.objects.complete(task.pk, worker, manager.pk), [workers[0]] * threads, attempts,
+            )
+
+        def dispatch():
+            # Свободных задач вдвое меньше попыток: часть попыток остается без задачи
+            for _ in range(threads * attempts // 2):
+                new_task()
+            return hammer(Task.objects.dispatch, workers, attempts)
+
+        for name, scenario in [("claim", claim), ("complete", complete), ("dispatch", dispatch)]:
+            tries = wins = errors = 0
+            seconds = 0.0
+            for _ in range(rounds):
+                won, failed, elapsed = scenario()
+                tries += threads * attempts
+                wins += len(won)
+                errors += len(failed)
+                seconds += elapsed
+            self.stdout.write(
+                f"{name:10} {tries / seconds:8.0f} попыток/с, успешных: {wins}, ошибок: {errors}"
+            )
@@ -0,0 +1,97 @@
+import multiprocessing
+import sqlite3
+import statistics
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.sqlite3.base import FORMAT_QMARK_REGEX
+
+from tasksystem.dbprofile import connect, run_worker
+from tasksystem.views import board_tasks
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает профили SQLite (DATABASE_PROFILES) под нагрузкой из нескольких процессов: "
+        "чтения доски и записи как у взятия/завершения задач. Работает на копии базы"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profile", action="append", dest="profiles", help="Профиль (можно несколько раз; по умолчанию все)")
+        parser.add_argument("--processes", type=int, default=8, help="Процессов нагрузки")
+        parser.add_argument("--seconds", type=float, default=10, help="Длительность прогона каждого профиля")
+        parser.add_argument("--write-ratio", type=float, default=0.2, help="Доля записей среди операций")
+        parser.add_argument("--tasks", type=int, default=5000, help="Сколько задач добавить в копию базы")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Команда сравнивает профили SQLite")
+        profiles = options["profiles"] or list(settings.DATABASE_PROFILES)
+        unknown = set(profiles) - set(settings.DATABASE_PROFILES)
+        if unknown:
+            raise CommandError(f"Неизвестный профиль: {', '.join(sorted(unknown))}")
+        user_id = get_user_model().objects.order_by("pk").values_list("pk", flat=True).first()
+        if user_id is None:
+            raise CommandError("Нужен хотя бы один пользователь: он будет автором задач")
+
+        # Тот же запрос, что у доски, в стиле параметров модуля sqlite3. Task.Status
+        # в параметрах потянул бы в дочерние процессы импорт моделей
+        read_sql, read_params = board_tasks()[:30].query.sql_with_params()
+        read_sql = FORMAT_QMARK_REGEX.sub("?", read_sql).replace("%%", "%")
+        read_params = [getattr(param, "value", param) for param in read_params]
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in profiles:
+                path = str(Path(tmp) / f"{name}.sqlite3")
+                task_ids = self.prepare(path, user_id, options["tasks"])
+                profile = settings.DATABASE_PROFILES[name]
+                # Режим журнала хранится в файле, поэтому он задается на копии до прогона
+                with connect(path, profile):
+                    pass
+                args = [
+                    (path, profile, read_sql, read_params, task_ids, user_id,
+                     options["seconds"], options["write_ratio"], seed)
+                    for seed in range(options["processes"])
+                ]
+                # spawn: дочерние процессы не наследуют соединения и потоки родителя
+                with multiprocessing.get_context("spawn").Pool(options["processes"]) as pool:
+                    results = pool.starmap(run_worker, args)
+                self.report(name, results, options["seconds"])
+
+    def prepare(self, path, user_id, count):
+        # Копия рабочей базы в режиме журнала отката и синтетические задачи
+        connection.ensure_connection()
+        target = sqlite3.connect(path, isolation_level=None)
+        connection.connection.backup(target)
+        target.execute("PRAGMA journal_mode = DELETE")
+        target.execute("BEGIN")
+        target.executemany(
+            "INSERT INTO tasksystem_task (title, description, status, slug, author_id, worker_id, "
+            "time_create, time_update, change_seq) "
+            "VALUES (?, 'Нагрузочный тест', 'PD', ?, ?, NULL, datetime('now'), datetime('now'), 0)",
+            [(f"Нагрузка {i}", f"benchmark-{i}", user_id) for i in range(count)],
+        )
+        target.execute("INSERT OR IGNORE INTO tasksystem_counter (name, value) VALUES ('benchmark', 0)")
+        target.execute("COMMIT")
+        task_ids = [row[0] for row in target.execute("SELECT id FROM tasksystem_task WHERE slug LIKE 'benchmark-%'")]
+        target.close()
+        return task_ids
+
+    def report(self, name, results, seconds):
+        reads = [x for r in results for x in r["reads"]]
+        writes = [x for r in results for x in r["writes"]]
+        locked = sum(r["locked"] for r in results)
+        lock_wait = sum(r["lock_wait"] for r in results)
+        self.stdout.write(name)
+        self.stdout.write(f"  чтения: {len(reads) / seconds:8.1f} оп/с, {self.latency(reads)}")
+        self.stdout.write(f"  записи: {len(writes) / seconds:8.1f} оп/с, {self.latency(writes)}")
+        self.stdout.write(f"  database is locked: {locked}, ожидание блокировок до ошибки: {lock_wait:.1f} с")
+
+    def latency(self, samples):
+        if len(samples) < 2:
+            return "нет данных"
+        percentiles = statistics.quantiles(samples, n=100)
+        return f"p50 {percentiles[49] * 1e3:6.1f} мс, p99 {percentiles[98] * 1e3:6.1f} мс, max {max(samples) * 1e3:6.1f} мс"
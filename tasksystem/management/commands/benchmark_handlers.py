@@ -0,0 +1,105 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from tasksystem.models import Task
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает запросы/с и задержки страниц под WSGI- и ASGI-обработчиком Django. "
+        "Запросы идут в процессе через тестовые клиенты, без HTTP-сервера, к рабочей базе"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", help="От чьего имени запрашивать страницы")
+        parser.add_argument("--requests", type=int, default=500, help="Запросов на каждый обработчик")
+        parser.add_argument("--concurrency", type=int, default=16, help="Одновременных запросов")
+        parser.add_argument("--url", action="append", dest="urls", help="Адрес страницы (можно несколько раз)")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options["username"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"Пользователь '{options['username']}' не найден")
+
+        urls = options["urls"] or self.default_urls(user)
+        # Тестовые клиенты ходят на хост testserver
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, "testserver"]
+        login = Client()
+        login.force_login(user)
+        try:
+            for url in urls:
+                self.stdout.write(url)
+                for name, run in [("WSGI", self.run_wsgi), ("ASGI", self.run_asgi)]:
+                    self.report(name, *run(url, login.cookies, options["requests"], options["concurrency"]))
+        finally:
+            login.logout()
+
+    def default_urls(self, user):
+        urls = [reverse("tasksystem:content")]
+        task = Task.objects.order_by("-id").first()
+        if task is not None:
+            urls.append(task.get_absolute_url())
+        if user.role == user.Role.WORKER:
+            urls.append(reverse("tasksystem:required_tasks"))
+        if user.role == user.Role.ADMIN:
+            urls.append(reverse("tasksystem:dashboard"))
+        return urls
+
+    def run_wsgi(self, url, cookies, n, concurrency):
+        # Потоки, как у многопоточного WSGI-сервера
+        def worker(count):
+            client = Client()
+            client.cookies = cookies
+            latencies = []
+            try:
+                for _ in range(count):
+                    started = time.perf_counter()
+                    client.get(url)
+                    latencies.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+            return latencies
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(worker, self.split(n, concurrency)))
+        return time.perf_counter() - started, [x for r in results for x in r]
+
+    def run_asgi(self, url, cookies, n, concurrency):
+        # Корутины в одном цикле событий, как у ASGI-сервера
+        async def worker(count):
+            client = AsyncClient()
+            client.cookies = cookies
+            latencies = []
+            for _ in range(count):
+                started = time.perf_counter()
+                await client.get(url)
+                latencies.append(time.perf_counter() - started)
+            return latencies
+
+        async def main():
+            return await asyncio.gather(*(worker(count) for count in self.split(n, concurrency)))
+
+        started = time.perf_counter()
+        results = asyncio.run(main())
+        return time.perf_counter() - started, [x for r in results for x in r]
+
+    def split(self, n, parts):
+        return [n // parts + (i < n % parts) for i in range(parts)]
+
+    def report(self, name, seconds, latencies):
+        percentiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f"  {name}: {len(latencies) / seconds:8.1f} запросов/с, "
+            f"p50 {percentiles[49] * 1e3:6.1f} мс, p99 {percentiles[98] * 1e3:6.1f} мс"
+        )
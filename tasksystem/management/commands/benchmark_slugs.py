@@ -0,0 +1,82 @@
+import timeit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.template.defaultfilters import slugify as django_slugify
+from django.test.utils import CaptureQueriesContext
+from django_extensions.db.fields import AutoSlugField
+from slugify import slugify as python_slugify
+
+from tasksystem.models import Task
+from tasksystem.slugs import alphabet, slugify
+
+TITLES = [
+    "Исправить баг",
+    "Обновить документацию по API",
+    "Подготовить отчёт за квартал",
+    "Щёлкнуть ЭТОТ переключатель",
+    "Fix flaky test in CI",
+]
+
+
+def dict_loop_slugify(s):
+    # Прежняя реализация tasksystem.utils.slugify
+    return django_slugify("".join(alphabet.get(w, w) for w in s.lower()))
+
+
+class Command(BaseCommand):
+    help = "Сравнивает скорость транслитерации и подбора уникального слага со старыми способами"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=20000, help="Повторов для транслитерации")
+        parser.add_argument(
+            "--collisions",
+            type=int,
+            default=90,
+            help="Сколько задач с одинаковым заголовком создать (AutoSlugField ограничен 100 попытками)",
+        )
+
+    def handle(self, *args, **options):
+        number = options["number"]
+        uncached = slugify.__wrapped__
+        for name, func in [
+            ("dict loop (старый utils.slugify)", dict_loop_slugify),
+            ("python-slugify (старый Task.title_slug)", python_slugify),
+            ("translate, без кэша", uncached),
+            ("translate, с LRU-кэшем", slugify),
+        ]:
+            seconds = timeit.timeit(lambda: [func(t) for t in TITLES], number=number)
+            per_call = seconds / (number * len(TITLES)) * 1e6
+            self.stdout.write(f"{name:45} {per_call:8.2f} мкс/заголовок")
+
+        self.compare_collisions(options["collisions"])
+
+    def compare_collisions(self, n):
+        author = get_user_model().objects.order_by("pk").first()
+        if author is None:
+            self.stdout.write("Нет пользователей - сравнение подбора слагов пропущено")
+            return
+
+        field = Task._meta.get_field("slug")
+        title = "Задача для замера слагов"
+        for name, create_slug in [
+            ("AutoSlugField (перебор суффиксов)", lambda task: AutoSlugField.create_slug(field, task, True)),
+            ("TaskSlugField (один запрос)", lambda task: field.create_slug(task, True)),
+        ]:
+            # Все созданные задачи откатываются
+            with transaction.atomic():
+                queries = seconds = 0
+                for _ in range(n):
+                    task = Task(title=title, description="-", author=author)
+                    with CaptureQueriesContext(connection) as ctx:
+                        started = timeit.default_timer()
+                        create_slug(task)
+                        seconds += timeit.default_timer() - started
+                    queries += len(ctx.captured_queries)
+                    task._slug_allocated = True
+                    task.save()
+                transaction.set_rollback(True)
+            self.stdout.write(
+                f"{name:45} {seconds / n * 1e3:8.2f} мс/задачу, запросов: {queries / n:.1f} на задачу ({n} задач)"
+            )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from tasksystem.query_plans import checked_queries, explain, plan_problems
+
+
+class Command(BaseCommand):
+    help = "Проверяет EXPLAIN QUERY PLAN запросов списков задач: без полного сканирования и лишних сортировок"
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Проверка планов поддерживается только для SQLite")
+
+        failed = []
+        for name, (queryset, allow_sort) in checked_queries().items():
+            plan = explain(queryset)
+            problems = plan_problems(plan, allow_sort)
+            style = self.style.ERROR if problems else self.style.SUCCESS
+            self.stdout.write(style(name))
+            for line in plan:
+                self.stdout.write(f"    {line}")
+            if problems:
+                failed.append(name)
+
+        if failed:
+            raise CommandError(f"Планы запросов деградировали: {', '.join(failed)}")
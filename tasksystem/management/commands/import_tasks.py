@@ -0,0 +1,59 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from tasksystem.importer import IMPORT_BATCH_SIZE, IMPORT_FORMATS, TaskImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = "Импортирует задачи из CSV или NDJSON (поля: title, description, author, worker, status)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу")
+        parser.add_argument(
+            "--format",
+            choices=IMPORT_FORMATS,
+            help="Формат файла (по умолчанию - по расширению)",
+        )
+        parser.add_argument(
+            "--author",
+            help="Логин автора для строк без поля author",
+        )
+        parser.add_argument(
+            "--auto-assign",
+            action="store_true",
+            help="Назначать строки без исполнителя наименее загруженным исполнителям",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=IMPORT_BATCH_SIZE,
+            help="Количество строк в одной пачке",
+        )
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or os.path.splitext(options["path"])[1].lstrip(".").lower()
+        if fmt == "jsonl":
+            fmt = "ndjson"
+        if fmt not in IMPORT_FORMATS:
+            raise CommandError(f"Неизвестный формат: {fmt}")
+
+        author = None
+        if options["author"]:
+            try:
+                author = get_user_model().objects.get(username=options["author"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Пользователь '{options['author']}' не найден")
+
+        importer = TaskImporter(
+            default_author=author,
+            auto_assign=options["auto_assign"],
+            batch_size=options["batch_size"],
+        )
+        with open(options["path"], encoding="utf-8-sig", newline="") as f:
+            importer.run(read_rows(f, fmt))
+
+        for line_no, error in importer.errors:
+            self.stderr.write(f"строка {line_no}: {error}")
+        self.stdout.write(self.style.SUCCESS(f"Создано задач: {importer.created}, ошибок: {len(importer.errors)}"))
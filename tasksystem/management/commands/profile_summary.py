@@ -0,0 +1,70 @@
+import pstats
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from tasksystem.profiling import ENGINE_CPROFILE, ENGINE_SAMPLER, SUFFIXES
+
+
+class Command(BaseCommand):
+    help = (
+        "Сводка по сохраненным профилям запросов (tasksystem/profiling.py): самые горячие "
+        "функции по всем профилям cProfile и по всем стекам сэмплера"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=settings.PROFILE_DIR, help="Каталог профилей (по умолчанию PROFILE_DIR)")
+        parser.add_argument("--view", help="Только маршруты, в имени которых есть эта строка (например, tasksystem.content)")
+        parser.add_argument("--limit", type=int, default=20, help="Сколько функций показать")
+
+    def handle(self, *args, **options):
+        directory = Path(options["dir"])
+        if not directory.is_dir():
+            raise CommandError(f"Каталог профилей {directory} не найден")
+        views = sorted(
+            path for path in directory.iterdir()
+            if path.is_dir() and (not options["view"] or options["view"] in path.name)
+        )
+        prof = [path for view in views for path in view.glob(f"*{SUFFIXES[ENGINE_CPROFILE]}")]
+        collapsed = [path for view in views for path in view.glob(f"*{SUFFIXES[ENGINE_SAMPLER]}")]
+        if not prof and not collapsed:
+            raise CommandError("Профилей не найдено")
+
+        for view in views:
+            self.stdout.write(f"{view.name}: {sum(path.parent == view for path in prof + collapsed)} профилей")
+        if prof:
+            self.summarize_cprofile(prof, options["limit"])
+        if collapsed:
+            self.summarize_samples(collapsed, options["limit"])
+
+    def summarize_cprofile(self, paths, limit):
+        stats = pstats.Stats(*map(str, paths))
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"\ncProfile, {len(paths)} профилей, {stats.total_tt:.3f} с: собственное время / с вложенными / вызовов"
+        ))
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in rows:
+            self.stdout.write(f"{tottime:9.4f} с {cumtime:9.4f} с {calls:9d}  {name} ({filename}:{line})")
+
+    def summarize_samples(self, paths, limit):
+        # Собственные отсчеты - функция на вершине стека, полные - функция где-то в
+        # стеке (рекурсивная считается в стеке один раз)
+        own, total, samples = Counter(), Counter(), 0
+        for path in paths:
+            for line in path.read_text().splitlines():
+                stack, _, count = line.rpartition(" ")
+                if not stack:
+                    continue
+                count = int(count)
+                frames = stack.split(";")
+                samples += count
+                own[frames[-1]] += count
+                for frame in set(frames):
+                    total[frame] += count
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"\nСэмплер, {len(paths)} профилей, {samples} отсчетов: доля собственных / с вложенными"
+        ))
+        for frame, count in own.most_common(limit):
+            self.stdout.write(f"{count / samples:8.1%} {total[frame] / samples:8.1%}  {frame}")
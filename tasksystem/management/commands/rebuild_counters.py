@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tasksystem.assignment import loads
+from tasksystem.counters import PAGES_VERSION, apply_deltas, compute_counters
+from tasksystem.models import Counter
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счетчики меню из таблиц задач и пользователей и сообщает о расхождениях"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только показать расхождения, не исправляя их",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            actual = compute_counters()
+            # Версия страниц не пересчитывается: это не количество, а номер
+            counters = Counter.objects.exclude(name=PAGES_VERSION)
+            stored = dict(counters.select_for_update().values_list("name", "value"))
+
+            drift = {
+                name: (stored.get(name, 0), actual.get(name, 0))
+                for name in stored.keys() | actual.keys()
+                if stored.get(name, 0) != actual.get(name, 0)
+            }
+            for name, (old, new) in sorted(drift.items()):
+                self.stdout.write(f"{name}: {old} -> {new}")
+
+            if not options["check"]:
+                counters.delete()
+                Counter.objects.bulk_create(
+                    Counter(name=name, value=value) for name, value in actual.items() if value
+                )
+                loads.invalidate()
+                if drift:
+                    # Меню показывает другие числа - закэшированные страницы устарели
+                    apply_deltas({PAGES_VERSION: 1})
+
+        if drift:
+            self.stdout.write(self.style.WARNING(f"Расхождений: {len(drift)}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Счетчики совпадают"))
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+
+from tasksystem.search import available, check_index, create_index, optimize_index
+
+
+class Command(BaseCommand):
+    help = "Перестраивает полнотекстовый индекс задач (FTS5) по таблице задач"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Только проверить, что индекс совпадает с таблицей задач",
+        )
+        parser.add_argument(
+            "--optimize",
+            action="store_true",
+            help="После перестроения слить сегменты индекса в один",
+        )
+
+    def handle(self, *args, **options):
+        if not available():
+            raise CommandError("Полнотекстовый индекс есть только в SQLite")
+
+        if options["check"]:
+            try:
+                check_index(connection)
+            except DatabaseError as e:
+                raise CommandError(f"Индекс расходится с таблицей задач: {e}")
+            self.stdout.write(self.style.SUCCESS("Индекс совпадает с таблицей задач"))
+            return
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            # Заодно восстанавливает таблицу и триггеры, если их удалили
+            create_index(connection)
+        if options["optimize"]:
+            optimize_index(connection)
+        self.stdout.write(self.style.SUCCESS(f"Индекс перестроен за {time.perf_counter() - started:.1f} с"))
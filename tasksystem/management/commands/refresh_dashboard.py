@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tasksystem.dashboard import refresh_snapshot
+
+
+class Command(BaseCommand):
+    help = "Обновляет снимок статистики дэшборда по задачам, измененным с прошлого запуска"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Пересчитать статистику исполнителей целиком (после массовых удалений и т.п.)",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Повторять обновление каждые N секунд, не завершая процесс",
+        )
+
+    def handle(self, *args, **options):
+        full = options["full"]
+        while True:
+            snapshot = refresh_snapshot(full=full)
+            self.stdout.write(self.style.SUCCESS(f"Статистика обновлена: {snapshot.refreshed_at:%d.%m.%Y %H:%M:%S}"))
+            if not options["interval"]:
+                break
+            full = False
+            time.sleep(options["interval"])
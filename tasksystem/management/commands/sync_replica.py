@@ -0,0 +1,57 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from tasksystem.changes import current_seq
+
+
+class Command(BaseCommand):
+    help = (
+        "Обновляет реплику для чтения (TMS_REPLICA) копией основной базы. "
+        "Локальная замена репликации: копия снимается через backup API SQLite"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0,
+            help="Повторять копирование каждые N секунд, не завершая процесс",
+        )
+
+    def handle(self, *args, **options):
+        alias = settings.REPLICA_DATABASE
+        if alias is None:
+            raise CommandError("Реплика не настроена: укажите путь к ее файлу в переменной TMS_REPLICA")
+        source, replica = connections[DEFAULT_DB_ALIAS], connections[alias]
+        if source.vendor != "sqlite" or replica.vendor != "sqlite":
+            raise CommandError("Команда копирует только базы SQLite")
+
+        while True:
+            started = time.perf_counter()
+            self.sync(source, replica)
+            self.stdout.write(self.style.SUCCESS(
+                f"Реплика обновлена за {time.perf_counter() - started:.2f} с, "
+                f"номер изменения {current_seq(using=alias)}"
+            ))
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
+
+    def sync(self, source, replica):
+        # Копия пишется прямо в файл реплики одним шагом backup(): читатели
+        # реплики ждут его окончания (busy timeout) и видят либо старую копию,
+        # либо новую целиком. Основная база блокируется только на чтение
+        source.ensure_connection()
+        replica.close()
+        target = sqlite3.connect(
+            replica.settings_dict["NAME"],
+            timeout=replica.settings_dict["OPTIONS"].get("timeout", 5),
+        )
+        try:
+            source.connection.backup(target)
+        finally:
+            target.close()
@@ -0,0 +1,281 @@
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import sync_and_async_middleware
+
+# Границы корзин гистограмм длительности, в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Семейство -> (имя метрики, тип, описание, имена меток). Значения гистограммы -
+# счетчики по корзинам (последняя - +Inf) и сумма, у счетчика - одно число
+FAMILIES = {
+    "requests": ("tms_http_requests_total", "counter", "Запросы по представлениям", ("view", "method", "status")),
+    "latency": ("tms_http_request_duration_seconds", "histogram", "Время ответа представления", ("view",)),
+    "response_bytes": ("tms_http_response_bytes_total", "counter", "Размер тела ответов", ("view",)),
+    "queries": ("tms_db_queries_total", "counter", "Запросы к базе", ("view",)),
+    "query_seconds": ("tms_db_query_duration_seconds_total", "counter", "Время запросов к базе", ("view",)),
+    "functions": ("tms_function_duration_seconds", "histogram", "Время работы функций под @timed", ("function",)),
+    "card_cache": ("tms_card_cache_total", "counter", "Карточки задач из кэша и отрендеренные заново", ("result",)),
+}
+
+
+def empty_histogram():
+    return [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+
+
+def observe(histogram, seconds):
+    # Значение, равное границе, попадает в ее корзину (le - "меньше или равно")
+    histogram[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    histogram[-1] += seconds
+
+
+class QueryCounter:
+    # Число и суммарное время запросов к базе за один запрос пользователя
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+# Счетчик запросов текущего запроса пользователя. Контекст копируется в потоки
+# sync_to_async, поэтому запросы async-представлений, которые идут через
+# соединения этих потоков, попадают в тот же счетчик
+_queries = ContextVar("metrics_queries", default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    queries = _queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    return queries(execute, sql, params, many, context)
+
+
+def install_query_counter(connection):
+    # Обертка ставится один раз на соединение (сигнал connection_created,
+    # tasksystem/signals.py); при переподключении того же соединения - не повторно
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+class Registry:
+    # Метрики этого процесса. Запись - одна блокировка и несколько сложений, без
+    # обращений к кэшу или базе. Если задан METRICS_DIR, процесс раз в
+    # METRICS_FLUSH_SECONDS сохраняет свои значения в файл этого каталога, а
+    # выдача метрик складывает файлы всех процессов
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.families = {name: {} for name in FAMILIES}
+        # Файл процесса: pid повторяется после перезапуска, поэтому к нему
+        # добавлено время запуска - счетчики прежнего процесса не затираются
+        self.name = f"{os.getpid()}-{time.time_ns()}.json"
+        self.flushed_at = time.monotonic()
+
+    def record_request(self, view, method, status, seconds, queries, size):
+        with self.lock:
+            self.families["requests"].setdefault((view, method, str(status)), [0])[0] += 1
+            observe(self.families["latency"].setdefault((view,), empty_histogram()), seconds)
+            self.families["queries"].setdefault((view,), [0])[0] += queries.count
+            self.families["query_seconds"].setdefault((view,), [0.0])[0] += queries.seconds
+            if size is not None:
+                self.families["response_bytes"].setdefault((view,), [0])[0] += size
+        self.maybe_flush()
+
+    def record_function(self, name, seconds):
+        with self.lock:
+            observe(self.families["functions"].setdefault((name,), empty_histogram()), seconds)
+
+    def record_cards(self, hits, misses):
+        with self.lock:
+            for result, value in (("hit", hits), ("miss", misses)):
+                if value:
+                    self.families["card_cache"].setdefault((result,), [0])[0] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                family: [[list(labels), list(values)] for labels, values in series.items()]
+                for family, series in self.families.items()
+            }
+
+    def maybe_flush(self):
+        if settings.METRICS_DIR and time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+        self.flushed_at = time.monotonic()
+        path = Path(directory) / self.name
+        # Через временный файл: читающий процесс не увидит недописанный JSON
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp, path)
+
+    def collect(self):
+        # Значения для выдачи: свои или сумма по файлам всех процессов
+        directory = settings.METRICS_DIR
+        if not directory:
+            return self.snapshot()
+        self.flush()
+        snapshots = []
+        for path in Path(directory).glob("*.json"):
+            try:
+                snapshots.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                # Файл удален или заменен во время чтения
+                continue
+        return merge(snapshots)
+
+
+def merge(snapshots):
+    merged = {name: {} for name in FAMILIES}
+    for snapshot in snapshots:
+        for family, series in snapshot.items():
+            if family not in merged:
+                continue
+            for labels, values in series:
+                current = merged[family].setdefault(tuple(labels), [0] * len(values))
+                for i, value in enumerate(values):
+                    current[i] += value
+    return {family: [[list(labels), values] for labels, values in series.items()] for family, series in merged.items()}
+
+
+registry = Registry()
+# Последние значения процесса попадают в каталог и при штатной остановке
+atexit.register(registry.flush)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(snapshot):
+    # Текстовый формат Prometheus (exposition format 0.0.4)
+    lines = []
+    for family, (name, kind, help_text, label_names) in FAMILIES.items():
+        series = sorted(snapshot.get(family, []))
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for labels, values in series:
+            if kind != "histogram":
+                lines.append(f"{name}{format_labels(label_names, labels)} {format_number(values[0])}")
+                continue
+            cumulative = 0
+            for bound, count in zip([*LATENCY_BUCKETS, "+Inf"], values[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(label_names, labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(label_names, labels)} {format_number(values[-1])}")
+            lines.append(f"{name}_count{format_labels(label_names, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def token_allowed(request):
+    # Prometheus не умеет входить в систему, поэтому кроме сессии администратора
+    # выдача метрик принимает заголовок Authorization: Bearer <METRICS_TOKEN>
+    token = settings.METRICS_TOKEN
+    return bool(token) and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}")
+
+
+def view_name(request):
+    # Метка - имя маршрута, а не путь: /task_detail/<slug>/ дает одну серию, а не тысячи
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "<unresolved>"
+    return match.view_name or match._func_path
+
+
+def response_size(response):
+    # У потоковых ответов (выгрузка, SSE) размер заранее неизвестен
+    if response.streaming:
+        return None
+    return len(response.content)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    # Стоит первой в MIDDLEWARE: время и запросы к базе включают сессию и
+    # пользователя. У потоковых ответов время - до первого байта, а запросы,
+    # выполненные при отдаче тела, не учитываются
+    def start():
+        queries = QueryCounter()
+        return _queries.set(queries), queries, time.perf_counter()
+
+    def finish(request, response, token, queries, started):
+        seconds = time.perf_counter() - started
+        _queries.reset(token)
+        registry.record_request(
+            view_name(request), request.method, response.status_code, seconds, queries, response_size(response),
+        )
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token, queries, started = start()
+            try:
+                response = await get_response(request)
+            except BaseException:
+                _queries.reset(token)
+                raise
+            finish(request, response, token, queries, started)
+            return response
+    else:
+        def middleware(request):
+            token, queries, started = start()
+            try:
+                response = get_response(request)
+            except BaseException:
+                _queries.reset(token)
+                raise
+            finish(request, response, token, queries, started)
+            return response
+    return middleware
+
+
+def timed(name):
+    # Гистограмма времени работы функции (tms_function_duration_seconds{function=name})
+    def decorator(func):
+        if iscoroutinefunction(func):
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    registry.record_function(name, time.perf_counter() - started)
+            return markcoroutinefunction(wraps(func)(wrapper))
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                registry.record_function(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasksystem', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='task',
+            options={'ordering': ['-time_update'], 'verbose_name': 'Задача', 'verbose_name_plural': 'Задачи'},
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', '-time_update', '-id'], name='task_board_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_counters(apps, schema_editor):
+    from tasksystem.counters import compute_counters
+
+    Counter = apps.get_model("tasksystem", "Counter")
+    counters = compute_counters(apps.get_model("tasksystem", "Task"), apps.get_model(settings.AUTH_USER_MODEL))
+    Counter.objects.bulk_create(Counter(name=name, value=value) for name, value in counters.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasksystem', '0002_task_board_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='Ключ')),
+                ('value', models.IntegerField(default=0, verbose_name='Значение')),
+            ],
+            options={
+                'verbose_name': 'Счетчик',
+                'verbose_name_plural': 'Счетчики',
+            },
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0006_alter_user_first_name_alter_user_last_name_and_more'),
+        ('tasksystem', '0003_counter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_users', models.IntegerField(default=0, verbose_name='Всего пользователей')),
+                ('total_tasks', models.IntegerField(default=0, verbose_name='Всего задач')),
+                ('admins', models.IntegerField(default=0, verbose_name='Администраторы')),
+                ('managers', models.IntegerField(default=0, verbose_name='Менеджеры')),
+                ('workers', models.IntegerField(default=0, verbose_name='Исполнители')),
+                ('readers', models.IntegerField(default=0, verbose_name='Читатели')),
+                ('top_worker_completed', models.IntegerField(default=0, verbose_name='Выполнено лучшим исполнителем')),
+                ('refreshed_at', models.DateTimeField(verbose_name='Актуально на')),
+                ('watermark', models.DateTimeField(verbose_name='Обработано до')),
+                ('top_worker', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Лучший исполнитель')),
+            ],
+            options={
+                'verbose_name': 'Снимок статистики',
+                'verbose_name_plural': 'Снимки статистики',
+            },
+        ),
+        migrations.CreateModel(
+            name='WorkerStat',
+            fields=[
+                ('worker', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stat', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Исполнитель')),
+                ('completed_tasks', models.IntegerField(default=0, verbose_name='Выполнено задач')),
+            ],
+            options={
+                'verbose_name': 'Статистика исполнителя',
+                'verbose_name_plural': 'Статистика исполнителей',
+                'indexes': [models.Index(fields=['-completed_tasks'], name='workerstat_completed_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:17
+
+import tasksystem.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasksystem', '0005_task_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='task',
+            name='slug',
+            field=tasksystem.fields.TaskSlugField(blank=True, editable=False, max_length=200, overwrite=True, populate_from='title_slug', unique=True, verbose_name='Слаг'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from tasksystem.search import create_index
+
+    if schema_editor.connection.vendor == "sqlite":
+        create_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from tasksystem.search import drop_index
+
+    if schema_editor.connection.vendor == "sqlite":
+        drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasksystem', '0007_task_queue_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.6 on 2026-10-18 19:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def install_change_feed(apps, schema_editor):
+    from tasksystem import changes, search
+
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    # Номера изменений для уже существующих задач - до установки триггеров
+    schema_editor.execute("UPDATE tasksystem_task SET change_seq = id")
+    changes.create_triggers(schema_editor.connection)
+    # AddField пересоздает таблицу задач, и триггеры поискового индекса удаляются вместе со старой
+    search.create_index(schema_editor.connection)
+
+
+def remove_change_feed(apps, schema_editor):
+    from tasksystem import changes
+
+    if schema_editor.connection.vendor == "sqlite":
+        changes.drop_triggers(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasksystem', '0008_task_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskTombstone',
+            fields=[
+                ('task_id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='Задача')),
+                ('change_seq', models.BigIntegerField(unique=True, verbose_name='Номер изменения')),
+                ('deleted_at', models.DateTimeField(verbose_name='Время удаления')),
+            ],
+            options={
+                'verbose_name': 'Удаленная задача',
+                'verbose_name_plural': 'Удаленные задачи',
+            },
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='change_seq',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Номер изменения'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['change_seq'], name='task_change_idx'),
+        ),
+        migrations.RunPython(install_change_feed, remove_change_feed),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def recreate_update_trigger(apps, schema_editor):
+    from tasksystem import changes
+
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    # Триггер AFTER UPDATE больше не выдает номер повторно, если в строку записали старый
+    schema_editor.execute("DROP TRIGGER IF EXISTS tasksystem_task_seq_au")
+    changes.create_triggers(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasksystem', '0009_task_change_feed'),
+    ]
+
+    operations = [
+        migrations.RunPython(recreate_update_trigger, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,83 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
 from django.urls import reverse
-from django_extensions.db.fields import AutoSlugField
+from django.utils import timezone
 
-from slugify import slugify
+from tasksystem.fields import TaskSlugField
+from tasksystem.slugs import slugify
+
+
+class TaskQuerySet(models.QuerySet):
+    # Взятие и завершение задачи - условный UPDATE (compare-and-set) одним запросом:
+    # побеждает только тот, чье условие еще выполняется, и меняются только нужные колонки.
+    # update() не вызывает сигналы, поэтому счетчики меню и события доски - здесь же, в той же транзакции
+
+    def claim(self, pk, worker):
+        from tasksystem import counters, live
+
+        with transaction.atomic():
+            won = self.filter(pk=pk, worker__isnull=True, status=Task.Status.PENDING).update(
+                worker=worker, status=Task.Status.WORKING, time_update=timezone.now(),
+            )
+            if won:
+                counters.apply_deltas({counters.working_key(worker.pk): 1})
+                live.publish_task(live.EVENT_CLAIMED, pk, Task.Status.WORKING, worker.pk)
+        return bool(won)
+
+    def dispatch(self, worker):
+        # Выдает исполнителю самую старую свободную задачу (индекс task_queue_idx).
+        # Сначала выбирается id задачи, затем она берется тем же условным UPDATE,
+        # что и в claim, и перечитывается по этому id. Где есть SKIP LOCKED,
+        # занятые другими транзакциями строки пропускаются при выборе. В SQLite
+        # выбор идет вне транзакции (чтение внутри нее не смогло бы перейти к записи,
+        # пока пишет другой исполнитель), и задачу могут взять между выбором и
+        # UPDATE - тогда выбирается следующая. Две выдачи одной задачи невозможны
+        from tasksystem import counters, live
+
+        free = self.filter(status=Task.Status.PENDING, worker__isnull=True).order_by("id")
+        skip_locked = connections[self.db].features.has_select_for_update_skip_locked
+        while True:
+            pk = None if skip_locked else free.values_list("pk", flat=True).first()
+            with transaction.atomic(using=self.db):
+                if skip_locked:
+                    pk = free.select_for_update(skip_locked=True).values_list("pk", flat=True).first()
+                if pk is None:
+                    return None
+                won = self.filter(pk=pk, status=Task.Status.PENDING, worker__isnull=True).update(
+                    worker=worker, status=Task.Status.WORKING, time_update=timezone.now(),
+                )
+                if not won:
+                    continue
+                counters.apply_deltas({counters.working_key(worker.pk): 1})
+                task = self.get(pk=pk)
+                live.publish_task(live.EVENT_CLAIMED, task.pk, task.status, worker.pk)
+                return task
+
+    def complete(self, pk, worker, author_id):
+        from tasksystem import counters, live
+
+        with transaction.atomic():
+            won = self.filter(pk=pk, worker=worker, status=Task.Status.WORKING).update(
+                status=Task.Status.COMPLETED, time_update=timezone.now(),
+            )
+            if won:
+                counters.apply_deltas(counters.task_deltas(
+                    (Task.Status.WORKING, worker.pk, author_id),
+                    (Task.Status.COMPLETED, worker.pk, author_id),
+                ))
+                live.publish_task(live.EVENT_COMPLETED, pk, Task.Status.COMPLETED, worker.pk)
+        return bool(won)
+
+    def visible_to(self, user):
+        # Задачи, которые пользователь видит в списках, поиске и API: завершенные
+        # задачи, как и на странице "Готовые задачи", менеджер видит только свои
+        if user.role == user.Role.ADMIN:
+            return self
+        return self.filter(~models.Q(status=Task.Status.COMPLETED) | models.Q(author=user))
+
+
+# Сколько раз Task.save подбирает слаг заново, если его заняли параллельно
+SLUG_ATTEMPTS = 3
 
 
 class Task(models.Model):
@@ -15,7 +89,7 @@ class Task(models.Model):
     title = models.CharField(max_length=90, verbose_name="Заголовок")
     description = models.TextField("Описание")
     status = models.CharField("Статус", max_length=2, choices=Status.choices, default=Status.PENDING)
-    slug = AutoSlugField("Слаг", max_length=200, unique=True, populate_from="title_slug", overwrite=True, db_index=True,)
+    slug = TaskSlugField("Слаг", max_length=200, unique=True, populate_from="title_slug", overwrite=True, db_index=True,)
 
     author = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name="posts", verbose_name="Автор",)
     worker = models.ForeignKey(get_user_model(), on_delete=models.SET_NULL, related_name="worker_tasks",
@@ -27,6 +101,13 @@ class Task(models.Model):
 
     time_create = models.DateTimeField("Время создания", auto_now_add=True)
     time_update = models.DateTimeField("Время изменения", auto_now=True)
+    # Номер последнего изменения задачи в общей последовательности изменений.
+    # Проставляется триггерами базы (см. tasksystem/changes.py), в том числе
+    # при QuerySet.update и bulk_create, поэтому значение в экземпляре может устареть;
+    # save() эту колонку не записывает
+    change_seq = models.BigIntegerField("Номер изменения", default=0, editable=False)
+
+    objects = TaskQuerySet.as_manager()
 
 
     def get_absolute_url(self):
@@ -35,12 +116,35 @@ class Task(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.pk:  # Проверка, что задача создается впервые
-            if self.worker:
+            if self.worker_id:
                 self.status = self.Status.WORKING
 
         if not self.slug:
             self.slug = slugify(f"{self.title}")
-        return super().save(*args, **kwargs)
+        if not self._state.adding and not kwargs.get("force_insert"):
+            # Устаревший номер изменения из экземпляра не должен попасть в строку
+            update_fields = kwargs.get("update_fields")
+            if update_fields is None:
+                # Как и сам Django, отложенные (only/defer) поля не записываем
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    f.name for f in self._meta.concrete_fields if not f.primary_key and f.attname not in deferred
+                ]
+            kwargs["update_fields"] = [name for name in update_fields if name != "change_seq"]
+        # Счетчики меню обновляются сигналами в той же транзакции, что и задача.
+        # Слаг подбирается до INSERT, и параллельно сохраняемая задача с тем же
+        # заголовком может занять его первой: тогда слаг подбирается заново
+        for attempt in range(SLUG_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if (
+                    attempt + 1 == SLUG_ATTEMPTS
+                    or getattr(self, "_slug_allocated", False)
+                    or not Task.objects.filter(slug=self.slug).exclude(pk=self.pk).exists()
+                ):
+                    raise
 
 
     @property
@@ -54,4 +158,93 @@ class Task(models.Model):
         verbose_name = "Задача"
         verbose_name_plural = "Задачи"
         ordering = ["-time_update"]
+        indexes = [
+            # Порядок доски "Все задачи" и ключ keyset-пагинации
+            models.Index(fields=["status", "-time_update", "-id"], name="task_board_idx"),
+            # "Мои задачи" и статистика исполнителей: фильтр worker + status
+            models.Index(fields=["worker", "status", "-time_update"], name="task_worker_idx"),
+            # "Готовые задачи" менеджера: фильтр author + status, порядок и ключ
+            # keyset-пагинации - как у доски
+            models.Index(fields=["author", "status", "-time_update", "-id"], name="task_author_idx"),
+            # Очередь свободных задач для выдачи "следующей задачи"
+            models.Index(fields=["status", "id"], name="task_queue_idx"),
+            # Поиск задач, измененных после отметки (обновление дэшборда)
+            models.Index(fields=["time_update"], name="task_updated_idx"),
+            # Лента изменений: задачи с номером изменения больше отметки клиента
+            models.Index(fields=["change_seq"], name="task_change_idx"),
+        ]
+
+
+
+# Следы удаленных задач для ленты изменений; номер изменения берется
+# из той же последовательности, что и Task.change_seq
+class TaskTombstone(models.Model):
+    task_id = models.BigIntegerField("Задача", primary_key=True)
+    change_seq = models.BigIntegerField("Номер изменения", unique=True)
+    deleted_at = models.DateTimeField("Время удаления")
+
+    def __str__(self):
+        return f"Задача {self.task_id} удалена {self.deleted_at}"
+
+    class Meta:
+        verbose_name = "Удаленная задача"
+        verbose_name_plural = "Удаленные задачи"
+
+
+# Денормализованные счетчики для меню (см. tasksystem/counters.py)
+class Counter(models.Model):
+    name = models.CharField("Ключ", max_length=64, primary_key=True)
+    value = models.IntegerField("Значение", default=0)
 
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+    class Meta:
+        verbose_name = "Счетчик"
+        verbose_name_plural = "Счетчики"
+
+
+# Снимок статистики дэшборда, пересчитывается командой refresh_dashboard
+class DashboardSnapshot(models.Model):
+    total_users = models.IntegerField("Всего пользователей", default=0)
+    total_tasks = models.IntegerField("Всего задач", default=0)
+    admins = models.IntegerField("Администраторы", default=0)
+    managers = models.IntegerField("Менеджеры", default=0)
+    workers = models.IntegerField("Исполнители", default=0)
+    readers = models.IntegerField("Читатели", default=0)
+    top_worker = models.ForeignKey(get_user_model(), on_delete=models.SET_NULL, related_name="+",
+        verbose_name="Лучший исполнитель",
+        blank=True,
+        null=True,
+    )
+    top_worker_completed = models.IntegerField("Выполнено лучшим исполнителем", default=0)
+
+    refreshed_at = models.DateTimeField("Актуально на")
+    # Задачи с time_update не позже этой отметки уже учтены в WorkerStat
+    watermark = models.DateTimeField("Обработано до")
+
+    def __str__(self):
+        return f"Статистика на {self.refreshed_at}"
+
+    class Meta:
+        verbose_name = "Снимок статистики"
+        verbose_name_plural = "Снимки статистики"
+
+
+# Количество выполненных задач по исполнителям, обновляется инкрементально
+class WorkerStat(models.Model):
+    worker = models.OneToOneField(get_user_model(), on_delete=models.CASCADE, primary_key=True,
+        related_name="stat",
+        verbose_name="Исполнитель",
+    )
+    completed_tasks = models.IntegerField("Выполнено задач", default=0)
+
+    def __str__(self):
+        return f"{self.worker}: {self.completed_tasks}"
+
+    class Meta:
+        verbose_name = "Статистика исполнителя"
+        verbose_name_plural = "Статистика исполнителей"
+        indexes = [
+            models.Index(fields=["-completed_tasks"], name="workerstat_completed_idx"),
+        ]
@@ -0,0 +1,219 @@
+import cProfile
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+from tasksystem.metrics import view_name
+
+ENGINE_CPROFILE = "cprofile"
+ENGINE_SAMPLER = "sampler"
+ENGINES = (ENGINE_CPROFILE, ENGINE_SAMPLER)
+SUFFIXES = {ENGINE_CPROFILE: ".prof", ENGINE_SAMPLER: ".collapsed"}
+
+# Профилирование запроса по требованию администратора: ?_profile=<движок> или
+# заголовок X-TMS-Profile; значение 1 - движок из PROFILE_ENGINE
+QUERY_FLAG = "_profile"
+HEADER = "X-TMS-Profile"
+
+# Профилируется не больше одного запроса процесса за раз: cProfile не
+# совмещается с другим профилировщиком, а очередь профилируемых запросов под
+# нагрузкой сама стала бы нагрузкой. Запрос, не получивший блокировку, идет как обычно
+_lock = threading.Lock()
+
+# Верхние кадры простаивающего потока (ожидание блокировки, очереди, select
+# цикла событий). Такие отсчеты сэмплер отбрасывает, как py-spy без --idle
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("selectors.py", "select"),
+    ("selector_events.py", "_write_to_self"),
+}
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+def is_idle(frame):
+    code = frame.f_code
+    return (Path(code.co_filename).name, code.co_name) in IDLE_FRAMES
+
+
+def collapse(frame):
+    # Стек в формате collapsed stacks (flamegraph.pl, speedscope): от корня к листу через ";"
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    # Раз в interval секунд фоновый поток снимает стек потока, выполняющего запрос.
+    # Сам запрос не замедляется трассировкой каждого вызова, как под cProfile,
+    # поэтому сэмплер годится для постоянной работы в продакшене.
+    # Снимаются только потоки самого запроса: поток, где сэмплер создан, и потоки,
+    # добавленные add_current_thread (под ASGI - поток sync_to_async запроса, где
+    # идут синхронные представления и ORM). Чужие потоки, в том числе запущенные
+    # другими запросами во время профилирования, в профиль не попадают
+    def __init__(self, thread_id, interval):
+        self.threads = {thread_id}
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="tms-profile-sampler", daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in self.threads:
+                frame = frames.get(thread_id)
+                if frame is not None and not is_idle(frame):
+                    self.stacks[collapse(frame)] += 1
+
+    def add_current_thread(self):
+        self.threads = self.threads | {threading.get_ident()}
+
+    def enable(self):
+        self.thread.start()
+
+    def disable(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def dump(self, path):
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in self.stacks.items()))
+
+
+class CProfiler:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def enable(self):
+        self.profile.enable()
+
+    def disable(self):
+        self.profile.disable()
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+
+def requested_engine(request, user):
+    # Движок, запрошенный флагом, или None. Флаг действует только для администратора
+    value = request.GET.get(QUERY_FLAG) or request.headers.get(HEADER)
+    if not value or not user.is_authenticated or user.role != user.Role.ADMIN:
+        return None
+    return value if value in ENGINES else settings.PROFILE_ENGINE
+
+
+def sampled_engine():
+    rate = settings.PROFILE_SAMPLE_RATE
+    return settings.PROFILE_ENGINE if rate and random.random() < rate else None
+
+
+def make_profiler(engine):
+    if engine == ENGINE_CPROFILE:
+        return CProfiler()
+    return StackSampler(threading.get_ident(), settings.PROFILE_INTERVAL)
+
+
+def profile_path(request, engine):
+    # <PROFILE_DIR>/<имя маршрута>/<время>-<наносекунды>.prof|.collapsed
+    directory = Path(settings.PROFILE_DIR) / re.sub(r"[^\w.-]+", "_", view_name(request).replace(":", ".")).strip("_")
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**9:09d}{SUFFIXES[engine]}"
+
+
+def rotate(directory, keep):
+    # Оставляет keep самых новых файлов профилей во всем каталоге
+    files = sorted(
+        (path for suffix in SUFFIXES.values() for path in Path(directory).glob(f"*/*{suffix}")),
+        key=lambda path: path.stat().st_mtime,
+    )
+    for path in files[: max(len(files) - keep, 0)]:
+        path.unlink(missing_ok=True)
+
+
+def save(request, profiler, engine):
+    path = profile_path(request, engine)
+    profiler.dump(path)
+    rotate(settings.PROFILE_DIR, settings.PROFILE_MAX_FILES)
+    return path
+
+
+@sync_and_async_middleware
+def profiling_middleware(get_response):
+    # Профилирует долю запросов PROFILE_SAMPLE_RATE и запросы администратора с
+    # флагом. Стоит после AuthenticationMiddleware: флаг проверяется по роли.
+    # Неотобранный запрос стоит одного random(). Профиль охватывает запрос до
+    # возврата ответа. cProfile видит только поток, где включен: под WSGI это поток
+    # запроса, под ASGI - поток цикла событий. Сэмплер видит и поток цикла событий,
+    # и поток sync_to_async запроса, поэтому под ASGI нужен он; в цикле событий
+    # параллельно идут и другие запросы. Async-представление под WSGI выполняется
+    # в собственном потоке async_to_sync и не видно ни одному из движков
+    def start(engine):
+        if engine is None or not _lock.acquire(blocking=False):
+            return None
+        try:
+            profiler = make_profiler(engine)
+            profiler.enable()
+        except BaseException:
+            _lock.release()
+            raise
+        return profiler
+
+    def finish(request, response, profiler, engine, requested):
+        try:
+            profiler.disable()
+            path = save(request, profiler, engine)
+        except OSError:
+            # Нет места или прав на каталог: профиль теряется, ответ - нет
+            path = None
+        finally:
+            _lock.release()
+        if requested and path is not None:
+            response[HEADER] = str(path.relative_to(settings.PROFILE_DIR))
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            requested = QUERY_FLAG in request.GET or HEADER in request.headers
+            engine = requested_engine(request, await request.auser()) if requested else sampled_engine()
+            profiler = start(engine)
+            if profiler is None:
+                return await get_response(request)
+            response = None
+            try:
+                if isinstance(profiler, StackSampler):
+                    # Синхронные представления и ORM выполняются в потоке
+                    # thread_sensitive этого запроса - он же выполнит и эту функцию
+                    await sync_to_async(profiler.add_current_thread)()
+                response = await get_response(request)
+            finally:
+                finish(request, response, profiler, engine, requested and response is not None)
+            return response
+    else:
+        def middleware(request):
+            requested = QUERY_FLAG in request.GET or HEADER in request.headers
+            engine = requested_engine(request, request.user) if requested else sampled_engine()
+            profiler = start(engine)
+            if profiler is None:
+                return get_response(request)
+            response = None
+            try:
+                response = get_response(request)
+            finally:
+                finish(request, response, profiler, engine, requested and response is not None)
+            return response
+    return middleware
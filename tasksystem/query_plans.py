@@ -0,0 +1,53 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.utils import timezone
+
+from tasksystem import dashboard, views
+from tasksystem.models import Task
+from tasksystem.utils import TASKS_PAGE_SIZE, after_cursor, encode_cursor
+
+User = get_user_model()
+
+# Полный просмотр таблицы (без индекса) и сортировка во временном B-дереве
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+TEMP_SORT = "USE TEMP B-TREE"
+
+
+def checked_queries():
+    # Имя запроса -> (queryset, допустима ли сортировка во временном B-дереве).
+    # Сейчас сортировки не допускает ни один запрос: порядок каждого списка -
+    # порядок его индекса
+    admin = User(pk=1, role=User.Role.ADMIN)
+    manager = User(pk=1, role=User.Role.MANAGER)
+    since = timezone.now()
+    cursor = encode_cursor(Task(pk=1, status=Task.Status.PENDING, time_update=since))
+    completed = encode_cursor(Task(pk=1, status=Task.Status.COMPLETED, time_update=since))
+    return {
+        "content": (views.board_tasks()[: TASKS_PAGE_SIZE + 1], False),
+        "content_more": (after_cursor(views.board_tasks(), cursor)[: TASKS_PAGE_SIZE + 1], False),
+        "required_tasks": (views.worker_tasks(admin), False),
+        "completed_tasks (admin)": (views.finished_tasks(admin)[: TASKS_PAGE_SIZE + 1], False),
+        "completed_tasks (manager)": (views.finished_tasks(manager)[: TASKS_PAGE_SIZE + 1], False),
+        "completed_tasks_more (manager)": (
+            after_cursor(views.finished_tasks(manager), completed)[: TASKS_PAGE_SIZE + 1], False,
+        ),
+        "next_task": (Task.objects.filter(status=Task.Status.PENDING, worker__isnull=True).order_by("id")[:1], False),
+        "dashboard: touched workers": (dashboard.touched_workers(since), False),
+        "dashboard: completed by worker": (dashboard.completed_by_worker([1, 2]), False),
+    }
+
+
+def explain(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(plan, allow_sort=False):
+    problems = [line for line in plan if FULL_SCAN.match(line)]
+    if not allow_sort:
+        problems += [line for line in plan if line.startswith(TEMP_SORT)]
+    return problems
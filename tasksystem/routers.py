@@ -0,0 +1,128 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+# Cookie с моментом (unix time), до которого чтения пользователя идут в основную базу
+PIN_COOKIE = "tms_primary"
+
+# Представление разрешило читать из реплики (replica_view)
+_replica_allowed = ContextVar("replica_allowed", default=False)
+# Пользователь недавно писал в базу (cookie), и реплика могла еще отставать
+_primary_pinned = ContextVar("primary_pinned", default=False)
+# В текущем запросе могла быть запись. Django спрашивает db_for_write и перед
+# проверкой ограничений модели в формах, так что флаг ставится с запасом
+_wrote = ContextVar("wrote", default=False)
+
+
+def replica_alias():
+    return getattr(settings, "REPLICA_DATABASE", None)
+
+
+class ReplicaRouter:
+    # Чтения моделей задач из представлений, помеченных replica_view, идут в
+    # реплику; все записи, а также чтения внутри транзакций и после записи
+    # (read-your-writes) - в основную базу. Сессии и пользователи всегда
+    # читаются из основной: после входа реплика могла еще не получить сессию
+    route_app_labels = {"tasksystem"}
+
+    def db_for_read(self, model, **hints):
+        alias = replica_alias()
+        if (
+            alias is None
+            or model._meta.app_label not in self.route_app_labels
+            or not _replica_allowed.get()
+            or _primary_pinned.get()
+            or _wrote.get()
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        if replica_alias() is not None:
+            _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика - копия основной базы, объекты из них связывать можно
+        aliases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема попадает в реплику вместе с данными (sync_replica)
+        if db == replica_alias():
+            return False
+        return None
+
+
+@contextmanager
+def replica_reads():
+    token = _replica_allowed.set(True)
+    try:
+        yield
+    finally:
+        _replica_allowed.reset(token)
+
+
+def replica_view(view_func):
+    # Представление только читает, и небольшое отставание данных ему не страшно
+    if iscoroutinefunction(view_func):
+        async def _wrapped_view(request, *args, **kwargs):
+            with replica_reads():
+                return await view_func(request, *args, **kwargs)
+        return markcoroutinefunction(wraps(view_func)(_wrapped_view))
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        with replica_reads():
+            return view_func(request, *args, **kwargs)
+    return _wrapped_view
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    # Закрепляет пользователя за основной базой на REPLICA_PIN_SECONDS после
+    # любого запроса, который писал в базу, чтобы он сразу видел свои изменения
+    def start(request):
+        try:
+            pinned = float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        return _primary_pinned.set(pinned), _wrote.set(False)
+
+    def finish(response, tokens):
+        # response is None, если представление выбросило исключение
+        wrote = _wrote.get()
+        _primary_pinned.reset(tokens[0])
+        _wrote.reset(tokens[1])
+        if response is not None and wrote and replica_alias() is not None:
+            pin_seconds = settings.REPLICA_PIN_SECONDS
+            response.set_cookie(
+                PIN_COOKIE, str(int(time.time()) + pin_seconds), max_age=pin_seconds, httponly=True, samesite="Lax",
+            )
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            tokens, response = start(request), None
+            try:
+                response = await get_response(request)
+            finally:
+                finish(response, tokens)
+            return response
+    else:
+        def middleware(request):
+            tokens, response = start(request), None
+            try:
+                response = get_response(request)
+            finally:
+                finish(response, tokens)
+            return response
+    return middleware
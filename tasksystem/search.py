@@ -0,0 +1,163 @@
+import re
+
+from django.db import connections
+
+from tasksystem.models import Task
+
+# Внешняя (external content) FTS5-таблица над tasksystem_task: хранит только
+# индекс, тексты берутся из самой таблицы задач. Синхронизируется триггерами
+# (миграция 0008), поэтому bulk_create и QuerySet.update ее тоже обновляют
+FTS_TABLE = "tasksystem_task_fts"
+TRIGGERS = (f"{FTS_TABLE}_ai", f"{FTS_TABLE}_ad", f"{FTS_TABLE}_au")
+TOKENIZER = "unicode61 remove_diacritics 2"
+
+SEARCH_PAGE_SIZE = 30
+SUGGEST_LIMIT = 10
+
+# Заголовок весит больше описания
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+# FTS5 не умеет русскую морфологию, поэтому окончания отрезаются при разборе
+# запроса, а основа ищется по префиксу: "задачи" -> "задач"*
+RUSSIAN_ENDINGS = sorted(
+    """
+    иями ями ами ыми ими ого его ому ему ешь ой ей ую юю ая яя ое ее ые ие ый ий ых их ым им ом ем
+    ов ев ах ях ам ям ию ия ья ье ью ьи ть ти ет ют ут ит ат ят ла ло ли
+    а я о е у ю ы и ь й
+    """.split(),
+    key=len,
+    reverse=True,
+)
+MIN_STEM = 4
+# Слова короче не ищутся: однобуквенному префиксу соответствует почти весь
+# индекс (наименьший префиксный индекс FTS5 - двухсимвольный, prefix='2 3')
+MIN_TERM = 2
+
+WORD_RE = re.compile(r"\w+")
+
+
+def stem(word):
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[: -len(ending)]
+    return word
+
+
+def terms(query):
+    return [word for word in WORD_RE.findall(query.lower().replace("ё", "е")) if len(word) >= MIN_TERM]
+
+
+def match_expression(query):
+    # Каждое слово запроса - отдельная фраза в кавычках: пользовательский ввод
+    # не может сломать синтаксис MATCH
+    return " ".join(f'"{stem(word)}"*' for word in terms(query))
+
+
+def suggest_expression(query):
+    # Для автодополнения последнее слово еще не дописано: ищем его как префикс,
+    # а предыдущие - как обычные слова запроса, только по заголовку
+    words = terms(query)
+    if not words:
+        return ""
+    phrases = [f'"{stem(word)}"*' for word in words[:-1]] + [f'"{words[-1]}"*']
+    return "title : (" + " ".join(phrases) + ")"
+
+
+def available(using="default"):
+    return connections[using].vendor == "sqlite"
+
+
+def ranked(tasks, expression):
+    # Совпадения в порядке релевантности. Фильтры tasks (видимость задач роли)
+    # применяются в том же запросе, до LIMIT: страница не теряет скрытые строки.
+    # План: перебор совпадений FTS5 по MATCH, задача - по первичному ключу
+    return tasks.extra(
+        select={"relevance": f"bm25({FTS_TABLE}, %s, %s)"},
+        select_params=[TITLE_WEIGHT, DESCRIPTION_WEIGHT],
+        tables=[FTS_TABLE],
+        where=[f"{FTS_TABLE}.rowid = tasksystem_task.id", f"{FTS_TABLE} MATCH %s"],
+        params=[expression],
+    ).order_by("relevance")
+
+
+def search_tasks(query, tasks, page=1, page_size=SEARCH_PAGE_SIZE):
+    # Возвращает (задачи страницы в порядке релевантности, есть ли следующая страница).
+    # Одна выборка за страницу: поиск по индексу вместе с самими задачами
+    expression = match_expression(query)
+    if not expression:
+        return [], False
+    offset = (page - 1) * page_size
+    if available(tasks.db):
+        found = list(ranked(tasks, expression)[offset : offset + page_size + 1])
+        return found[:page_size], len(found) > page_size
+
+    # Без FTS5 (не SQLite) - медленный, но корректный поиск по подстроке
+    found = tasks
+    for word in terms(query):
+        found = found.filter(title__icontains=word) | found.filter(description__icontains=word)
+    found = list(found.order_by("-time_update", "-id")[offset : offset + page_size + 1])
+    return found[:page_size], len(found) > page_size
+
+
+def suggest_titles(query, tasks, limit=SUGGEST_LIMIT):
+    # Запрос на каждое нажатие клавиши, поэтому заголовки берутся в том же запросе
+    expression = suggest_expression(query)
+    if not expression:
+        return []
+    if not available(tasks.db):
+        return list(tasks.filter(title__istartswith=query.strip()).values("title", "slug")[:limit])
+    return list(ranked(tasks, expression).values("title", "slug")[:limit])
+
+
+def create_index(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"title, description, content='tasksystem_task', content_rowid='id', "
+            f"tokenize='{TOKENIZER}', prefix='2 3')"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON tasksystem_task BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description); "
+            f"END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON tasksystem_task BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) "
+            f"VALUES ('delete', old.id, old.title, old.description); "
+            f"END"
+        )
+        # Смена статуса или исполнителя индекс не трогает
+        cursor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, description ON tasksystem_task BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) "
+            f"VALUES ('delete', old.id, old.title, old.description); "
+            f"INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description); "
+            f"END"
+        )
+    rebuild_index(connection)
+
+
+def drop_index(connection):
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def rebuild_index(connection):
+    # Перестраивает индекс целиком по содержимому tasksystem_task
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def check_index(connection):
+    # Сверяет индекс с таблицей задач; при расхождении SQLite выбрасывает ошибку
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('integrity-check', 1)")
+
+
+def optimize_index(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
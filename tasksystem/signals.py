@@ -0,0 +1,97 @@
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from tasksystem import changes, counters, dashboard, dbprofile, live, metrics, search
+from tasksystem.assignment import loads
+from tasksystem.models import Task
+
+
+def task_state(task):
+    return task.status, task.worker_id, task.author_id
+
+
+@receiver(pre_save, sender=Task)
+def remember_task_state(sender, instance, raw=False, **kwargs):
+    # Состояние берем из базы, а не из экземпляра: он мог устареть
+    instance._counter_state = None
+    if instance.pk and not raw:
+        instance._counter_state = (
+            Task.objects.filter(pk=instance.pk).values_list("status", "worker_id", "author_id").first()
+        )
+
+
+@receiver(post_save, sender=Task)
+def update_task_counters(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, "_counter_state", None)
+    counters.apply_deltas(counters.task_deltas(old, task_state(instance)))
+    dashboard.release_completed(old, task_state(instance))
+    event = live.task_event(old and old[:2], (instance.status, instance.worker_id))
+    live.publish_task(event, instance.pk, instance.status, instance.worker_id)
+
+
+@receiver(post_delete, sender=Task)
+def release_task_counters(sender, instance, **kwargs):
+    counters.apply_deltas(counters.task_deltas(task_state(instance), None))
+    dashboard.release_completed(task_state(instance), None)
+    live.publish_task(live.EVENT_DELETED, instance.pk)
+
+
+@receiver(post_save, sender=get_user_model())
+def count_new_user(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    if created and not raw:
+        counters.apply_deltas({counters.TOTAL_USERS: 1})
+    if not raw:
+        # Имя, почта или фото могли измениться, а они показываются в карточках.
+        # Вход в систему сохраняет только last_login - его страницы не показывают
+        if update_fields != frozenset({"last_login"}):
+            counters.apply_deltas({counters.PAGES_VERSION: 1})
+        loads.worker_saved(instance)
+
+
+@receiver(post_delete, sender=get_user_model())
+def count_deleted_user(sender, instance, **kwargs):
+    counters.apply_deltas({counters.TOTAL_USERS: -1, counters.PAGES_VERSION: 1})
+    counters.forget_user(instance.pk)
+    loads.forget(instance.pk)
+
+
+@receiver(post_migrate)
+def restore_task_triggers(sender, using="default", apps=None, **kwargs):
+    # SQLite не умеет большинство ALTER TABLE, и Django пересоздает таблицу задач
+    # (AddField, AlterField...), а вместе со старой таблицей пропадают ее триггеры
+    connection = connections[using]
+    if sender.name != "tasksystem" or connection.vendor != "sqlite":
+        return
+    try:
+        # После отката ниже 0009 колонок для триггеров еще нет
+        apps.get_model("tasksystem", "TaskTombstone")
+    except (AttributeError, LookupError):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        existing = {row[0] for row in cursor.fetchall()}
+    if not existing.issuperset(changes.TRIGGERS):
+        changes.create_triggers(connection)
+    if not existing.issuperset(search.TRIGGERS):
+        # Пока триггеров не было, индекс мог отстать: create_index его перестраивает
+        search.create_index(connection)
+
+
+@receiver(connection_created)
+def apply_database_profile(sender, connection, **kwargs):
+    # PRAGMAS профиля базы (DATABASE_PROFILES в settings) для нового соединения
+    pragmas = connection.settings_dict.get("PRAGMAS")
+    if connection.vendor == "sqlite" and pragmas:
+        with connection.cursor() as cursor:
+            dbprofile.apply_pragmas(cursor, pragmas)
+
+
+@receiver(connection_created)
+def count_database_queries(sender, connection, **kwargs):
+    # Запросы к базе в метриках представлений (tasksystem/metrics.py)
+    metrics.install_query_counter(connection)
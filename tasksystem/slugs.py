@@ -0,0 +1,82 @@
+import re
+from functools import lru_cache
+
+from django.template.defaultfilters import slugify as django_slugify
+from text_unidecode import unidecode
+
+alphabet = {
+    "а": "a",
+    "б": "b",
+    "в": "v",
+    "г": "g",
+    "д": "d",
+    "е": "e",
+    "ё": "yo",
+    "ж": "zh",
+    "з": "z",
+    "и": "i",
+    "й": "j",
+    "к": "k",
+    "л": "l",
+    "м": "m",
+    "н": "n",
+    "о": "o",
+    "п": "p",
+    "р": "r",
+    "с": "s",
+    "т": "t",
+    "у": "u",
+    "ф": "f",
+    "х": "kh",
+    "ц": "ts",
+    "ч": "ch",
+    "ш": "sh",
+    "щ": "shch",
+    "ы": "i",
+    "э": "e",
+    "ю": "yu",
+    "я": "ya",
+    "ь": "",
+    "ъ": "",
+}
+
+# Таблица для str.translate, собирается один раз: строчные и заглавные буквы
+TRANSLIT_TABLE = str.maketrans({
+    **alphabet,
+    **{letter.upper(): value for letter, value in alphabet.items()},
+})
+
+
+def transliterate(s):
+    return s.translate(TRANSLIT_TABLE)
+
+
+# Основа слага для заголовка, от которого не осталось ни буквы (например "!!!"):
+# иначе слаги были бы вида "-2"
+EMPTY_SLUG = "task"
+
+
+@lru_cache(maxsize=4096)
+def slugify(s):
+    # Единый способ получить слаг из заголовка задачи: кириллица - по таблице,
+    # прочие не-ASCII символы (греческий, китайский, ß...) - text-unidecode, как
+    # в python-slugify, затем стандартный slugify Django. Без unidecode slugify
+    # Django такие символы просто отбросил бы
+    s = transliterate(s)
+    if not s.isascii():
+        s = unidecode(s)
+    return django_slugify(s)
+
+
+def suffix_pattern(base, separator="-"):
+    # Слаги вида base или base-N
+    return re.compile(rf"^{re.escape(base)}(?:{re.escape(separator)}(\d+))?$")
+
+
+def next_free_slug(base, base_taken, last, separator="-"):
+    # Следующий свободный слаг по итогам запроса (см. TaskSlugField.create_slug):
+    # base, если он свободен, иначе base-(наибольший занятый номер + 1).
+    # Номера начинаются с 2, как у AutoSlugField
+    if not base_taken:
+        return base
+    return f"{base}{separator}{max(last or 1, 1) + 1}"
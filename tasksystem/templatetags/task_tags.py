@@ -9,6 +9,6 @@ def can_delete_task(task, user):
         return False
     if user.role == "admin":
         return True
-    if user.role == "manager" and task.author == user:
+    if user.role == "manager" and task.author_id == user.pk:
         return True
     return False
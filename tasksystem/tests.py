@@ -1,3 +1,1340 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from functools import partial
+from importlib import import_module
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import Permission
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db import connections
+from django.db import DatabaseError
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlsafe_base64_encode
+
+from authentication.backends import CachedModelBackend
+from authentication.models import User
+from tasksystem import counters, fragments, live, metrics, profiling, routers, views
+from tasksystem.assignment import loads
+from tasksystem.contention import hammer
+from tasksystem.importer import TaskImporter, read_rows
+from tasksystem.dashboard import refresh_snapshot
+from tasksystem.models import Counter, Task, WorkerStat
+from tasksystem.routers import PIN_COOKIE, ReplicaRouter, replica_middleware, replica_reads
+from tasksystem.search import search_tasks, suggest_titles
+from tasksystem.utils import after_cursor, decode_cursor, encode_cursor, paginate_by_cursor
+from tasksystem.slugs import next_free_slug, slugify
+
+
+class QueryBudgetTests(TestCase):
+    # Число запросов на страницу не должно зависеть от количества задач.
+    # Страницы с ETag (tasksystem/conditional.py) делают еще один запрос состояния
+    TASKS = 1200
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user("admin", "admin@tms.local", "pass", role=User.Role.ADMIN)
+        cls.manager = User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+        cls.worker = User.objects.create_user("worker", "worker@tms.local", "pass", role=User.Role.WORKER)
+        cls.reader = User.objects.create_user("reader", "reader@tms.local", "pass", role=User.Role.READER)
+
+        statuses = [Task.Status.PENDING, Task.Status.WORKING, Task.Status.COMPLETED]
+        Task.objects.bulk_create(
+            Task(
+                title=f"Задача {i}",
+                description="Описание",
+                status=statuses[i % 3],
+                author=cls.manager if i % 2 else cls.admin,
+                worker=None if statuses[i % 3] == Task.Status.PENDING else cls.worker,
+            )
+            for i in range(cls.TASKS)
+        )
+        # bulk_create не вызывает сигналы, поэтому счетчики пересчитываем
+        call_command("rebuild_counters", stdout=StringIO())
+        call_command("refresh_dashboard", stdout=StringIO())
+        cls.task = Task.objects.filter(status=Task.Status.WORKING).first()
+
+    def assertQueryBudget(self, user, url, budget):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(ctx.captured_queries), budget,
+            "\n".join(q["sql"] for q in ctx.captured_queries),
+        )
+
+    def test_content(self):
+        for user in (self.admin, self.manager, self.worker, self.reader):
+            with self.subTest(user=user.username):
+                self.assertQueryBudget(user, reverse("tasksystem:content"), 5)
+
+    def test_content_more(self):
+        self.client.force_login(self.reader)
+        cursor = self.client.get(reverse("tasksystem:content")).context["next_cursor"]
+        self.assertQueryBudget(self.reader, reverse("tasksystem:content_more") + f"?cursor={cursor}", 3)
+
+    def test_required_tasks(self):
+        self.assertQueryBudget(self.worker, reverse("tasksystem:required_tasks"), 5)
+
+    def test_completed_tasks(self):
+        self.assertQueryBudget(self.admin, reverse("tasksystem:completed_tasks"), 5)
+        self.assertQueryBudget(self.manager, reverse("tasksystem:completed_tasks"), 5)
+        self.client.force_login(self.manager)
+        cursor = self.client.get(reverse("tasksystem:completed_tasks")).context["next_cursor"]
+        self.assertQueryBudget(self.manager, reverse("tasksystem:completed_tasks") + f"?cursor={cursor}", 5)
+
+    def test_task_detail(self):
+        self.assertQueryBudget(self.worker, self.task.get_absolute_url(), 5)
+
+    def test_dashboard(self):
+        self.assertQueryBudget(self.admin, reverse("tasksystem:dashboard"), 4)
+
+    def test_search(self):
+        # Сессия, пользователь, меню и одна выборка задач вместе с FTS-индексом
+        self.assertQueryBudget(self.reader, reverse("tasksystem:search") + "?q=задачи", 4)
+        self.assertQueryBudget(self.reader, reverse("tasksystem:search_suggest") + "?q=зад", 3)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+        # Все задачи с одним и тем же временем изменения: порядок решает id
+        self.now = timezone.now()
+        Task.objects.bulk_create(
+            Task(title=f"Задача {i}", description="Описание", author=self.manager, slug=f"zadacha-{i}")
+            for i in range(7)
+        )
+        Task.objects.update(time_update=self.now)
+
+    def test_round_trip(self):
+        task = Task(pk=42, status=Task.Status.WORKING, time_update=self.now)
+        self.assertEqual(decode_cursor(encode_cursor(task)), (Task.Status.WORKING, self.now, 42))
+
+    def test_invalid_cursor(self):
+        def raw(value):
+            return urlsafe_base64_encode(value.encode())
+
+        for cursor in (
+            "", "!!!", "bm90LWEtY3Vyc29y", raw("PD|not-a-date|1"), raw("PD|2024-01-01T00:00:00+00:00|x"),
+            raw("PD|2024-01-01T00:00:00+00:00"), raw("PD|2024-01-01T00:00:00|1"), raw("ZZ|2024-01-01T00:00:00+00:00|1"),
+            urlsafe_base64_encode(b"\xff\xfe|1"),
+        ):
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decode_cursor(cursor))
+                # Поврежденный курсор - первая страница, а не ошибка
+                self.assertEqual(after_cursor(Task.objects.all(), cursor).count(), 7)
+
+    def test_pages_with_ties(self):
+        # Одинаковое время изменения: без id в ключе страницы теряли бы или повторяли задачи
+        pages, cursor = [], None
+        while True:
+            tasks, cursor = paginate_by_cursor(views.board_tasks(), cursor, limit=3)
+            pages.append([task.pk for task in tasks])
+            if cursor is None:
+                break
+        ids = list(Task.objects.order_by("-id").values_list("id", flat=True))
+        self.assertEqual(pages, [ids[:3], ids[3:6], ids[6:]])
+
+    def test_last_page(self):
+        # Ровно limit задач: следующей страницы нет
+        tasks, cursor = paginate_by_cursor(views.board_tasks(), limit=7)
+        self.assertEqual((len(tasks), cursor), (7, None))
+        tasks, cursor = paginate_by_cursor(views.board_tasks(), limit=6)
+        self.assertEqual(len(tasks), 6)
+        tasks, cursor = paginate_by_cursor(views.board_tasks(), cursor, limit=6)
+        self.assertEqual((len(tasks), cursor), (1, None))
+
+    def test_content_more(self):
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse("tasksystem:content_more"), {"cursor": "bm90LWEtY3Vyc29y"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse("tasksystem:content_more")).status_code, 400)
+
+        first = Task.objects.order_by("-id").first()
+        response = self.client.get(reverse("tasksystem:content_more"), {"cursor": encode_cursor(first)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Next-Cursor"], "")
+        self.assertNotContains(response, f'id="task-{first.pk}"')
+
+
+    def test_completed_tasks_pages(self):
+        # Менеджер видит только свои готовые задачи, по странице за раз
+        other = User.objects.create_user("other", "other@tms.local", "pass", role=User.Role.MANAGER)
+        Task.objects.create(title="Чужая", description="Описание", author=other, status=Task.Status.COMPLETED)
+        Task.objects.filter(author=self.manager).update(status=Task.Status.COMPLETED)
+        self.client.force_login(self.manager)
+
+        pages, cursor = [], ""
+        with mock.patch("tasksystem.views.paginate_by_cursor", partial(paginate_by_cursor, limit=3)):
+            while cursor is not None:
+                response = self.client.get(reverse("tasksystem:completed_tasks"), {"cursor": cursor} if cursor else {})
+                pages.append([task.pk for task in response.context["tasks"]])
+                cursor = response.context["next_cursor"]
+        ids = list(Task.objects.filter(author=self.manager).order_by("-id").values_list("id", flat=True))
+        self.assertEqual(pages, [ids[:3], ids[3:6], ids[6:]])
+        self.assertNotContains(response, "?cursor=")
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+        self.worker = User.objects.create_user("worker", "worker@tms.local", "pass", role=User.Role.WORKER)
+
+    def assertNoDrift(self):
+        out = StringIO()
+        call_command("rebuild_counters", "--check", stdout=out)
+        self.assertIn("Счетчики совпадают", out.getvalue())
+
+    def test_task_lifecycle(self):
+        task = Task.objects.create(title="Задача", description="Описание", author=self.manager)
+        self.assertNoDrift()
+        task.worker = self.worker
+        task.status = Task.Status.WORKING
+        task.save()
+        self.assertNoDrift()
+        task.status = Task.Status.COMPLETED
+        task.save()
+        self.assertNoDrift()
+        task.delete()
+        self.assertNoDrift()
+
+    def test_user_delete_cascades(self):
+        Task.objects.create(title="Задача", description="Описание", author=self.manager, worker=self.worker)
+        Task.objects.create(title="Задача", description="Описание", author=self.worker)
+        self.worker.delete()
+        self.assertNoDrift()
+        self.manager.delete()
+        self.assertNoDrift()
+
+    def test_rebuild_fixes_drift(self):
+        Task.objects.create(title="Задача", description="Описание", author=self.manager)
+        Task.objects.update(status=Task.Status.COMPLETED)
+        out = StringIO()
+        call_command("rebuild_counters", stdout=out)
+        self.assertIn("tasks:open: 1 -> 0", out.getvalue())
+        self.assertNoDrift()
+
+
+class DashboardSnapshotTests(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+        self.worker = User.objects.create_user("worker", "worker@tms.local", "pass", role=User.Role.WORKER)
+        self.other = User.objects.create_user("other", "other@tms.local", "pass", role=User.Role.WORKER)
+
+    def complete(self, worker):
+        task = Task.objects.create(title="Задача", description="Описание", author=self.manager, worker=worker)
+        task.status = Task.Status.COMPLETED
+        task.save()
+        return task
+
+    def test_incremental_refresh(self):
+        self.complete(self.worker)
+        snapshot = refresh_snapshot()
+        self.assertEqual((snapshot.top_worker, snapshot.top_worker_completed), (self.worker, 1))
+
+        self.complete(self.other)
+        self.complete(self.other)
+        snapshot = refresh_snapshot()
+        self.assertEqual((snapshot.top_worker, snapshot.top_worker_completed), (self.other, 2))
+        self.assertEqual(snapshot.total_tasks, 3)
+        self.assertEqual(snapshot.workers, 2)
+        self.assertEqual(WorkerStat.objects.get(worker=self.worker).completed_tasks, 1)
+
+    def refresh_later(self):
+        # Следующий запуск - позже запаса REFRESH_LAG: прежние изменения он уже не видит
+        snapshot = refresh_snapshot()
+        Task.objects.update(time_update=F("time_update") - datetime.timedelta(hours=1))
+        return snapshot
+
+    def test_previous_worker_recounted(self):
+        # Задача ушла от исполнителя: его в измененных задачах уже нет
+        first, second = self.complete(self.worker), self.complete(self.worker)
+        self.complete(self.other)
+        self.refresh_later()
+        self.assertEqual(WorkerStat.objects.get(worker=self.worker).completed_tasks, 2)
+
+        first.worker = self.other
+        first.save()
+        snapshot = self.refresh_later()
+        self.assertEqual((snapshot.top_worker, snapshot.top_worker_completed), (self.other, 2))
+        self.assertEqual(WorkerStat.objects.get(worker=self.worker).completed_tasks, 1)
+
+        second.worker = None
+        second.save()
+        first.delete()
+        snapshot = self.refresh_later()
+        stats = dict(WorkerStat.objects.values_list("worker", "completed_tasks"))
+        self.assertEqual(stats, {self.worker.pk: 0, self.other.pk: 1})
+        self.assertEqual((snapshot.top_worker, snapshot.top_worker_completed), (self.other, 1))
+
+        Task.objects.filter(worker=self.other).delete()
+        snapshot = self.refresh_later()
+        self.assertEqual((snapshot.top_worker, snapshot.top_worker_completed), (None, 0))
+        # Инкрементальный пересчет совпадает с полным (он не хранит нулевые строки)
+        stats = {pk: n for pk, n in WorkerStat.objects.values_list("worker", "completed_tasks") if n}
+        refresh_snapshot(full=True)
+        self.assertEqual(stats, dict(WorkerStat.objects.values_list("worker", "completed_tasks")))
+
+
+class AsyncViewTests(TestCase):
+    # Под ASGI шаблон не может лениво дочитывать данные из базы:
+    # такая попытка падает с SynchronousOnlyOperation
+    def setUp(self):
+        self.admin = User.objects.create_user("admin", "admin@tms.local", "pass", role=User.Role.ADMIN)
+        self.worker = User.objects.create_user("worker", "worker@tms.local", "pass", role=User.Role.WORKER)
+        self.task = Task.objects.create(title="Задача", description="Описание", author=self.admin, worker=self.worker)
+
+    async def test_pages_under_asgi(self):
+        self.assertEqual((await self.async_client.get(reverse("tasksystem:content"))).status_code, 302)
+        await sync_to_async(self.async_client.force_login)(self.admin)
+        for url in (reverse("tasksystem:content"), self.task.get_absolute_url(), reverse("tasksystem:dashboard")):
+            with self.subTest(url=url):
+                self.assertEqual((await self.async_client.get(url)).status_code, 200)
+
+        await sync_to_async(self.async_client.force_login)(self.worker)
+        self.assertEqual((await self.async_client.get(reverse("tasksystem:dashboard"))).status_code, 403)
+        response = await self.async_client.post(reverse("tasksystem:required_tasks"), {"task_id": self.task.pk})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual((await Task.objects.aget(pk=self.task.pk)).status, Task.Status.COMPLETED)
+
+
+class LiveBoardTests(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+        self.worker = User.objects.create_user("worker", "worker@tms.local", "pass", role=User.Role.WORKER)
+
+    def events(self, action):
+        frames = []
+        with mock.patch.object(live.broadcaster, "publish", frames.append), self.captureOnCommitCallbacks(execute=True):
+            action()
+        return [frame.decode().split("\n")[0].removeprefix("event: ") for frame in frames]
+
+    def test_task_writes_publish_events(self):
+        task = None
+
+        def create():
+            nonlocal task
+            task = Task.objects.create(title="Задача", description="Описание", author=self.manager)
+
+        self.assertEqual(self.events(create), ["created"])
+        self.assertEqual(self.events(lambda: Task.objects.claim(task.pk, self.worker)), ["claimed"])
+        self.assertEqual(self.events(lambda: Task.objects.complete(task.pk, self.worker, self.manager.pk)), ["completed"])
+        self.assertEqual(self.events(task.delete), ["deleted"])
+        rows = [(1, {"title": "Импорт", "description": "Описание"}, None)]
+        self.assertEqual(self.events(lambda: TaskImporter(default_author=self.manager).run(rows)), ["reload"])
+
+    async def test_fan_out_from_other_thread(self):
+        broadcaster = live.Broadcaster(queue_size=2)
+        stream = live.event_stream(broadcaster)
+        self.assertEqual(await anext(stream), b"retry: 3000\n\n")
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        await asyncio.to_thread(broadcaster.publish, live.sse_frame("deleted", {"id": 1}))
+        self.assertIn(b"event: deleted", await pending)
+
+        # Переполненная очередь медленного клиента заменяется командой перечитать доску
+        for i in range(3):
+            await asyncio.to_thread(broadcaster.publish, live.sse_frame("deleted", {"id": i}))
+        await asyncio.sleep(0)
+        self.assertEqual(await anext(stream), live.RELOAD_FRAME)
+        await stream.aclose()
+        self.assertEqual(broadcaster.subscribers, 0)
+
+    def test_events_endpoint_needs_asgi(self):
+        self.client.force_login(self.manager)
+        self.assertEqual(self.client.get(reverse("tasksystem:board_events")).status_code, 204)
+
+    async def test_events_endpoint_streams(self):
+        await sync_to_async(self.async_client.force_login)(self.manager)
+        response = await self.async_client.get(reverse("tasksystem:board_events"))
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b"retry: 3000\n\n")
+        await stream.aclose()
+
+
+class LiveEndpointTests(TransactionTestCase):
+    # Поток событий под настоящим ASGI-приложением (core/asgi.py)
+    STREAMS = 20
+
+    def setUp(self):
+        self.manager = User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+
+    async def open_stream(self, cookie=""):
+        from core.asgi import application
+
+        communicator = ApplicationCommunicator(application, {
+            "type": "http", "method": "GET", "path": reverse("tasksystem:board_events"), "root_path": "",
+            "query_string": b"", "headers": [(b"host", b"testserver"), (b"cookie", cookie.encode())],
+        })
+        await communicator.send_input({"type": "http.request", "body": b""})
+        start = await communicator.receive_output(5)
+        body = await communicator.receive_output(5)
+        return communicator, start["status"], body["body"]
+
+    async def test_idle_streams_do_not_hold_threads(self):
+        await sync_to_async(self.client.force_login)(self.manager)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        streams = [await self.open_stream(cookie)]
+        threads = threading.active_count()
+        streams += [await self.open_stream(cookie) for _ in range(self.STREAMS)]
+        # Обработчик Django держал бы по потоку на каждое открытое соединение
+        self.assertEqual(threading.active_count(), threads)
+        self.assertEqual({(status, body) for _, status, body in streams}, {(200, b"retry: 3000\n\n")})
+        self.assertEqual(live.broadcaster.subscribers, self.STREAMS + 1)
+
+        for communicator, _, _ in streams:
+            await communicator.send_input({"type": "http.disconnect"})
+            await communicator.wait(5)
+        self.assertEqual(live.broadcaster.subscribers, 0)
+
+    async def test_anonymous_stream_forbidden(self):
+        communicator, status, _ = await self.open_stream()
+        await communicator.wait(5)
+        self.assertEqual(status, 403)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        fragments.fragment_cache().clear()
+        patcher = mock.patch.object(metrics, "registry", metrics.Registry())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.admin = User.objects.create_user("admin", "admin@tms.local", "pass", role=User.Role.ADMIN)
+        self.manager = User.objects.create_user(
+            "manager", "manager@tms.local", "pass", role=User.Role.MANAGER, first_name="Анна",
+        )
+        self.worker = User.objects.create_user("worker", "worker@tms.local", "pass", role=User.Role.WORKER)
+        self.tasks = [
+            Task.objects.create(title=f"Задача {i}", description="Описание", author=self.manager if i % 2 else self.admin)
+            for i in range(6)
+        ]
+
+    def board(self, user):
+        self.client.force_login(user)
+        before = fragments.stats()
+        response = self.client.get(reverse("tasksystem:content"))
+        after = fragments.stats()
+        return response.content.decode(), (after[0] - before[0], after[1] - before[1])
+
+    def test_unchanged_cards_come_from_cache(self):
+        _, (hits, misses) = self.board(self.admin)
+        self.assertEqual((hits, misses), (0, 6))
+        _, (hits, misses) = self.board(self.admin)
+        self.assertEqual((hits, misses), (6, 0))
+
+        Task.objects.claim(self.tasks[0].pk, self.worker)
+        html, (hits, misses) = self.board(self.admin)
+        self.assertEqual((hits, misses), (5, 1))
+        self.assertIn("worker@tms.local", html)
+
+    def test_user_change_invalidates_cards(self):
+        self.board(self.admin)
+        # update() в обход save(): версия берется из полей, а не из сигнала
+        User.objects.filter(pk=self.manager.pk).update(first_name="Мария")
+        html, (hits, misses) = self.board(self.admin)
+        self.assertEqual((hits, misses), (3, 3))
+        self.assertIn("Мария", html)
+        self.assertNotIn("Анна", html)
+
+    def test_delete_button_is_per_user(self):
+        self.board(self.admin)
+        html, (hits, _) = self.board(self.manager)
+        self.assertEqual(hits, 6)
+        own = {t.pk for t in self.tasks if t.author_id == self.manager.pk}
+        for task in self.tasks:
+            with self.subTest(task=task.pk):
+                url = reverse("tasksystem:delete_task", args=[task.pk])
+                self.assertEqual(url in html, task.pk in own)
+
+    def test_stats_endpoint(self):
+        self.board(self.admin)
+        self.board(self.admin)
+        response = self.client.get(reverse("tasksystem:api_card_cache_stats"))
+        self.assertEqual(response.json(), {"hits": 6, "misses": 6, "hit_ratio": 0.5})
+        self.client.force_login(self.manager)
+        self.assertEqual(self.client.get(reverse("tasksystem:api_card_cache_stats")).status_code, 403)
+
+    def test_stats_survive_eviction(self):
+        # Вытеснение карточек из кэша не сбрасывает счетчики
+        self.board(self.admin)
+        fragments.fragment_cache().clear()
+        self.assertEqual(fragments.stats(), (0, 6))
+        self.assertIn('tms_card_cache_total{result="miss"} 6', metrics.render(metrics.registry.collect()))
+
+
+class ConditionalPageTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user("admin", "admin@tms.local", "pass", role=User.Role.ADMIN)
+        self.manager = User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+        self.worker = User.objects.create_user("worker", "worker@tms.local", "pass", role=User.Role.WORKER)
+        self.task = Task.objects.create(title="Задача", description="Описание", author=self.manager)
+        self.client.force_login(self.manager)
+
+    def revalidate(self, url):
+        if "csrftoken" not in self.client.cookies:
+            self.assertFalse(self.client.get(url).has_header("ETag"))
+        etag = self.client.get(url)["ETag"]
+        return lambda: self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_pages_are_not_rendered(self):
+        urls = [reverse("tasksystem:content"), reverse("tasksystem:completed_tasks"), self.task.get_absolute_url()]
+        for url in urls:
+            with self.subTest(url=url):
+                refresh = self.revalidate(url)
+                # Сессия, пользователь и один запрос состояния
+                with self.assertNumQueries(3):
+                    response = refresh()
+                self.assertEqual(response.status_code, 304)
+                self.assertFalse(response.templates)
+
+    def test_task_change_invalidates(self):
+        refresh = self.revalidate(reverse("tasksystem:content"))
+        Task.objects.claim(self.task.pk, self.worker)
+        self.assertEqual(refresh().status_code, 200)
+
+        refresh = self.revalidate(reverse("tasksystem:content"))
+        Task.objects.get(pk=self.task.pk).delete()
+        self.assertEqual(refresh().status_code, 200)
+
+    def test_user_change_invalidates(self):
+        refresh = self.revalidate(reverse("tasksystem:content"))
+        self.worker.first_name = "Петр"
+        self.worker.save()
+        self.assertEqual(refresh().status_code, 200)
+
+        refresh = self.revalidate(reverse("tasksystem:content"))
+        self.client.force_login(self.admin)
+        self.assertEqual(refresh().status_code, 200)
+
+    def test_counter_rebuild_invalidates(self):
+        refresh = self.revalidate(reverse("tasksystem:content"))
+        call_command("rebuild_counters", stdout=StringIO())
+        self.assertEqual(refresh().status_code, 304)
+        Counter.objects.filter(name=counters.OPEN_TASKS).update(value=100)
+        call_command("rebuild_counters", stdout=StringIO())
+        self.assertEqual(refresh().status_code, 200)
+
+    def test_pending_message_renders_page(self):
+        self.client.force_login(self.worker)
+        Task.objects.claim(self.task.pk, self.worker)
+        refresh = self.revalidate(reverse("tasksystem:required_tasks"))
+        response = self.client.post(reverse("tasksystem:required_tasks"), {"task_id": self.task.pk}, follow=True)
+        self.assertContains(response, "отмечена как завершенная")
+        self.assertFalse(response.has_header("ETag"))
+        self.assertEqual(refresh().status_code, 200)
+
+
+class DatabaseProfileTests(TransactionTestCase):
+    # benchmark_database копирует базу через backup(), а он не завершается,
+    # пока в копируемом соединении открыта транзакция TestCase
+    def test_pragmas_applied_on_connect(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = connections.create_connection("default")
+            conn.settings_dict = {
+                **conn.settings_dict,
+                "NAME": os.path.join(tmp, "db.sqlite3"),
+                "PRAGMAS": settings.DATABASE_PROFILES["production"]["PRAGMAS"],
+            }
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("PRAGMA journal_mode")
+                    self.assertEqual(cursor.fetchone()[0], "wal")
+                    cursor.execute("PRAGMA synchronous")
+                    self.assertEqual(cursor.fetchone()[0], 1)
+            finally:
+                conn.close()
+
+    def test_benchmark(self):
+        User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+        out = StringIO()
+        call_command("benchmark_database", seconds=0.2, processes=2, tasks=20, stdout=out)
+        for name in settings.DATABASE_PROFILES:
+            self.assertIn(name, out.getvalue())
+        # Рабочая (здесь тестовая) база не меняется
+        self.assertFalse(Task.objects.exists())
+
+
+@override_settings(REPLICA_DATABASE="replica")
+class ReplicaRouterTests(TransactionTestCase):
+    # Вне транзакции TestCase: внутри транзакции роутер всегда выбирает основную базу
+    def setUp(self):
+        self.router = ReplicaRouter()
+        # Записи в других тестах вне запросов оставили флаг в контексте потока
+        token = routers._wrote.set(False)
+        self.addCleanup(routers._wrote.reset, token)
+
+    def test_reads_go_to_replica_only_in_replica_views(self):
+        self.assertIsNone(self.router.db_for_read(Task))
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Task), "replica")
+            # Сессии и пользователи - всегда из основной базы
+            self.assertIsNone(self.router.db_for_read(User))
+
+    def test_transactions_and_writes_use_primary(self):
+        with replica_reads():
+            with transaction.atomic():
+                self.assertIsNone(self.router.db_for_read(Task))
+
+    def test_write_pins_user_to_primary(self):
+        factory = RequestFactory()
+        seen = []
+
+        def view(request):
+            with replica_reads():
+                seen.append(self.router.db_for_read(Task))
+                if request.method == "POST":
+                    self.assertEqual(self.router.db_for_write(Task), "default")
+                    seen.append(self.router.db_for_read(Task))
+            return HttpResponse()
+
+        middleware = replica_middleware(view)
+        self.assertNotIn(PIN_COOKIE, middleware(factory.get("/")).cookies)
+        response = middleware(factory.post("/"))
+        self.assertEqual(seen, ["replica", "replica", None])
+
+        # Следующий запрос с cookie читает из основной базы
+        request = factory.get("/")
+        request.COOKIES[PIN_COOKIE] = response.cookies[PIN_COOKIE].value
+        middleware(request)
+        self.assertEqual(seen[-1], None)
+        # Флаги не протекают в следующий запрос без cookie
+        middleware(factory.get("/"))
+        self.assertEqual(seen[-1], "replica")
+
+
+# Кэш тестов - LocMem одного процесса, его и считаем общим
+@override_settings(AUTH_CACHE=True, SESSION_ENGINE="django.contrib.sessions.backends.cached_db")
+class CachedAuthTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user("admin", "admin@tms.local", "pass", role=User.Role.ADMIN)
+        self.manager = User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+        self.manager.user_permissions.add(Permission.objects.get(codename="change_task"))
+        self.task = Task.objects.create(title="Задача", description="Описание", author=self.manager)
+        self.client.force_login(self.manager)
+
+    def auth_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        # Сессия, пользователь по id и его права; выбор исполнителя в форме сюда не входит
+        markers = ('FROM "django_session"', 'WHERE "authentication_user"."id" =', 'FROM "auth_permission"')
+        return response, [q["sql"] for q in ctx.captured_queries if any(m in q["sql"] for m in markers)]
+
+    def test_warm_requests_skip_auth_queries(self):
+        url = reverse("tasksystem:update_task", args=[self.task.slug])
+        response, queries = self.auth_queries(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(queries)
+        # Пользователь, его права (has_perm в TaskUpdateView) и сессия - из кэша
+        response, queries = self.auth_queries(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+    def test_role_change_and_delete_invalidate(self):
+        self.auth_queries(reverse("tasksystem:content"))
+        self.assertEqual(self.client.get(reverse("tasksystem:dashboard")).status_code, 403)
+
+        # Администратор меняет роль (UserUpdateView сохраняет форму через save())
+        self.manager.role = User.Role.ADMIN
+        self.manager.save()
+        self.assertEqual(self.client.get(reverse("tasksystem:dashboard")).status_code, 200)
+
+        # После удаления (UserDeleteView) сессия больше не пускает
+        User.objects.get(pk=self.manager.pk).delete()
+        response = self.client.get(reverse("tasksystem:content"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_local_cache_is_not_used(self):
+        # Без общего кэша каждый запрос читает пользователя из базы: изменение
+        # из другого процесса (здесь - update() мимо сигналов) видно сразу
+        with override_settings(AUTH_CACHE=False):
+            self.auth_queries(reverse("tasksystem:content"))
+            User.objects.filter(pk=self.manager.pk).update(role=User.Role.ADMIN)
+            self.assertEqual(self.client.get(reverse("tasksystem:dashboard")).status_code, 200)
+
+    def test_existing_sessions_switch_backend(self):
+        # Сессии, открытые через ModelBackend, миграция переводит на CachedModelBackend
+        migration = import_module("authentication.migrations.0010_session_backend_path")
+        session = SessionStore()
+        session.update({SESSION_KEY: str(self.manager.pk), BACKEND_SESSION_KEY: migration.MODEL_BACKEND})
+        session.save()
+        migration.switch_backend(migration.MODEL_BACKEND, migration.CACHED_BACKEND)(apps, mock.Mock(connection=connection))
+        self.assertEqual(SessionStore(session.session_key).load()[BACKEND_SESSION_KEY], migration.CACHED_BACKEND)
+
+    def test_permission_change_invalidates(self):
+        backend = CachedModelBackend()
+        self.assertFalse(backend.get_user(self.manager.pk).has_perm("tasksystem.delete_task"))
+        self.manager.user_permissions.add(Permission.objects.get(codename="delete_task"))
+        self.assertTrue(backend.get_user(self.manager.pk).has_perm("tasksystem.delete_task"))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user("admin", "admin@tms.local", "pass", role=User.Role.ADMIN)
+        self.manager = User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+        patcher = mock.patch.object(metrics, "registry", metrics.Registry())
+        self.registry = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_view_metrics(self):
+        self.client.force_login(self.admin)
+        self.client.get(reverse("tasksystem:content"))
+        self.client.get(reverse("tasksystem:dashboard"))
+        self.client.get("/no/such/page/")
+
+        response = self.client.get(reverse("tasksystem:api_metrics"))
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn('tms_http_requests_total{view="tasksystem:content",method="GET",status="200"} 1', body)
+        self.assertIn('tms_http_requests_total{view="<unresolved>",method="GET",status="404"} 1', body)
+        self.assertIn('tms_http_request_duration_seconds_count{view="tasksystem:dashboard"} 1', body)
+        self.assertIn('tms_http_request_duration_seconds_bucket{view="tasksystem:dashboard",le="+Inf"} 1', body)
+        self.assertIn('tms_function_duration_seconds_count{function="info_for_dashboard"} 1', body)
+        self.assertIn('tms_function_duration_seconds_count{function="aget_menu"}', body)
+
+        queries = {tuple(labels): values[0] for labels, values in self.registry.snapshot()["queries"]}
+        self.assertGreater(queries[("tasksystem:content",)], 0)
+
+    async def test_queries_under_asgi(self):
+        # Запросы async-представлений идут через соединения потоков sync_to_async
+        await sync_to_async(self.async_client.force_login)(self.admin)
+        for url in (reverse("tasksystem:content"), reverse("tasksystem:search") + "?q=задача"):
+            self.assertEqual((await self.async_client.get(url)).status_code, 200)
+        queries = {tuple(labels): values[0] for labels, values in self.registry.snapshot()["queries"]}
+        self.assertGreater(queries[("tasksystem:content",)], 0)
+        self.assertGreater(queries[("tasksystem:search",)], 0)
+
+    def test_access(self):
+        url = reverse("tasksystem:api_metrics")
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(self.manager)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.logout()
+        with override_settings(METRICS_TOKEN="secret"):
+            self.assertEqual(self.client.get(url, headers={"Authorization": "Bearer wrong"}).status_code, 401)
+            self.assertEqual(self.client.get(url, headers={"Authorization": "Bearer secret"}).status_code, 200)
+
+    def test_histogram_and_processes(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            # Два процесса сервера - два реестра с общим каталогом
+            other = metrics.Registry()
+            other.name = "other.json"
+            for registry, seconds in ((self.registry, 0.005), (other, 0.3)):
+                registry.record_request("tasksystem:content", "GET", 200, seconds, metrics.QueryCounter(), 100)
+            other.flush()
+            snapshot = self.registry.collect()
+        body = metrics.render(snapshot)
+
+        self.assertIn('tms_http_requests_total{view="tasksystem:content",method="GET",status="200"} 2', body)
+        # Граница корзины входит в нее, корзины накопительные
+        self.assertIn('tms_http_request_duration_seconds_bucket{view="tasksystem:content",le="0.005"} 1', body)
+        self.assertIn('tms_http_request_duration_seconds_bucket{view="tasksystem:content",le="0.25"} 1', body)
+        self.assertIn('tms_http_request_duration_seconds_bucket{view="tasksystem:content",le="0.5"} 2', body)
+        [(_, latency)] = snapshot["latency"]
+        self.assertAlmostEqual(latency[-1], 0.305)
+        self.assertIn('tms_http_response_bytes_total{view="tasksystem:content"} 200', body)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user("admin", "admin@tms.local", "pass", role=User.Role.ADMIN)
+        self.manager = User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+        Task.objects.create(title="Задача", description="Описание", author=self.manager)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(PROFILE_DIR=self.directory, PROFILE_INTERVAL=0.0005)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def profiles(self):
+        return sorted(path.relative_to(self.directory).as_posix() for path in Path(self.directory).glob("*/*"))
+
+    def test_admin_flag(self):
+        self.client.force_login(self.admin)
+        url = reverse("tasksystem:content")
+        response = self.client.get(url, {"_profile": "cprofile"})
+        self.assertTrue(response[profiling.HEADER].startswith("tasksystem.content/"))
+        self.assertTrue(response[profiling.HEADER].endswith(".prof"))
+        response = self.client.get(url, headers={profiling.HEADER: "sampler"})
+        self.assertTrue(response[profiling.HEADER].endswith(".collapsed"))
+        self.assertEqual(len(self.profiles()), 2)
+
+        out = StringIO()
+        call_command("profile_summary", dir=self.directory, stdout=out)
+        self.assertIn("tasksystem.content: 2", out.getvalue())
+        self.assertIn("cProfile, 1", out.getvalue())
+        self.assertIn("Сэмплер, 1", out.getvalue())
+
+    def test_flag_ignored_for_non_admin(self):
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse("tasksystem:content"), {"_profile": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(profiling.HEADER, response)
+        self.assertEqual(self.profiles(), [])
+
+    async def test_sampler_under_asgi(self):
+        # Синхронное представление под ASGI идет не в потоке цикла событий, а в
+        # потоке sync_to_async, который создан до запроса
+        await sync_to_async(self.client.force_login)(self.manager)
+        self.async_client.cookies = self.client.cookies
+        get_menu = views.get_menu
+
+        def slow_menu(user):
+            time.sleep(0.02)
+            return get_menu(user)
+
+        with override_settings(PROFILE_SAMPLE_RATE=1.0), mock.patch("tasksystem.views.get_menu", slow_menu):
+            for _ in range(2):
+                self.assertEqual((await self.async_client.get(reverse("tasksystem:completed_tasks"))).status_code, 200)
+        for path in Path(self.directory).glob("*/*.collapsed"):
+            self.assertIn("completed_tasks (", path.read_text())
+        self.assertEqual(len(self.profiles()), 2)
+
+    def test_sampler_skips_other_threads(self):
+        # Поток, запущенный во время запроса не самим запросом (например, другим
+        # запросом), в профиль не попадает
+        self.client.force_login(self.admin)
+        get_menu = views.get_menu
+        started = threading.Event()
+        stop = threading.Event()
+
+        def unrelated_work():
+            started.set()
+            while not stop.is_set():
+                sum(range(100))
+
+        other = threading.Thread(target=unrelated_work)
+
+        def slow_menu(user):
+            other.start()
+            started.wait()
+            time.sleep(0.02)
+            return get_menu(user)
+
+        try:
+            with mock.patch("tasksystem.views.get_menu", slow_menu):
+                response = self.client.get(reverse("tasksystem:completed_tasks"), headers={profiling.HEADER: "sampler"})
+        finally:
+            stop.set()
+            other.join()
+        stacks = (Path(self.directory) / response[profiling.HEADER]).read_text()
+        self.assertIn("completed_tasks (", stacks)
+        self.assertNotIn("unrelated_work (", stacks)
+
+    def test_sampling_and_rotation(self):
+        self.client.force_login(self.manager)
+        with override_settings(PROFILE_SAMPLE_RATE=1.0, PROFILE_MAX_FILES=2):
+            for _ in range(3):
+                response = self.client.get(reverse("tasksystem:completed_tasks"))
+                self.assertNotIn(profiling.HEADER, response)
+        profiles = self.profiles()
+        self.assertEqual(len(profiles), 2)
+        self.assertTrue(all(p.startswith("tasksystem.completed_tasks/") and p.endswith(".collapsed") for p in profiles))
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+        self.printer = Task.objects.create(title="Починить принтер", description="В бухгалтерии не печатает", author=self.manager)
+        self.report = Task.objects.create(title="Квартальный отчет", description="Собрать отчеты отделов", author=self.manager)
+        Task.objects.create(title="Разное", description="Упомянуть отчет в рассылке", author=self.manager)
+
+    def found(self, query):
+        return [t.title for t in search_tasks(query, Task.objects.all())[0]]
+
+    def test_stemming_and_ranking(self):
+        self.assertEqual(self.found("отчетов"), ["Квартальный отчет", "Разное"])
+        self.assertEqual(self.found("принтера печатать"), ["Починить принтер"])
+        self.assertEqual(self.found('" OR *'), [])
+
+    def test_index_follows_changes(self):
+        Task.objects.filter(pk=self.printer.pk).update(title="Заправить картридж")
+        self.report.delete()
+        Task.objects.bulk_create([Task(title="Картриджи на складе", description="Описание", author=self.manager)])
+        self.assertCountEqual(self.found("картриджа"), ["Заправить картридж", "Картриджи на складе"])
+        self.assertEqual(self.found("квартальный"), [])
+        call_command("rebuild_search_index", "--check", stdout=StringIO())
+
+    def test_pages(self):
+        tasks, has_next = search_tasks("отчет", Task.objects.all(), page=1, page_size=1)
+        self.assertEqual(([t.title for t in tasks], has_next), (["Квартальный отчет"], True))
+        tasks, has_next = search_tasks("отчет", Task.objects.all(), page=2, page_size=1)
+        self.assertEqual(([t.title for t in tasks], has_next), (["Разное"], False))
+
+    def test_suggest(self):
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse("tasksystem:search_suggest"), {"q": "починить при"})
+        self.assertEqual(response.json(), {"results": [{"title": "Починить принтер", "url": self.printer.get_absolute_url()}]})
+
+    def test_scoped_by_role(self):
+        # Завершенные задачи чужого менеджера не видны ни в поиске, ни в подсказках
+        other = User.objects.create_user("other", "other@tms.local", "pass", role=User.Role.MANAGER)
+        admin = User.objects.create_user("admin", "admin@tms.local", "pass", role=User.Role.ADMIN)
+        Task.objects.filter(pk=self.report.pk).update(status=Task.Status.COMPLETED)
+        for user, expected in ((self.manager, 2), (other, 1), (admin, 2)):
+            with self.subTest(user=user.username):
+                self.client.force_login(user)
+                response = self.client.get(reverse("tasksystem:search"), {"q": "отчет"})
+                self.assertEqual(len(response.context["tasks"]), expected)
+                response = self.client.get(reverse("tasksystem:search_suggest"), {"q": "кварт"})
+                self.assertEqual(len(response.json()["results"]), expected - 1)
+
+        # Скрытые задачи отбрасываются до LIMIT: страница полная, а не с дырой
+        tasks, has_next = search_tasks("отчет", Task.objects.visible_to(other), page=1, page_size=1)
+        self.assertEqual(([t.title for t in tasks], has_next), (["Разное"], False))
+
+    def test_short_terms(self):
+        # Однобуквенные слова не ищутся: ни как префикс, ни как слово запроса
+        self.assertEqual(self.found("к"), [])
+        self.assertEqual(self.found("в принтер"), ["Починить принтер"])
+        self.assertEqual(suggest_titles("п", Task.objects.all()), [])
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse("tasksystem:search"), {"q": "к"})
+        self.assertTrue(response.context["too_short"])
+        self.assertContains(response, "Слишком короткий запрос")
+        self.assertEqual(self.client.get(reverse("tasksystem:search_suggest"), {"q": "к"}).json(), {"results": []})
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user("admin", "admin@tms.local", "pass", role=User.Role.ADMIN)
+        cls.manager = User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+        cls.worker = User.objects.create_user("worker", "worker@tms.local", "pass", role=User.Role.WORKER)
+        Task.objects.bulk_create(
+            Task(title=f"Задача {i}", description="Описание", author=cls.admin if i % 2 else cls.manager, worker=cls.worker if i % 3 else None,
+                 status=Task.Status.COMPLETED if i % 5 == 0 else Task.Status.WORKING if i % 3 else Task.Status.PENDING)
+            for i in range(1, 51)
+        )
+
+    def test_cursor_pages(self):
+        self.client.force_login(self.admin)
+        ids, cursor = [], ""
+        while cursor is not None:
+            page = self.client.get(reverse("tasksystem:api_task_list"), {"limit": 7, "cursor": cursor, "worker": "worker"}).json()
+            ids += [task["id"] for task in page["results"]]
+            cursor = page["next_cursor"]
+        self.assertEqual(ids, list(Task.objects.filter(worker=self.worker).order_by("id").values_list("id", flat=True)))
+
+    def test_manager_sees_only_own_completed(self):
+        self.client.force_login(self.manager)
+        page = self.client.get(reverse("tasksystem:api_task_list"), {"status": "CP"}).json()
+        self.assertEqual({task["author"] for task in page["results"]}, {"manager"})
+        self.assertEqual(self.client.get(reverse("tasksystem:api_task_list"), {"status": "XX"}).status_code, 400)
+
+    def test_access(self):
+        self.assertEqual(self.client.get(reverse("tasksystem:api_task_list")).status_code, 401)
+        self.client.force_login(self.worker)
+        self.assertEqual(self.client.get(reverse("tasksystem:api_task_export")).status_code, 403)
+
+    def test_export_streams_every_task(self):
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("tasksystem:api_task_export"), {"status": "WK"})
+            lines = b"".join(response.streaming_content).decode().splitlines()
+        # Сессия, пользователь, отметка ленты и одна выборка строк
+        self.assertEqual(len(ctx.captured_queries), 4)
+        self.assertEqual([json.loads(line)["id"] for line in lines], list(
+            Task.objects.filter(status=Task.Status.WORKING).order_by("id").values_list("id", flat=True)
+        ))
+
+        response = self.client.get(reverse("tasksystem:api_task_export"), {"format": "json"})
+        self.assertEqual(len(json.loads(b"".join(response.streaming_content))), 50)
+
+    async def test_export_streams_under_asgi(self):
+        await sync_to_async(self.async_client.force_login)(self.admin)
+        with mock.patch("tasksystem.api.EXPORT_WRITE_ROWS", 20):
+            response = await self.async_client.get(reverse("tasksystem:api_task_export"))
+            # Асинхронный итератор: ASGI-обработчик не собирает ответ в список целиком
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(b"".join(chunks).decode().splitlines()), 50)
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user("admin", "admin@tms.local", "pass", role=User.Role.ADMIN)
+        self.manager = User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+        self.worker = User.objects.create_user("worker", "worker@tms.local", "pass", role=User.Role.WORKER)
+        self.own = Task.objects.create(title="Своя", description="Описание", author=self.manager)
+        self.other = Task.objects.create(title="Чужая", description="Описание", author=self.admin, worker=self.worker)
+
+    def feed(self, user, since, limit=""):
+        self.client.force_login(user)
+        return self.client.get(reverse("tasksystem:api_task_changes"), {"since": since, "limit": limit}).json()
+
+    def test_changes_and_tombstones_in_order(self):
+        since = self.feed(self.admin, 0)["next_since"]
+        Task.objects.claim(self.own.pk, self.worker)
+        Task.objects.filter(pk=self.other.pk).update(title="Переименована")
+        own_pk = self.own.pk
+        self.own.delete()
+        bulk = Task.objects.bulk_create([Task(title="Импорт", description="Описание", author=self.manager)])
+
+        feed = self.feed(self.admin, since)
+        self.assertEqual([t["title"] for t in feed["changes"]], ["Переименована", "Импорт"])
+        self.assertEqual([t["id"] for t in feed["deleted"]], [own_pk])
+        self.assertEqual(self.feed(self.admin, feed["next_since"])["changes"], [])
+
+        self.manager.delete()  # каскадное удаление задач автора
+        self.assertEqual([t["id"] for t in self.feed(self.admin, feed["next_since"])["deleted"]], [bulk[0].pk])
+
+    def test_save_of_stale_instance_gets_new_seq(self):
+        # Экземпляр из create() хранит change_seq = 0, а в базе номер уже проставлен триггером
+        task = Task.objects.create(title="Новая", description="Описание", author=self.manager)
+        since = self.feed(self.admin, 0)["next_since"]
+        task.status = Task.Status.COMPLETED
+        task.save()
+        feed = self.feed(self.admin, since)
+        self.assertEqual([(t["id"], t["status"]) for t in feed["changes"]], [(task.pk, Task.Status.COMPLETED)])
+        self.assertGreater(feed["next_since"], since)
+
+        # Даже если устаревший номер записан напрямую, триггер не выдает его повторно
+        Task.objects.filter(pk=task.pk).update(change_seq=0, title="Снова")
+        self.assertEqual([t["title"] for t in self.feed(self.admin, feed["next_since"])["changes"]], ["Снова"])
+
+    def test_pages(self):
+        seen, since, has_more = [], 0, True
+        while has_more:
+            feed = self.feed(self.admin, since, limit=1)
+            seen += [t["id"] for t in feed["changes"]]
+            since, has_more = feed["next_since"], feed["has_more"]
+        self.assertEqual(seen, [self.own.pk, self.other.pk])
+
+    def test_foreign_completed_task_leaves_manager_mirror(self):
+        since = self.feed(self.manager, 0)["next_since"]
+        Task.objects.complete(self.other.pk, self.worker, self.admin.pk)
+        feed = self.feed(self.manager, since)
+        self.assertEqual((feed["changes"], feed["deleted"][0]["id"]), ([], self.other.pk))
+
+
+class QueryPlanTests(TestCase):
+    def test_list_queries_use_indexes(self):
+        call_command("check_query_plans", stdout=StringIO())
+
+
+class SlugTests(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+
+    def create(self, title):
+        return Task.objects.create(title=title, description="Описание", author=self.manager)
+
+    def insert(self, *slugs):
+        # Строки с готовыми слагами, в обход подбора
+        tasks = [Task(title="Отчет", description="Описание", author=self.manager, slug=slug) for slug in slugs]
+        for task in tasks:
+            task._slug_allocated = True
+        Task.objects.bulk_create(tasks)
+
+    def test_slugify(self):
+        cases = {
+            "Исправить баг": "ispravit-bag",
+            "ЩЁЛКНУТЬ Переключатель": "shchyolknut-pereklyuchatel",
+            # Мягкий и твердый знаки пропадают, ы и й - по таблице
+            "Подъезд, мышь и йогурт": "podezd-mish-i-jogurt",
+            "Fix flaky test #42": "fix-flaky-test-42",
+            "  Отчёт — за 2024/Q1!  ": "otchyot-za-2024q1",
+            # Прочие алфавиты транслитерирует python-slugify
+            "Ελληνικά": "ellenika",
+            "测试任务": "ce-shi-ren-wu",
+            "Straße и кафе": "strasse-i-kafe",
+            "!!!": "",
+            "": "",
+        }
+        for title, expected in cases.items():
+            with self.subTest(title=title):
+                self.assertEqual(slugify(title), expected)
+
+    def test_titles_without_cyrillic_or_letters(self):
+        self.assertEqual([self.create("测试任务").slug for _ in range(2)], ["ce-shi-ren-wu", "ce-shi-ren-wu-2"])
+        self.assertEqual(self.create("Ελληνικά").slug, "ellenika")
+        # От заголовка не осталось букв: основа - EMPTY_SLUG, а не пустая строка
+        self.assertEqual([self.create(title).slug for title in ("!!!", "—", "?!")], ["task", "task-2", "task-3"])
+        rows = [(1, {"title": "!!!", "description": "Описание"}, None)]
+        TaskImporter(default_author=self.manager).run(rows)
+        self.assertTrue(Task.objects.filter(slug="task-4").exists())
+
+    def test_next_free_slug(self):
+        self.assertEqual(next_free_slug("otchet", 0, None), "otchet")
+        self.assertEqual(next_free_slug("otchet", 1, None), "otchet-2")
+        self.assertEqual(next_free_slug("otchet", 1, 9), "otchet-10")
+        # Свободный base занимается, даже если номера уже есть
+        self.assertEqual(next_free_slug("otchet", 0, 5), "otchet")
+
+    def test_collisions(self):
+        slugs = [self.create("Отчет").slug for _ in range(3)]
+        self.assertEqual(slugs, ["otchet", "otchet-2", "otchet-3"])
+        # Номер - следующий за наибольшим, а не первый свободный; похожие слаги не мешают
+        Task.objects.filter(slug="otchet-2").delete()
+        self.insert("otchet-9", "otchet-10abc", "otchet-x", "otchetnost", "otchet-2-1")
+        with CaptureQueriesContext(connection) as ctx:
+            task = self.create("Отчет")
+        self.assertEqual(task.slug, "otchet-10")
+        # Подбор слага - один запрос, занятые слаги в Python не читаются
+        lookups = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith("SELECT") and "MAX(" in q["sql"]]
+        self.assertEqual(len(lookups), 1)
+
+    def test_unchanged_title_keeps_slug(self):
+        first, second = self.create("Отчет"), self.create("Отчет")
+        second.description = "Новое описание"
+        second.save()
+        self.assertEqual(second.slug, "otchet-2")
+        second.title = "Другое"
+        second.save()
+        self.assertEqual(second.slug, "drugoe")
+
+    def test_concurrent_duplicate(self):
+        # Параллельная задача с тем же заголовком заняла слаг между подбором и
+        # INSERT: первый подбор видит базу до ее записи. Сохранение подбирает
+        # слаг заново, а не падает на уникальном индексе
+        field = Task._meta.get_field("slug")
+        create_slug = field.create_slug
+        stale = []
+
+        def racing_create_slug(instance, add):
+            if stale:
+                return create_slug(instance, add)
+            stale.append(instance)
+            instance.slug = "otchet-2"
+            return instance.slug
+
+        self.create("Отчет")
+        self.insert("otchet-2")
+        with mock.patch.object(field, "create_slug", racing_create_slug):
+            task = self.create("Отчет")
+        self.assertEqual(task.slug, "otchet-3")
+        self.assertEqual(len(stale), 1)
+        self.assertEqual(Task.objects.filter(slug__startswith="otchet").count(), 3)
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user("admin", "admin@tms.local", "pass", role=User.Role.ADMIN)
+        self.manager = User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+        self.worker = User.objects.create_user("worker", "worker@tms.local", "pass", role=User.Role.WORKER)
+
+    def run_import(self, rows, **kwargs):
+        rows = [(n, row, None) for n, row in enumerate(rows, start=1)]
+        return TaskImporter(default_author=self.manager, **kwargs).run(rows)
+
+    def test_bad_rows(self):
+        importer = self.run_import([
+            {"title": "", "description": "Описание"},
+            {"title": "Задача", "description": ""},
+            {"title": "З" * 91, "description": "Описание"},
+            {"title": "Задача", "description": "Описание", "status": "XX"},
+            {"title": "Задача", "description": "Описание", "status": "CP"},
+            {"title": "Годная", "description": "Описание"},
+        ])
+        self.assertEqual(importer.created, 1)
+        self.assertEqual([line for line, _ in importer.errors], [1, 2, 3, 4, 5])
+        self.assertIn("нужен исполнитель", importer.errors[-1][1])
+
+    def test_unknown_author_and_worker(self):
+        importer = self.run_import([
+            {"title": "Задача", "description": "Описание", "author": "nobody"},
+            {"title": "Задача", "description": "Описание", "worker": "nobody"},
+            # Не исполнитель не может быть исполнителем
+            {"title": "Задача", "description": "Описание", "worker": "manager"},
+            {"title": "Задача", "description": "Описание", "author": "admin", "worker": "worker"},
+        ])
+        self.assertEqual([error for _, error in importer.errors], [
+            "автор 'nobody' не найден", "исполнитель 'nobody' не найден", "исполнитель 'manager' не найден",
+        ])
+        task = Task.objects.get()
+        self.assertEqual((task.author, task.worker, task.status), (self.admin, self.worker, Task.Status.WORKING))
+
+        # Менеджер импортирует только от своего имени
+        self.run_import([{"title": "Чужая", "description": "Описание", "author": "admin"}], force_author=True)
+        self.assertEqual(Task.objects.get(title="Чужая").author, self.manager)
+
+    def test_slug_collisions_within_file(self):
+        Task.objects.create(title="Отчет", description="Описание", author=self.manager)
+        self.run_import([{"title": "Отчет", "description": "Описание"}] * 3, batch_size=2)
+        self.assertEqual(
+            sorted(Task.objects.filter(title="Отчет").values_list("slug", flat=True)),
+            ["otchet", "otchet-2", "otchet-3", "otchet-4"],
+        )
+
+    def test_failed_batch_keeps_other_batches(self):
+        bulk_create = Task.objects.bulk_create
+        calls = []
+
+        def failing_second_batch(tasks, **kwargs):
+            calls.append(len(tasks))
+            if len(calls) == 2:
+                raise DatabaseError("disk I/O error")
+            return bulk_create(tasks, **kwargs)
+
+        rows = [{"title": f"Задача {n}", "description": "Описание"} for n in range(5)]
+        with mock.patch.object(Task.objects, "bulk_create", failing_second_batch):
+            importer = self.run_import(rows, batch_size=2)
+        self.assertEqual(importer.created, 3)
+        self.assertEqual([line for line, _ in importer.errors], [3, 4])
+        self.assertEqual(Task.objects.count(), 3)
+        # Счетчики меню учли только сохраненные задачи
+        self.assertEqual(counters.get_counters(counters.OPEN_TASKS)[counters.OPEN_TASKS], 3)
+
+    def test_encoding_errors(self):
+        self.client.force_login(self.manager)
+        content = "title,description\nЗадача,Описание\n".encode("cp1251")
+        response = self.client.post(reverse("tasksystem:import_tasks"), {
+            "file": SimpleUploadedFile("tasks.csv", content), "format": "csv",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("UTF-8", response.context["form"].errors["file"][0])
+        self.assertFalse(Task.objects.exists())
+
+        # Из команды импорта файл не проверяется заранее: ошибка - последней строкой
+        stream = io.TextIOWrapper(io.BytesIO(b"title,description\n\xff\xfe\x00"), encoding="utf-8-sig", newline="")
+        self.assertEqual(list(read_rows(stream, "csv"))[-1][1:], (None, "файл не в кодировке UTF-8, дальше он не прочитан"))
+
+
+class AssignmentTests(TestCase):
+    def setUp(self):
+        loads.invalidate()
+        self.manager = User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+        self.workers = [
+            User.objects.create_user(f"worker{i}", f"worker{i}@tms.local", "pass", role=User.Role.WORKER)
+            for i in range(3)
+        ]
+        for _ in range(2):
+            Task.objects.create(title="Задача", description="Описание", author=self.manager, worker=self.workers[0])
+
+    def working(self):
+        return [Task.objects.filter(worker=w, status=Task.Status.WORKING).count() for w in self.workers]
+
+    def test_create_task_picks_least_loaded(self):
+        self.client.force_login(self.manager)
+        for i in range(4):
+            self.client.post(
+                reverse("tasksystem:create_task"),
+                {"title": f"Новая {i}", "description": "Описание", "auto_assign": "on"},
+            )
+        self.assertEqual(self.working(), [2, 2, 2])
+
+    def test_heap_follows_status_changes(self):
+        Task.objects.complete(Task.objects.filter(worker=self.workers[0]).first().pk, self.workers[0], self.manager.pk)
+        Task.objects.create(title="Задача", description="Описание", author=self.manager, worker=self.workers[1])
+        Task.objects.create(title="Задача", description="Описание", author=self.manager, worker=self.workers[1])
+        loads.take()  # куча загружена до следующих изменений
+        Task.objects.filter(worker=self.workers[1]).first().delete()
+        self.assertEqual(loads.loads, {w.pk: n for w, n in zip(self.workers, [1, 1, 1])})
+
+    def test_import_spreads_rows(self):
+        rows = [(n, {"title": f"Импорт {n}", "description": "Описание"}, None) for n in range(7)]
+        TaskImporter(default_author=self.manager, auto_assign=True, batch_size=3).run(rows)
+        self.assertEqual(self.working(), [3, 3, 3])
+        self.assertEqual(loads.loads, {w.pk: 3 for w in self.workers})
+        self.assertEqual(loads.reserved, {w.pk: 0 for w in self.workers})
+
+    def test_new_and_blocked_workers(self):
+        loads.take()
+        loads.take()
+        newcomer = User.objects.create_user("worker9", "worker9@tms.local", "pass", role=User.Role.WORKER)
+        self.assertEqual(loads.take(), newcomer.pk)
+        newcomer.is_active = False
+        newcomer.save()
+        self.assertNotIn(newcomer.pk, loads.loads)
+
+
+class ClaimContentionTests(TransactionTestCase):
+    # Много исполнителей одновременно берут одну и ту же задачу
+    THREADS = 16
+    ATTEMPTS = 25
+
+    def setUp(self):
+        self.manager = User.objects.create_user("manager", "manager@tms.local", "pass", role=User.Role.MANAGER)
+        self.workers = [
+            User.objects.create_user(f"worker{i}", f"worker{i}@tms.local", "pass", role=User.Role.WORKER)
+            for i in range(self.THREADS)
+        ]
+
+    def hammer(self, action):
+        # Скорость попыток здесь не проверяется: ее замеряет manage.py benchmark_claims
+        wins, errors, _ = hammer(action, self.workers, self.ATTEMPTS)
+        self.assertEqual(errors, [])
+        return wins
+
+    def test_exactly_one_claim_wins(self):
+        task = Task.objects.create(title="Задача", description="Описание", author=self.manager)
+        wins = self.hammer(lambda worker: Task.objects.claim(task.pk, worker))
+
+        self.assertEqual(len(wins), 1)
+        task.refresh_from_db()
+        self.assertEqual((task.worker, task.status), (wins[0], Task.Status.WORKING))
+        key = counters.working_key(wins[0].pk)
+        self.assertEqual(counters.get_counters(key)[key], 1)
+
+    def test_exactly_one_completion_wins(self):
+        task = Task.objects.create(title="Задача", description="Описание", author=self.manager, worker=self.workers[0])
+        self.workers = [self.workers[0]] * self.THREADS
+        wins = self.hammer(lambda worker: Task.objects.complete(task.pk, worker, task.author_id))
+
+        self.assertEqual(len(wins), 1)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.Status.COMPLETED)
+        out = StringIO()
+        call_command("rebuild_counters", "--check", stdout=out)
+        self.assertIn("Счетчики совпадают", out.getvalue())
+
+    def test_dispatch_returns_the_dispatched_task(self):
+        # У исполнителя уже есть задача с тем же временем изменения: выданная
+        # задача определяется по id, а не по исполнителю и времени
+        worker = self.workers[0]
+        taken = Task.objects.create(title="Взятая", description="Описание", author=self.manager)
+        free = Task.objects.create(title="Свободная", description="Описание", author=self.manager)
+        now = timezone.now()
+        with mock.patch("tasksystem.models.timezone.now", return_value=now):
+            Task.objects.claim(taken.pk, worker)
+            task = Task.objects.dispatch(worker)
+        self.assertEqual((task.pk, task.worker, task.status), (free.pk, worker, Task.Status.WORKING))
+        self.assertIsNone(Task.objects.dispatch(worker))
+
+    def test_dispatch_never_assigns_twice(self):
+        Task.objects.bulk_create(
+            Task(title=f"Задача {i}", description="Описание", author=self.manager, slug=f"zadacha-{i}")
+            for i in range(100)
+        )
+        call_command("rebuild_counters", stdout=StringIO())
+        assigned = []
+
+        def take(worker):
+            task = Task.objects.dispatch(worker)
+            if task is not None:
+                assigned.append(task.pk)
+            return task
+
+        self.hammer(take)
+
+        self.assertEqual(len(assigned), 100)
+        self.assertEqual(len(set(assigned)), 100)
+        self.assertFalse(Task.objects.filter(status=Task.Status.PENDING).exists())
+        out = StringIO()
+        call_command("rebuild_counters", "--check", stdout=out)
+        self.assertIn("Счетчики совпадают", out.getvalue())
@@ -1,17 +1,29 @@
 from django.urls import path
-from tasksystem import views
+from tasksystem import api, views
 
 
 app_name = "tasksystem"
 
 urlpatterns = [
     path("", views.content, name="content"),  # http://127.0.0.1:8000
+    path("tasks/more/", views.content_more, name="content_more"),
+    path("tasks/events/", views.board_events, name="board_events"),
+    path("tasks/<int:pk>/card/", views.task_card, name="task_card"),
+    path("search/", views.search, name="search"),
+    path("search/suggest/", views.search_suggest, name="search_suggest"),
     path("task_detail/<slug:tasks_slug>/", views.task_detail, name="task_detail"),
     path("required_tasks/", views.required_tasks, name="required_tasks"),
     path("completed_tasks/", views.completed_tasks, name="completed_tasks"),
     path("create_task/", views.create_task, name="create_task"),
+    path("import_tasks/", views.import_tasks, name="import_tasks"),
     path("update_task/<slug:slug>/", views.TaskUpdateView.as_view(), name="update_task"),
     path("delete_task/<int:pk>/", views.delete_task, name="delete_task"),
     path("claim_task/<int:pk>/", views.claim_task, name="claim_task"),
+    path("next_task/", views.next_task, name="next_task"),
     path("dashboard/", views.dashboard, name="dashboard"),
+    path("api/tasks/", api.task_list, name="api_task_list"),
+    path("api/tasks/export/", api.task_export, name="api_task_export"),
+    path("api/tasks/changes/", api.task_changes, name="api_task_changes"),
+    path("api/metrics/", api.metrics_export, name="api_metrics"),
+    path("api/cache/cards/", api.card_cache_stats, name="api_card_cache_stats"),
 ]
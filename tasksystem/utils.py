@@ -1,70 +1,99 @@
-from django.db.models import Q, Count
-from django.template.defaultfilters import slugify as django_slugify
-
-from authentication.models import User
-from tasksystem.models import Task
-
-alphabet = {
-    "а": "a",
-    "б": "b",
-    "в": "v",
-    "г": "g",
-    "д": "d",
-    "е": "e",
-    "ё": "yo",
-    "ж": "zh",
-    "з": "z",
-    "и": "i",
-    "й": "j",
-    "к": "k",
-    "л": "l",
-    "м": "m",
-    "н": "n",
-    "о": "o",
-    "п": "p",
-    "р": "r",
-    "с": "s",
-    "т": "t",
-    "у": "u",
-    "ф": "f",
-    "х": "kh",
-    "ц": "ts",
-    "ч": "ch",
-    "ш": "sh",
-    "щ": "shch",
-    "ы": "i",
-    "э": "e",
-    "ю": "yu",
-    "я": "ya",
-}
-
-
-def slugify(s):
-    return django_slugify("".join(alphabet.get(w, w) for w in s.lower()))
-
-
-def get_menu(user):
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from tasksystem import counters
+from tasksystem.metrics import timed
+from tasksystem.dashboard import refresh_snapshot
+from tasksystem.models import DashboardSnapshot, Task
+
+# Количество задач на одной "странице" доски "Все задачи"
+TASKS_PAGE_SIZE = 30
+
+
+def encode_cursor(task):
+    # Курсор - позиция последней показанной задачи в порядке (status, -time_update, -id)
+    raw = f"{task.status}|{task.time_update.isoformat()}|{task.pk}"
+    return urlsafe_base64_encode(force_bytes(raw))
+
+
+def decode_cursor(cursor):
+    # Возвращает (status, time_update, id) или None, если курсор поврежден
+    try:
+        status, time_update, pk = force_str(urlsafe_base64_decode(cursor)).split("|")
+        time_update = parse_datetime(time_update)
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return None
+    # Курсор без часового пояса или с неизвестным статусом выпущен не encode_cursor
+    if time_update is None or timezone.is_naive(time_update) or status not in Task.Status.values:
+        return None
+    return status, time_update, pk
+
+
+def after_cursor(tasks, cursor):
+    # Задачи, идущие после позиции курсора в порядке ("status", "-time_update", "-id")
+    position = decode_cursor(cursor) if cursor else None
+    if position is None:
+        return tasks
+    status, time_update, pk = position
+    return tasks.filter(
+        Q(status__gt=status)
+        | Q(status=status, time_update__lt=time_update)
+        | Q(status=status, time_update=time_update, id__lt=pk)
+    )
+
+
+def page_with_cursor(rows, limit):
+    # Берем на одну запись больше, чтобы узнать, есть ли следующая страница
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def paginate_by_cursor(tasks, cursor=None, limit=TASKS_PAGE_SIZE):
+    # Keyset-пагинация: вместо OFFSET продолжаем с позиции курсора,
+    # поэтому любая страница стоит столько же, сколько первая.
+    # Queryset должен быть упорядочен по ("status", "-time_update", "-id").
+    tasks = after_cursor(tasks, cursor)
+    return page_with_cursor(list(tasks[: limit + 1]), limit)
+
+
+async def apaginate_by_cursor(tasks, cursor=None, limit=TASKS_PAGE_SIZE):
+    tasks = after_cursor(tasks, cursor)
+    return page_with_cursor([task async for task in tasks[: limit + 1]], limit)
+
+
+def menu_counter_names(user):
+    # Счетчики, которые показывает меню пользователя
+    names = [counters.OPEN_TASKS]
+    if user.is_authenticated:
+        names += [counters.working_key(user.pk), completed_counter_name(user)]
+        if user.role == user.Role.ADMIN:
+            names.append(counters.TOTAL_USERS)
+    return names
+
+
+def completed_counter_name(user):
+    return counters.COMPLETED_TASKS if user.is_superuser else counters.completed_key(user.pk)
+
+
+@timed("get_menu")
+def get_menu(user, values=None):
     # Функция get_menu возвращает список словарей с названием и url-адресом для каждого пункта меню
-    if not user.is_anonymous:
-        task_statistics = Task.objects.aggregate(
-            all_tasks=Count("id", filter=~Q(status=Task.Status.COMPLETED)),
-            required_tasks=Count(
-                "id", filter=Q(status=Task.Status.WORKING, worker=user)
-            ),
-            completed_tasks=Count(
-                "id",
-                filter=Q(status=Task.Status.COMPLETED)
-                & (
-                    Q(author=user) | Q(status=Task.Status.COMPLETED) & Q(author=user)
-                    if not user.is_superuser
-                    else Q()
-                ),
-            ),
-        )
-    else:
-        task_statistics = Task.objects.aggregate(
-            all_tasks=Count("id", filter=~Q(status=Task.Status.COMPLETED))
-        )
+    # Количества берутся из денормализованных счетчиков (tasksystem/counters.py) одним запросом;
+    # values - уже прочитанные счетчики (см. aget_menu)
+    if values is None:
+        values = counters.get_counters(*menu_counter_names(user))
+    if user.is_authenticated:
+        completed = completed_counter_name(user)
+
+    task_statistics = {"all_tasks": values[counters.OPEN_TASKS]}
+    if user.is_authenticated:
+        task_statistics["required_tasks"] = values[counters.working_key(user.pk)]
+        task_statistics["completed_tasks"] = values[completed]
 
     menu = [
         {
@@ -92,6 +121,13 @@ def get_menu(user):
                     "icon": "add_task",
                 }
             )
+            menu.append(
+                {
+                    "title": "Импорт задач",
+                    "url_name": "tasksystem:import_tasks",
+                    "icon": "add_task",
+                }
+            )
 
         if user.role == user.Role.WORKER:
             menu.append(
@@ -116,45 +152,48 @@ def get_menu(user):
                     "title": "Пользователи",
                     "url_name": "authentication:user_list",
                     "icon": "user_control",
-                    "count": User.objects.count(),
+                    "count": values[counters.TOTAL_USERS],
                 }
             )
 
     return menu
 
 
-def info_for_dashboard():
-    # Считаем общее количество пользователей в системе
-    total_users = User.objects.count()
-    
-    # Считаем общее количество задач в системе
-    total_tasks = Task.objects.count()
-    
-    # Получаем количество пользователей для каждой роли
-    role_counts = User.objects.values('role').annotate(count=Count('role'))
-    
-    # Преобразуем список словарей в словарь с ключами как роли и значениями как количество пользователей этой роли
-    role_stats = {role['role']: role['count'] for role in role_counts}
-    
-    # Находим исполнителя (WORKER), который выполнил больше всего задач
-    top_worker = User.objects.filter(role=User.Role.WORKER).annotate(
-        completed_tasks=Count('worker_tasks', filter=Q(worker_tasks__status=Task.Status.COMPLETED))
-    ).order_by('-completed_tasks').first()
+@timed("aget_menu")
+async def aget_menu(user):
+    return get_menu(user, await counters.aget_counters(*menu_counter_names(user)))
+
+
+@timed("info_for_dashboard")
+async def ainfo_for_dashboard():
+    # Статистика читается из готового снимка (см. tasksystem/dashboard.py и
+    # команду refresh_dashboard); при первом обращении снимок создается
+    snapshots = DashboardSnapshot.objects.select_related("top_worker")
+    snapshot = await snapshots.afirst()
+    if snapshot is None:
+        # Перечитываем вместе с лучшим исполнителем: в async-коде ленивая загрузка связи недоступна
+        await sync_to_async(refresh_snapshot)()
+        snapshot = await snapshots.afirst()
+    return dashboard_stats(snapshot)
+
+
+def dashboard_stats(snapshot):
+    top_worker = snapshot.top_worker
 
     # Собираем все данные в один список словарей
     stats = [
-        {"value": total_users, "label": "Всего пользователей", "icon": "users.png"},
-        {"value": total_tasks, "label": "Всего задач", "icon": "tasks.png"},
-        {"value": role_stats.get(User.Role.ADMIN, 0), "label": "Администраторы", "icon": "admins.png"},
-        {"value": role_stats.get(User.Role.MANAGER, 0), "label": "Менеджеры", "icon": "managers.png"},
-        {"value": role_stats.get(User.Role.WORKER, 0), "label": "Исполнители", "icon": "workers.png"},
-        {"value": role_stats.get(User.Role.READER, 0), "label": "Читатели", "icon": "readers.png"},
+        {"value": snapshot.total_users, "label": "Всего пользователей", "icon": "users.png"},
+        {"value": snapshot.total_tasks, "label": "Всего задач", "icon": "tasks.png"},
+        {"value": snapshot.admins, "label": "Администраторы", "icon": "admins.png"},
+        {"value": snapshot.managers, "label": "Менеджеры", "icon": "managers.png"},
+        {"value": snapshot.workers, "label": "Исполнители", "icon": "workers.png"},
+        {"value": snapshot.readers, "label": "Читатели", "icon": "readers.png"},
         {
             "value": top_worker.get_full_name() if top_worker else "Нет данных",
             "label": "Лучший исполнитель",
             "icon": "top_worker.png",
-            "extra": f"{top_worker.completed_tasks} выполненных задач" if top_worker else None
+            "extra": f"{snapshot.top_worker_completed} выполненных задач" if top_worker else None
         },
     ]
 
-    return stats
+    return stats, snapshot.refreshed_at
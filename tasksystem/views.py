@@ -1,50 +1,183 @@
+import asyncio
+import io
+
+from asgiref.sync import sync_to_async
+
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
-from django.http import Http404, HttpResponse, HttpResponseForbidden
-from django.shortcuts import get_object_or_404, redirect, render
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
 from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_POST
 from django.views.generic import CreateView, DeleteView, ListView, UpdateView
 from django.db.models import Case, When, IntegerField, Value
 from django.db.models.functions import Concat
 
 
-from authentication.decorators import role_required
-from tasksystem.forms import TaskForm
+from authentication.decorators import alogin_required, role_required
+from tasksystem.assignment import loads
+from tasksystem.conditional import conditional_page
+from tasksystem.forms import TaskCreateForm, TaskForm, TaskImportForm
+from tasksystem.fragments import attach_cards
+from tasksystem.importer import TaskImporter, read_rows
+from tasksystem.live import event_stream
 from tasksystem.models import Task
-from tasksystem.utils import get_menu, info_for_dashboard
+from tasksystem.routers import replica_view
+from tasksystem.search import MIN_TERM, search_tasks, suggest_titles, terms
+from tasksystem.utils import (
+    aget_menu, ainfo_for_dashboard, apaginate_by_cursor, decode_cursor, get_menu, paginate_by_cursor,
+)
 
 
-# Функция для отображения всех задач
-@login_required
+def board_tasks():
+    # Незавершенные задачи в порядке доски: сначала ожидающие, затем в работе.
+    # "PD" < "WK", поэтому сортировка по status совпадает с нужным порядком
+    # и, в отличие от Case/When, использует индекс task_board_idx.
+    # IN вместо exclude(): SQLite ищет по индексу, а не сканирует его целиком.
+    return Task.objects.filter(status__in=[Task.Status.PENDING, Task.Status.WORKING]).select_related(
+        "author", "worker",
+    ).order_by(
+        "status", "-time_update", "-id",
+    )
+
+
+def worker_tasks(user):
+    # Задачи исполнителя в работе, сначала недавно измененные: порядок индекса
+    # task_worker_idx, без сортировки. Сортировка по имени автора шла бы по
+    # соседней таблице и требовала бы перебрать и отсортировать все строки
+    return Task.objects.filter(worker=user, status=Task.Status.WORKING).select_related(
+        "author", "worker",
+    ).order_by(
+        "-time_update",
+    )
+
+
+def finished_tasks(user):
+    # Выполненные задачи, сначала недавно измененные: администратору все (индекс
+    # task_board_idx), менеджеру только свои (индекс task_author_idx). Порядок -
+    # порядок индекса и ключ keyset-пагинации, как у доски, поэтому без сортировки.
+    # Автора и исполнителя подтягиваем JOIN-ом, чтобы шаблон не делал запрос на каждую карточку
+    tasks = Task.objects.filter(status=Task.Status.COMPLETED).select_related("author", "worker")
+    if user.role != "admin":
+        tasks = tasks.filter(author=user)
+    return tasks.order_by("status", "-time_update", "-id")
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+# Функция для отображения всех задач.
+# Самые посещаемые страницы асинхронные: под ASGI они не занимают поток на время
+# запросов к базе, а независимые выборки (меню и сама страница) запускаются
+# одновременно. Все данные читаются до render(): шаблон не должен ходить в базу
+@alogin_required
 @role_required(allowed_roles=["admin", "manager", "worker", "reader"])
-def content(request):
-    tasks = Task.objects.exclude(status=Task.Status.COMPLETED).annotate(
-    status_order=Case(
-        When(status=Task.Status.PENDING, then=0),
-        When(status=Task.Status.WORKING, then=1),
-        default=2,
-        output_field=IntegerField(),
+@replica_view
+@conditional_page
+async def content(request):
+    menu, (tasks, next_cursor) = await asyncio.gather(
+        aget_menu(request.user),
+        apaginate_by_cursor(board_tasks(), request.GET.get("cursor")),
     )
-).order_by('status_order', '-time_update',)
     data = {
         "title": "TMS | Все задачи",
         "page_name": "Все задачи",
-        "menu": get_menu(request.user),
-        "tasks": tasks,
+        "menu": menu,
+        "tasks": attach_cards(tasks, "board"),
+        "next_cursor": next_cursor,
     }
     return render(request, "tasksystem/content.html", context=data)
 
 
+# Следующая порция карточек для кнопки "Показать ещё" (без меню и base.html)
+@login_required
+@role_required(allowed_roles=["admin", "manager", "worker", "reader"])
+@replica_view
+def content_more(request):
+    # Без курсора или с поврежденным курсором вернулась бы первая страница, и
+    # кнопка добавила бы на доску уже показанные карточки
+    cursor = request.GET.get("cursor")
+    if not cursor or decode_cursor(cursor) is None:
+        return HttpResponseBadRequest("Поврежденный курсор")
+    tasks, next_cursor = paginate_by_cursor(board_tasks(), cursor)
+    response = render(request, "tasksystem/content_tasks.html", context={"tasks": attach_cards(tasks, "board")})
+    response["X-Next-Cursor"] = next_cursor or ""
+    return response
+
+
+# Поток событий доски (Server-Sent Events). Работает только под ASGI: под WSGI
+# каждое соединение заняло бы поток навсегда, поэтому там ответ 204 - по нему
+# EventSource прекращает переподключения, и доска остается обычной страницей.
+# В core/asgi.py этот путь перехватывает live.events_endpoint, чтобы соединение
+# не держало поток обработчика Django; представление остается для WSGI и
+# других ASGI-точек входа
+@alogin_required
+@role_required(allowed_roles=["admin", "manager", "worker", "reader"])
+async def board_events(request):
+    if not hasattr(request, "scope"):
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+# Одна карточка доски: по событию доска перерисовывает только ее
+@alogin_required
+@role_required(allowed_roles=["admin", "manager", "worker", "reader"])
+async def task_card(request, pk):
+    task = await aget_object_or_404(board_tasks(), pk=pk)
+    return render(request, "tasksystem/content_tasks.html", context={"tasks": attach_cards([task], "board")})
+
+
+# Полнотекстовый поиск по заголовкам и описаниям, результаты по релевантности
+@login_required
+@role_required(allowed_roles=["admin", "manager", "worker", "reader"])
+@replica_view
+def search(request):
+    query = request.GET.get("q", "").strip()
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+    tasks, has_next = search_tasks(query, Task.objects.visible_to(request.user).select_related("author", "worker"), page)
+    data = {
+        "title": "TMS | Поиск",
+        "page_name": f"Поиск: {query}" if query else "Поиск",
+        "menu": get_menu(request.user),
+        "query": query,
+        # Запрос только из слов короче MIN_TERM не ищется
+        "too_short": bool(query) and not terms(query),
+        "min_term": MIN_TERM,
+        "tasks": attach_cards(tasks, "board"),
+        "page": page,
+        "next_page": page + 1 if has_next else None,
+    }
+    return render(request, "tasksystem/search.html", context=data)
+
+
+# Автодополнение заголовков для поля поиска
+@login_required
+@role_required(allowed_roles=["admin", "manager", "worker", "reader"])
+@replica_view
+def search_suggest(request):
+    suggestions = suggest_titles(request.GET.get("q", ""), Task.objects.visible_to(request.user))
+    return JsonResponse(
+        {"results": [{"title": s["title"], "url": reverse("tasksystem:task_detail", args=[s["slug"]])} for s in suggestions]}
+    )
+
+
 @login_required
 @role_required(allowed_roles=["admin", "manager"])
 def delete_task(request, pk):
     task = get_object_or_404(Task, pk=pk)
 
     if request.user.role == "admin" or (
-        request.user.role == "manager" and task.author == request.user
+        request.user.role == "manager" and task.author_id == request.user.pk
     ):
         task.delete()
         messages.success(request, "Задача успешно удалена.")
@@ -55,83 +188,89 @@ def delete_task(request, pk):
     return redirect(previous_url)
 
 
+@login_required
 def claim_task(request, pk):
-    task = get_object_or_404(Task, pk=pk)
-    if task.worker is None and request.user.role == request.user.Role.WORKER and task.status == Task.Status.PENDING:
-        task.worker = request.user
-        task.status = Task.Status.WORKING
-        task.save()
+    if request.user.role == request.user.Role.WORKER and Task.objects.claim(pk, request.user):
         messages.success(request, "Задача успешно взята.")
     else:
+        if not Task.objects.filter(pk=pk).exists():
+            raise Http404()
         messages.error(request, "Задача уже взята.")
 
     previous_url = request.META.get('HTTP_REFERER', 'tasksystem:content')
     return redirect(previous_url)
 
 
-# Функция для отображения деталей задачи
+# Выдача исполнителю следующей свободной задачи вместо выбора строки на доске
 @login_required
-def task_detail(request, tasks_slug):
-    task = get_object_or_404(Task, slug=tasks_slug)
+@role_required(allowed_roles=["worker"])
+@require_POST
+def next_task(request):
+    task = Task.objects.dispatch(request.user)
+    if task is None:
+        messages.error(request, "Свободных задач нет.")
+        return redirect("tasksystem:required_tasks")
+    messages.success(request, f"Вам выдана задача '{task.title}'.")
+    return redirect(task)
+
+
+# Функция для отображения деталей задачи
+@alogin_required
+@replica_view
+@conditional_page
+async def task_detail(request, tasks_slug):
+    menu, task = await asyncio.gather(
+        aget_menu(request.user),
+        aget_object_or_404(Task.objects.select_related("author", "worker"), slug=tasks_slug),
+    )
     data = {
         "title": "TMS | Подробнее о задаче",
         "page_name": "Подробнее о задаче",
-        "menu": get_menu(request.user),
+        "menu": menu,
         "task": task,
     }
     return render(request, "tasksystem/task_detail.html", context=data)
 
 
 # Функция для отображения обязательных задач
-@login_required
+@alogin_required
 @role_required(allowed_roles=["admin", "manager", "worker"])
-def required_tasks(request):
+@conditional_page
+async def required_tasks(request):
     if request.method == "POST":
         task_id = request.POST.get("task_id")
-        task = get_object_or_404(Task, id=task_id, worker=request.user)
-        if task.status == Task.Status.WORKING:
-            task.status = Task.Status.COMPLETED
-            task.save()
+        task = await aget_object_or_404(Task.objects.only("title", "author"), id=task_id, worker=request.user)
+        if await sync_to_async(Task.objects.complete)(task.pk, request.user, task.author_id):
             messages.success(
                 request, f"Задача '{task.title}' отмечена как завершенная."
             )
             return redirect("tasksystem:required_tasks")
 
-    tasks = Task.objects.filter(worker=request.user, status=Task.Status.WORKING).order_by(
-        'author__first_name', 'author__last_name', '-time_update',
-    )
+    menu, tasks = await asyncio.gather(aget_menu(request.user), alist(worker_tasks(request.user)))
     data = {
         "title": "TMS | Обязательные задачи",
         "page_name": "Обязательные задачи",
-        "menu": get_menu(request.user),
-        "tasks": tasks,
+        "menu": menu,
+        "tasks": attach_cards(tasks, "required"),
     }
     return render(request, "tasksystem/required_tasks.html", context=data)
 
 
 @login_required
 @role_required(allowed_roles=["admin", "manager"])
+@conditional_page
 def completed_tasks(request):
-    # Фильтруем задачи, которые выполнены и созданы текущим пользователем
-    if request.user.role == "admin":
-        tasks = Task.objects.filter(
-            status=Task.Status.COMPLETED
-        ).order_by(
-            'author__first_name', 'author__last_name', 'worker__first_name', 'worker__last_name',  '-time_update',
-        )
-    else:
-        tasks = Task.objects.filter(
-            author=request.user,
-            status=Task.Status.COMPLETED
-        ).order_by(
-            'author__first_name', 'author__last_name', 'worker__first_name', 'worker__last_name',  '-time_update',
-        )
-         
+    # Фильтруем задачи, которые выполнены и созданы текущим пользователем.
+    # Список растет без ограничений, поэтому он разбит на страницы, как доска
+    cursor = request.GET.get("cursor")
+    tasks, next_cursor = paginate_by_cursor(finished_tasks(request.user), cursor)
     data = {
         "title": "TMS | Готовые задачи",
         "page_name": "Готовые задачи",
         "menu": get_menu(request.user),
-        "tasks": tasks,
+        "tasks": attach_cards(tasks, "completed"),
+        "next_cursor": next_cursor,
+        "paged": bool(cursor),
     }
     return render(request, "tasksystem/completed_tasks.html", context=data)
 
@@ -141,15 +280,19 @@ def completed_tasks(request):
 @role_required(allowed_roles=["admin", "manager"])
 def create_task(request):
     if request.method == "POST":
-        form = TaskForm(request.POST)
+        form = TaskCreateForm(request.POST)
         if form.is_valid():
             task = form.save(commit=False)
             task.author = request.user  # Установка автора задачи
+            if form.cleaned_data["auto_assign"]:
+                task.worker_id = loads.take()
+                if task.worker_id is None:
+                    messages.warning(request, "Нет активных исполнителей, задача создана без исполнителя.")
             task.save()
             messages.success(request, "Задача успешно создана.")
             return redirect("tasksystem:content")
     else:
-        form = TaskForm()
+        form = TaskCreateForm()
     return render(
         request,
         "tasksystem/create_task.html",
@@ -159,6 +302,33 @@ def create_task(request):
         )
 
 
+# Массовый импорт задач из CSV/NDJSON. Менеджер импортирует задачи только от своего имени
+@login_required
+@role_required(allowed_roles=["admin", "manager"])
+def import_tasks(request):
+    importer = None
+    if request.method == "POST":
+        form = TaskImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            stream = io.TextIOWrapper(form.cleaned_data["file"].file, encoding="utf-8-sig", newline="")
+            importer = TaskImporter(
+                default_author=request.user,
+                force_author=request.user.role != "admin",
+                auto_assign=form.cleaned_data["auto_assign"],
+            ).run(read_rows(stream, form.cleaned_data["format"]))
+            messages.success(request, f"Импортировано задач: {importer.created}.")
+    else:
+        form = TaskImportForm()
+    return render(
+        request,
+        "tasksystem/import_tasks.html",
+        {"title": "TMS | Импорт задач",
+         "form": form,
+         "importer": importer,
+         "menu": get_menu(request.user)}
+        )
+
+
 # Представление для редактирования задачи, доступное только администраторам и менеджерам
 @method_decorator(
     [login_required, role_required(allowed_roles=["admin", "manager", "executor"])],
@@ -192,15 +362,17 @@ class TaskUpdateView(UpdateView):
         return super().dispatch(request, *args, **kwargs)
 
 
-@login_required
+@alogin_required
 @role_required(allowed_roles=["admin"])
-def dashboard(request):
-    stats = info_for_dashboard()
+@replica_view
+async def dashboard(request):
+    menu, (stats, as_of) = await asyncio.gather(aget_menu(request.user), ainfo_for_dashboard())
     data = {
         "title": "TMS | Дэшборд",
         "page_name": "Дэшборд",
-        "menu": get_menu(request.user),
+        "menu": menu,
         "stats": stats,
+        "as_of": as_of,
     }
     return render(request, "tasksystem/dashboard.html", context=data)
 